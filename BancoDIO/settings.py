@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.routers.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +56,27 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'BancoDIO.urls'
 
+# Logs of the core app are written as JSON lines by a background thread (see core/log.py)
+TESTING = sys.argv[1:2] == ['test']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'queue': {
+            'class': 'core.log.QueueLogHandler',
+        },
+    },
+    'loggers': {
+        'core': {
+            'handlers': ['queue'],
+            # Under manage.py test, the JSON INFO line of every request would flood the test output.
+            'level': 'WARNING' if TESTING else 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -77,9 +102,62 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Postings read before they write; IMMEDIATE takes the write lock at BEGIN so concurrent postings
+        # wait on the busy timeout instead of failing with "database is locked" when upgrading the lock.
+        # The timeout also covers postings waiting behind the chunks of the batch jobs and the archiver.
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # The posting stress tests run several threads against the database; the default
+        # shared-cache in-memory test database fails them with "database table is locked".
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Opt-in mode for single-node deployments on SQLite (BANCODIO_SQLITE_HIGH_CONCURRENCY=1): WAL lets readers
+# run while a transaction writes, synchronous=NORMAL syncs at checkpoints instead of every commit, the busy
+# timeout is raised, connections are kept open and all balance-changing writes go through one writer
+# thread that group-commits them (POSTING_WRITER with one lane, see core/writer.py).
+SQLITE_HIGH_CONCURRENCY = os.environ.get('BANCODIO_SQLITE_HIGH_CONCURRENCY') == '1'
+
+if SQLITE_HIGH_CONCURRENCY:
+    DATABASES['default']['OPTIONS'].update({
+        'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        'timeout': 30,
+    })
+    DATABASES['default']['CONN_MAX_AGE'] = None
+
+# Read replicas (BANCODIO_REPLICAS, comma-separated SQLite files kept in sync with the primary): statement,
+# account and client reads go to a random replica, except for clients that wrote in the last
+# READ_YOUR_WRITES_WINDOW seconds, which read from the primary (see core/routers.py). Tests mirror them to
+# the test database.
+DATABASE_REPLICAS = []
+for index, name in enumerate(filter(None, os.environ.get('BANCODIO_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica_{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['core.routers.ReadReplicaRouter']
+
+READ_YOUR_WRITES_WINDOW = 5
+
+# Posting scheduler: each account's postings run, in order, on the writer lane of its primary key, and
+# each lane group-commits up to BATCH_SIZE postings per transaction. On a database server, more lanes
+# (BANCODIO_POSTING_LANES) post accounts in parallel; SQLite takes one writer at a time, so it uses one.
+POSTING_WRITER = {
+    'ENABLED': SQLITE_HIGH_CONCURRENCY or 'BANCODIO_POSTING_LANES' in os.environ,
+    'LANES': int(os.environ.get('BANCODIO_POSTING_LANES', 1)),
+    'BATCH_SIZE': 64,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,3 +199,73 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Core
+
+# A balance snapshot is closed after this many operations (and at the end of each day)
+BALANCE_SNAPSHOT_INTERVAL = 100
+
+# Default limits by operation type ('D' deposit, 'W' withdrawal, 'T' transfer), used when neither the
+# account nor its agency has an OperationLimit. Any of max_amount, max_daily_count and max_daily_amount.
+OPERATION_LIMITS = {
+    'W': {'max_amount': 500, 'max_daily_count': 3},
+}
+
+# Account and client lookup cache: 'local' keeps a bounded LRU in each process; any other value is the
+# alias of a Django cache in CACHES, shared between processes. Entries expire after TTL seconds.
+ACCOUNT_CACHE = {
+    'BACKEND': 'local',
+    'MAX_SIZE': 10000,
+    'TTL': 60,
+}
+
+# Rendered statement lines of closed days (see core/statements.py), same backends as ACCOUNT_CACHE. Past days
+# do not change, so entries live long; corrections and backdated operations invalidate the account.
+STATEMENT_CACHE = {
+    'BACKEND': 'local',
+    'MAX_SIZE': 50000,
+    'TTL': 86400,
+}
+
+# Responses of operation POSTs by Idempotency-Key. Keys are persisted in IdempotencyKey; this only keeps retries
+# from reaching the database.
+IDEMPOTENCY_CACHE = {
+    'BACKEND': 'local',
+    'MAX_SIZE': 10000,
+    'TTL': 3600,
+}
+
+# Hours an IdempotencyKey is kept; `manage.py prune_idempotency_keys` deletes older keys. A retry that comes
+# after that runs as a new request
+IDEMPOTENCY_KEY_RETENTION_HOURS = 24
+
+# Operations older than AFTER_DAYS are moved to the archive table by `manage.py archive_operations`, CHUNK_SIZE
+# at a time, each chunk in its own short transaction (see core/archive.py)
+OPERATION_ARCHIVE = {
+    'AFTER_DAYS': 180,
+    'CHUNK_SIZE': 500,
+}
+
+# Month-end batch jobs (`manage.py run_batch_job`, see core/jobs.py): the fee charged to every active account
+# that can pay it, the monthly interest rate paid on positive balances and the accounts posted per transaction
+BATCH_JOBS = {
+    'MONTHLY_FEE': '12.90',
+    'MONTHLY_INTEREST_RATE': '0.005',
+    'CHUNK_SIZE': 1000,
+}
+
+# Delivery of the posting events of the outbox (`manage.py relay_outbox`, see core/outbox.py): the sink class
+# and its options, events per batch, seconds between polls when idle, the longest backoff after a failed
+# delivery and how long delivered events are kept
+OUTBOX = {
+    'SINK': 'core.outbox.FileSink',
+    'OPTIONS': {'path': BASE_DIR / 'outbox.ndjson'},
+    'BATCH_SIZE': 500,
+    'POLL_INTERVAL': 1.0,
+    'MAX_BACKOFF': 30.0,
+    'RETENTION_HOURS': 24,
+}
+
+# Threads that run the synchronous, transactional part of the async views (see core/async_views.py)
+ASYNC_POSTING_THREADS = 8
@@ -1,10 +1,22 @@
 from django.contrib import admin
 
-from core.models import Operation, Deposit, Withdrawal, Transfer, Account, Client
+from core.models import Operation, Deposit, Withdrawal, Transfer, Account, Client, BalanceSnapshot, \
+    OperationLimit, DailyUsage, IdempotencyKey, DailyAccountTotals, DailyAgencyTotals, ArchivedOperation, \
+    BatchJobCheckpoint, ReconcileRun, OutboxEvent
 
 admin.site.register(Client)
 admin.site.register(Account)
 admin.site.register(Operation)
 admin.site.register(Deposit)
 admin.site.register(Withdrawal)
-admin.site.register(Transfer)
\ No newline at end of file
+admin.site.register(Transfer)
+admin.site.register(BalanceSnapshot)
+admin.site.register(OperationLimit)
+admin.site.register(DailyUsage)
+admin.site.register(IdempotencyKey)
+admin.site.register(DailyAccountTotals)
+admin.site.register(DailyAgencyTotals)
+admin.site.register(ArchivedOperation)
+admin.site.register(BatchJobCheckpoint)
+admin.site.register(ReconcileRun)
+admin.site.register(OutboxEvent)
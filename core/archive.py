@@ -0,0 +1,100 @@
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Operation, ArchivedOperation
+
+# Tables an operation can be in, live table first. Readers query them in this order, so an operation
+# archived between two of their queries is seen twice at worst, never missed.
+OPERATION_MODELS = (Operation, ArchivedOperation)
+
+ARCHIVE_COLUMNS = ['id', 'type', 'way', 'amount', 'timestamp', 'from_account_id', 'to_account_id']
+
+
+def archive_settings() -> dict:
+    return {'AFTER_DAYS': 180, 'CHUNK_SIZE': 500, **getattr(settings, 'OPERATION_ARCHIVE', {})}
+
+
+def archive_cutoff(after_days: int | None = None) -> datetime:
+    """
+    The instant before which operations are archived: the start of the day after_days days ago.
+    """
+    if after_days is None:
+        after_days = archive_settings()['AFTER_DAYS']
+    day = timezone.localdate() - timedelta(days=after_days)
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def period_of(timestamp: datetime) -> date:
+    return timezone.localdate(timestamp).replace(day=1)
+
+
+def archive_chunk(before: datetime, chunk_size: int) -> int:
+    """
+    Move up to chunk_size of the oldest operations posted before the instant to the archive, in one short
+    transaction: one INSERT ... SELECT per period and one DELETE, without loading the rows.
+
+    Returns:
+        int: The number of operations moved; 0 once nothing is left to archive.
+    """
+    live = connection.ops.quote_name(Operation._meta.db_table)
+    archive = connection.ops.quote_name(ArchivedOperation._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(column) for column in ARCHIVE_COLUMNS)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Primary key order follows posting order and needs no index besides the table itself.
+        chunk = list(Operation.objects.filter(timestamp__lt=before).order_by('pk')
+                     .values_list('pk', 'timestamp')[:chunk_size])
+        by_period = defaultdict(list)
+        for pk, timestamp in chunk:
+            by_period[period_of(timestamp)].append(pk)
+
+        for period, pks in by_period.items():
+            cursor.execute(
+                f"INSERT INTO {archive} ({columns}, period) SELECT {columns}, %s FROM {live} "
+                f"WHERE id IN ({', '.join(['%s'] * len(pks))})",
+                [connection.ops.adapt_datefield_value(period), *pks],
+            )
+        if chunk:
+            # A raw DELETE: archiving does not change any statement, so the correction signals must not run.
+            cursor.execute(f"DELETE FROM {live} WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+                           [pk for pk, _ in chunk])
+
+    return len(chunk)
+
+
+def archive_operations(before: datetime | None = None, chunk_size: int | None = None, pause: float = 0.0,
+                       max_chunks: int | None = None, progress=None) -> int:
+    """
+    Archive the operations posted before the instant (archive_cutoff() by default), chunk by chunk. Every
+    chunk commits on its own and holds the write lock only briefly, so postings interleave with the
+    archiver, and an interrupted run is resumed by running it again.
+
+    Parameters:
+        before (datetime | None): Archive operations posted before this instant.
+        chunk_size (int | None): Operations per transaction; OPERATION_ARCHIVE['CHUNK_SIZE'] by default.
+        pause (float): Seconds to sleep between chunks, leaving the database to the postings.
+        max_chunks (int | None): Stop after this many chunks.
+        progress (callable | None): Called with the running total after each chunk.
+
+    Returns:
+        int: The number of operations archived.
+    """
+    before = before or archive_cutoff()
+    chunk_size = chunk_size or archive_settings()['CHUNK_SIZE']
+    total = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        moved = archive_chunk(before, chunk_size)
+        if not moved:
+            break
+        total += moved
+        chunks += 1
+        if progress is not None:
+            progress(total)
+        if pause:
+            time.sleep(pause)
+    return total
@@ -0,0 +1,160 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from core.cache import aget_account_info
+from core.conditional import account_conditional
+from core.functions import validate_operation
+from core.limits import LimitExceeded
+from core.models import Account, Operation, OperationsType
+from core.posting import InsufficientFunds, to_amount
+from core.routers import replica_reads
+from core.statements import statement_query, statement_page
+from core import views
+from core.views import PAGE_SIZE, MAX_PAGE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Transactional work stays synchronous and runs here, so the number of threads (and database connections)
+# is bounded no matter how many requests the event loop holds.
+posting_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_POSTING_THREADS', 8),
+    thread_name_prefix='posting',
+)
+
+
+def run_in_pool(func):
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        return func(*args, **kwargs)
+    return sync_to_async(wrapper, thread_sensitive=False, executor=posting_executor)
+
+
+@run_in_pool
+def save_operation(operation: Operation) -> None:
+    operation.save()
+
+
+def idempotent_as(sync_view):
+    """
+    Serve POST requests with an Idempotency-Key with the synchronous view, already idempotent, in the posting
+    pool. The key must commit in the same transaction as the posting, and this view reads on the event loop
+    and posts in the pool; the synchronous view does both in one thread. Requests without the header stay async.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method == 'POST' and request.headers.get('Idempotency-Key'):
+                return await run_in_pool(sync_view)(request, *args, **kwargs)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def post_operation(request, operation_type: str, from_key: str | None, to_key: str | None):
+    if request.method != 'POST':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    data = json.loads(request.body.decode('utf-8'))
+    amount = data.get('amount')
+    from_account = await Account.objects.filter(account_number=data.get(from_key)).afirst() if from_key else None
+    to_account = await Account.objects.filter(account_number=data.get(to_key)).afirst() if to_key else None
+
+    logger.info(f'Received {OperationsType(operation_type).label.lower()} request',
+                extra={'amount': amount, **{key: data.get(key) for key in (from_key, to_key) if key}})
+
+    error = validate_operation(operation_type, amount, from_account, to_account)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    amount = to_amount(amount)
+
+    if from_account is not None and amount > from_account.balance:
+        return JsonResponse({'error': 'Insufficient funds'}, status=400)
+
+    operation = Operation(type=operation_type, amount=amount, from_account=from_account, to_account=to_account)
+    try:
+        await save_operation(operation)
+    except InsufficientFunds:
+        return JsonResponse({'error': 'Insufficient funds'}, status=400)
+    except LimitExceeded as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    if operation_type == OperationsType.DEPOSIT:
+        return JsonResponse({'success': 'Deposit successful', 'balance': to_account.balance}, status=201)
+    if operation_type == OperationsType.WITHDRAWAL:
+        return JsonResponse({'success': 'Withdrawal successful', 'balance': from_account.balance}, status=201)
+    return JsonResponse({'success': 'Transfer successful', 'from_account_balance': from_account.balance}, status=201)
+
+
+'''
+    OPERATIONS
+'''
+@csrf_exempt
+@idempotent_as(views.make_deposit)
+async def make_deposit(request):
+    return await post_operation(request, OperationsType.DEPOSIT, None, 'to_account')
+
+@csrf_exempt
+@idempotent_as(views.make_withdrawal)
+async def make_withdrawal(request):
+    return await post_operation(request, OperationsType.WITHDRAWAL, 'from_account', None)
+
+@csrf_exempt
+@idempotent_as(views.make_transfer)
+async def make_transfer(request):
+    return await post_operation(request, OperationsType.TRANSFER, 'from_account', 'to_account')
+
+@replica_reads
+@account_conditional
+async def get_statement(request, account_number):
+    account = await Account.objects.filter(account_number=account_number).afirst()
+
+    if account is None:
+        return JsonResponse({'error': 'Account not found'}, status=404)
+
+    if not account.is_active:
+        return JsonResponse({'error': 'Account is inactive'}, status=400)
+
+    try:
+        operations, limit = statement_query(account, request.GET, PAGE_SIZE, MAX_PAGE_SIZE)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': 'Statement retrieved successfully',
+        **await run_in_pool(statement_page)(account, operations, limit),
+    }, status=200)
+
+
+'''
+    ACCOUNTS
+'''
+@replica_reads
+@account_conditional
+async def get_account_details(request, account_number):
+    account = await aget_account_info(account_number)
+
+    if account is None:
+        return JsonResponse({'error': 'Account not found'}, status=404)
+
+    balance = await Account.objects.filter(pk=account['pk']).values_list('balance', flat=True).afirst()
+
+    if balance is None:
+        return JsonResponse({'error': 'Account not found'}, status=404)
+
+    data = {
+        'agency_number': account['agency_number'],
+        'account_number': account['account_number'],
+        'balance': float(balance),
+        'client_cpf': account['client_cpf'],
+        'client_name': account['client_name'],
+    }
+
+    return JsonResponse({'success': 'Account details retrieved successfully', 'data': data})
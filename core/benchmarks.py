@@ -0,0 +1,257 @@
+import json
+import time
+from datetime import date, timedelta
+from typing import Callable, NamedTuple
+from unittest import mock
+
+from django.db import connection
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import lookup_cache
+from core.idempotency import result_cache
+from core.models import Account, Client, Operation, OperationLimit, OperationsType
+from core.posting import post_operations
+from core.statements import statement_cache
+from core.urls import urlpatterns
+
+BENCHMARK_AGENCY = '9999'
+SEED_CHUNK_SIZE = 1000
+
+
+class BenchmarkData(NamedTuple):
+    cpfs: list[str]
+    account_numbers: list[str]
+
+
+class BenchmarkRequest(NamedTuple):
+    method: str
+    kwargs: dict
+    body: str | None = None
+    content_type: str = 'application/json'
+    query: dict | None = None
+
+
+class RouteResult(NamedTuple):
+    route: str
+    status: int
+    p50: float
+    p95: float
+    p99: float
+    queries: int
+    cold_queries: int
+
+
+def make_cpf(number: int) -> str:
+    """
+    A valid CPF whose first nine digits are the number, zero-padded.
+    """
+    digits = [int(digit) for digit in f'{number % 10 ** 9:09d}']
+    for weights in (range(10, 1, -1), range(11, 1, -1)):
+        remainder = sum(digit * weight for digit, weight in zip(digits, weights)) % 11
+        digits.append(0 if remainder < 2 else 11 - remainder)
+    return ''.join(map(str, digits))
+
+
+def seed(clients: int, accounts_per_client: int, operations_per_account: int,
+         data: BenchmarkData | None = None, days: int = 1) -> BenchmarkData:
+    """
+    Add clients, accounts and operations for the benchmarks, in bulk, on top of a previous seed if given.
+    The operations are spread over the given number of days, ending today (see add_operations).
+
+    Benchmark accounts belong to BENCHMARK_AGENCY, which has no operation limits, so the measured postings
+    are never rejected by the daily limits.
+    """
+    data = data or BenchmarkData([], [])
+    first = len(data.cpfs)
+    new_clients = Client.objects.bulk_create([
+        Client(name=f'Benchmark {i}', cpf=make_cpf(100000000 + i), birth_date=date(1990, 1, 1),
+               street_address='Rua A', street_number='1', neighborhood='Centro', city='Rio de Janeiro',
+               state_code='RJ')
+        for i in range(first, first + clients)
+    ])
+    new_clients = Client.objects.filter(cpf__in=[client.cpf for client in new_clients])
+    Account.objects.bulk_create([
+        Account(account_number=f'bench-{client.pk}-{j}', agency_number=BENCHMARK_AGENCY, client=client)
+        for client in new_clients for j in range(accounts_per_client)
+    ])
+    for operation_type in OperationsType.values:
+        OperationLimit.objects.get_or_create(operation_type=operation_type, agency_number=BENCHMARK_AGENCY,
+                                             account=None)
+
+    data = BenchmarkData(
+        data.cpfs + [client.cpf for client in new_clients],
+        list(Account.objects.filter(agency_number=BENCHMARK_AGENCY).order_by('pk')
+             .values_list('account_number', flat=True)),
+    )
+    add_operations(data, operations_per_account, days)
+    return data
+
+
+def add_operations(data: BenchmarkData, operations_per_account: int, days: int = 1) -> None:
+    """
+    Post operations_per_account operations on every benchmark account: deposits, and transfers to the
+    next account. With days > 1 they are spread over that many days ending today, oldest first, so
+    statements and balances have closed days to read like a real history.
+    """
+    accounts = list(Account.objects.filter(account_number__in=data.account_numbers).order_by('pk'))
+    # The k-th operation of every account goes to the (k % days)-th day counted from the oldest, so each
+    # account's first deposit comes before anything it transfers.
+    operations = [[] for _ in range(days)]
+    for index, account in enumerate(accounts):
+        target = accounts[(index + 1) % len(accounts)]
+        for k in range(operations_per_account):
+            if k % 2 == 0 or target == account:
+                operation = Operation(type=OperationsType.DEPOSIT, amount=100, to_account=account)
+            else:
+                operation = Operation(type=OperationsType.TRANSFER, amount=1, from_account=account,
+                                      to_account=target)
+            operations[k % days].append(operation)
+
+    # Postings take their time from timezone.now(), which is moved to each day in turn.
+    now = timezone.now()
+    for age, day_operations in zip(range(days - 1, -1, -1), operations):
+        with mock.patch('django.utils.timezone.now', return_value=now - timedelta(days=age)):
+            for start in range(0, len(day_operations), SEED_CHUNK_SIZE):
+                post_operations(day_operations[start:start + SEED_CHUNK_SIZE])
+
+
+def _operation(path_kwargs=None, **body) -> Callable[[BenchmarkData, int], BenchmarkRequest]:
+    return lambda data, i: BenchmarkRequest('post', path_kwargs or {}, json.dumps({
+        key: value(data, i) if callable(value) else value for key, value in body.items()
+    }))
+
+
+def _first(data, i):
+    return data.account_numbers[0]
+
+
+def _second(data, i):
+    return data.account_numbers[1 % len(data.account_numbers)]
+
+
+def _last(data, i):
+    return data.account_numbers[-1]
+
+
+def _client_row(data, i):
+    return (f'{make_cpf(900000000 + len(data.cpfs) * 1000 + i)},Benchmark,01/01/1990,'
+            f'Rua A,1,Centro,Rio de Janeiro,RJ')
+
+
+# How to call each route of core/urls.py, by URL name, for the i-th measured request. Creations use
+# fresh keys on every call; activation routes use the last account so the others stay active.
+ROUTES = {
+    'deposit': _operation(to_account=_first, amount=10),
+    'withdrawal': _operation(from_account=_first, amount=1),
+    'transfer': _operation(from_account=_first, to_account=_second, amount=1),
+    'operations_batch': lambda data, i: BenchmarkRequest('post', {}, json.dumps({'operations': [
+        {'type': 'deposit', 'to_account': _first(data, i), 'amount': 10},
+        {'type': 'transfer', 'from_account': _first(data, i), 'to_account': _second(data, i), 'amount': 1},
+    ]})),
+    'statement': lambda data, i: BenchmarkRequest('get', {'account_number': _first(data, i)}),
+    'operations_export': lambda data, i: BenchmarkRequest('get', {}, query={'account': _first(data, i)}),
+    'analytics': lambda data, i: BenchmarkRequest('get', {}, query={'agency': BENCHMARK_AGENCY}),
+    'account_create': lambda data, i: BenchmarkRequest('post', {}, json.dumps({
+        'client_cpf': data.cpfs[0], 'account_number': f'bench-new-{len(data.account_numbers)}-{i}',
+    })),
+    'account_import': lambda data, i: BenchmarkRequest(
+        'post', {}, f'client_cpf,account_number\n{data.cpfs[0]},bench-import-{len(data.account_numbers)}-{i}\n',
+        'text/csv',
+    ),
+    'account_get_all': lambda data, i: BenchmarkRequest('get', {}),
+    'account_get_client': lambda data, i: BenchmarkRequest('get', {'client_cpf': data.cpfs[0]}),
+    'account_get_detail': lambda data, i: BenchmarkRequest('get', {'account_number': _first(data, i)}),
+    'account_balance_at': lambda data, i: BenchmarkRequest('get', {'account_number': _first(data, i)}),
+    'inactivate_account': lambda data, i: BenchmarkRequest('get', {'account_number': _last(data, i)}),
+    'activate_account': lambda data, i: BenchmarkRequest('get', {'account_number': _last(data, i)}),
+    'client_create': lambda data, i: BenchmarkRequest('post', {}, json.dumps(dict(zip(
+        ['cpf', 'name', 'birth_date', 'street_address', 'street_number', 'neighborhood', 'city', 'state_code'],
+        _client_row(data, i).split(','),
+    )))),
+    'client_import': lambda data, i: BenchmarkRequest(
+        'post', {}, 'cpf,name,birth_date,street_address,street_number,neighborhood,city,state_code\n'
+                    + _client_row(data, 500 + i) + '\n',
+        'text/csv',
+    ),
+    'client_detail': lambda data, i: BenchmarkRequest('get', {'client_cpf': data.cpfs[0]}),
+    'cache_stats': lambda data, i: BenchmarkRequest('get', {}),
+    'metrics': lambda data, i: BenchmarkRequest('get', {}),
+    'async_deposit': _operation(to_account=_first, amount=10),
+    'async_withdrawal': _operation(from_account=_first, amount=1),
+    'async_transfer': _operation(from_account=_first, to_account=_second, amount=1),
+    'async_statement': lambda data, i: BenchmarkRequest('get', {'account_number': _first(data, i)}),
+    'async_account_get_detail': lambda data, i: BenchmarkRequest('get', {'account_number': _first(data, i)}),
+}
+
+
+def route_names() -> list[str]:
+    return [pattern.name for pattern in urlpatterns]
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(route: str, data: BenchmarkData, repeats: int) -> RouteResult:
+    """
+    Call a route repeats times through the Django test client, starting with cold caches.
+
+    Queries are counted on the request thread: the part of the async views that runs in the posting pool
+    is timed but not counted.
+
+    Returns:
+        RouteResult: The status of the last response, latency percentiles in milliseconds, the median
+        number of queries per request (so amortized work, like closing a balance snapshot, does not count)
+        and the queries of the first request, which fills the caches.
+    """
+    client = TestClient()
+    lookup_cache.clear()
+    result_cache.clear()
+    statement_cache.clear()
+    latencies, queries, status = [], [], None
+
+    for i in range(repeats):
+        request = ROUTES[route](data, i)
+        path = reverse(route, kwargs=request.kwargs)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            if request.method == 'post':
+                response = client.post(path, request.body, content_type=request.content_type)
+            else:
+                response = client.get(path, request.query or {})
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(len(captured))
+        status = response.status_code
+
+    return RouteResult(route, status, percentile(latencies, 0.5), percentile(latencies, 0.95),
+                       percentile(latencies, 0.99), percentile(queries, 0.5), queries[0])
+
+
+def run_benchmarks(data: BenchmarkData, repeats: int, routes: list[str] | None = None) -> list[RouteResult]:
+    """
+    Measure every route of core/urls.py (or the given ones), in URL order.
+
+    Raises:
+        KeyError: If a route has no entry in ROUTES.
+    """
+    return [measure(route, data, repeats) for route in routes or route_names()]
+
+
+def query_growth(before: list[RouteResult], after: list[RouteResult]) -> list[tuple[str, str, int, int]]:
+    """
+    Routes whose median or cold query count grew between two runs, as (route, 'median' or 'cold', queries
+    before, queries after). The cold count catches work that caches hide from the median.
+    """
+    previous = {result.route: result for result in before}
+    return [
+        (result.route, metric, getattr(previous[result.route], field), getattr(result, field))
+        for result in after if result.route in previous
+        for metric, field in (('median', 'queries'), ('cold', 'cold_queries'))
+        if getattr(result, field) > getattr(previous[result.route], field)
+    ]
@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from core.models import Account, Client
+
+ACCOUNT_CACHE = getattr(settings, 'ACCOUNT_CACHE', {})
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe least-recently-used cache whose entries expire after ttl seconds.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'max_size': self.max_size}
+
+
+class DjangoCache:
+    """
+    Same interface as LRUCache on top of a Django cache alias, so the cache can be shared between processes.
+
+    Keys are stored under the cache's prefix, so caches sharing an alias cannot collide, and clear() only
+    drops this cache's entries. It bumps a generation kept in the alias instead of clearing the alias: every
+    entry carries the generation it was stored under, and get() reads the entry and the current generation in
+    one round trip, so entries from before a clear are misses in every process.
+    """
+
+    def __init__(self, alias: str, ttl: float = 60, prefix: str = 'core'):
+        self.backend = caches[alias]
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._generation_key = f'{prefix}:generation'
+        self._generation = None
+
+    def _key(self, key) -> str:
+        return f'{self.prefix}:{key}'
+
+    def get(self, key):
+        found = self.backend.get_many([self._key(key), self._generation_key])
+        self._generation = found.get(self._generation_key, 0)
+        entry = found.get(self._key(key))
+        if entry is None or entry[0] != self._generation:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value) -> None:
+        # The generation seen by the last get, usually the miss that led here. If a clear happened since,
+        # the entry is stored under the old generation and reads as a miss: never a stale hit.
+        if self._generation is None:
+            self._generation = self.backend.get(self._generation_key, 0)
+        self.backend.set(self._key(key), (self._generation, value), self.ttl)
+
+    def delete(self, key) -> None:
+        self.backend.delete(self._key(key))
+
+    def clear(self) -> None:
+        self.backend.add(self._generation_key, 0, timeout=None)
+        self._generation = self.backend.incr(self._generation_key)
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def build_cache(config: dict, prefix: str):
+    if config.get('BACKEND', 'local') == 'local':
+        return LRUCache(config.get('MAX_SIZE', 10000), config.get('TTL', 60))
+    return DjangoCache(config['BACKEND'], config.get('TTL', 60), prefix)
+
+
+# Account and client metadata only. Balances are never cached: they change on every posting and are always
+# read from the database.
+lookup_cache = build_cache(ACCOUNT_CACHE, 'lookup')
+
+
+def account_key(account_number: str) -> str:
+    return f'account:{account_number}'
+
+
+def client_key(cpf: str) -> str:
+    return f'client:{cpf}'
+
+
+def get_account_info(account_number: str) -> dict | None:
+    """
+    Metadata of an account and its client, by account number.
+
+    Returns:
+        dict | None: pk, account_number, agency_number, is_active, client_cpf and client_name, or None if the
+        account does not exist.
+    """
+    info = lookup_cache.get(account_key(account_number))
+    if info is None:
+        info = Account.objects.filter(account_number=account_number).values(
+            'pk', 'account_number', 'agency_number', 'is_active', client_cpf=F('client__cpf'),
+            client_name=F('client__name'),
+        ).first()
+        if info is not None:
+            lookup_cache.set(account_key(account_number), info)
+    return info
+
+
+async def aget_account_info(account_number: str) -> dict | None:
+    """
+    Async version of get_account_info, using the async ORM on a cache miss.
+    """
+    info = lookup_cache.get(account_key(account_number))
+    if info is None:
+        info = await Account.objects.filter(account_number=account_number).values(
+            'pk', 'account_number', 'agency_number', 'is_active', client_cpf=F('client__cpf'),
+            client_name=F('client__name'),
+        ).afirst()
+        if info is not None:
+            lookup_cache.set(account_key(account_number), info)
+    return info
+
+
+def get_client_info(cpf: str) -> dict | None:
+    """
+    Metadata of a client and the list of its accounts, by CPF.
+
+    Returns:
+        dict | None: pk, name, cpf and accounts (as "agency - number"), or None if the client does not exist.
+    """
+    info = lookup_cache.get(client_key(cpf))
+    if info is None:
+        client = Client.objects.filter(cpf=cpf).values('pk', 'name', 'cpf').first()
+        if client is None:
+            return None
+        accounts = Account.objects.filter(client_id=client['pk']).order_by('pk')
+        info = {
+            **client,
+            'accounts': [f"{agency} - {number}" for agency, number in accounts.values_list('agency_number', 'account_number')],
+        }
+        lookup_cache.set(client_key(cpf), info)
+    return info
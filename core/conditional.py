@@ -0,0 +1,72 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from core.models import Account
+
+
+def account_validators(row: tuple | None) -> tuple[str | None, int | None]:
+    """
+    The ETag and Last-Modified timestamp of an account from its (pk, version, modified_at) row.
+    """
+    if row is None:
+        return None, None
+    pk, version, modified_at = row
+    return f'"{pk}.{version}"', int(modified_at.timestamp()) if modified_at is not None else None
+
+
+def version_query(account_number: str):
+    return Account.objects.filter(account_number=account_number).values_list('pk', 'version', 'modified_at')
+
+
+def with_validators(request, response, etag: str | None, last_modified: int | None):
+    # Only successful reads are tagged, so a client never revalidates an error.
+    if etag is not None and request.method in ('GET', 'HEAD') and response.status_code == 200:
+        response.headers.setdefault('ETag', etag)
+        if last_modified is not None:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+    return response
+
+
+def not_modified(request, etag: str | None):
+    """
+    The 304 (or 412) answer to the conditional headers of request for etag, or None to render the view.
+
+    Only If-None-Match and If-Match are evaluated: Last-Modified has a resolution of one second, too coarse
+    for accounts that can change several times a second, so If-Modified-Since is not trusted.
+    """
+    if etag is None:
+        return None
+    response = get_conditional_response(request, etag=etag)
+    if response is not None and response.status_code == 304:
+        response.headers['ETag'] = etag
+    return response
+
+
+def account_conditional(view):
+    """
+    Answer conditional GETs of a view, sync or async, that reads the account of its account_number
+    argument, from the account version alone: one indexed lookup, and a 304 without running the view
+    when the client's ETag is current. The version is read before the view, so a response is never
+    newer than its ETag says.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, account_number, *args, **kwargs):
+            etag, last_modified = account_validators(await version_query(account_number).afirst())
+            response = not_modified(request, etag)
+            if response is None:
+                response = await view(request, account_number, *args, **kwargs)
+            return with_validators(request, response, etag, last_modified)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, account_number, *args, **kwargs):
+        etag, last_modified = account_validators(version_query(account_number).first())
+        response = not_modified(request, etag)
+        if response is None:
+            response = view(request, account_number, *args, **kwargs)
+        return with_validators(request, response, etag, last_modified)
+    return wrapper
@@ -0,0 +1,94 @@
+import csv
+import json
+from datetime import datetime
+from typing import Iterable, Iterator
+
+from django.db.models import Q, QuerySet
+
+from core.archive import OPERATION_MODELS
+from core.models import OperationsType
+
+EXPORT_FIELDS = ['id', 'timestamp', 'type', 'way', 'amount', 'from_account', 'to_account']
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_queryset(account_number: str | None = None, agency_number: str | None = None,
+                    operation_type: str | None = None, start: datetime | None = None,
+                    end: datetime | None = None) -> QuerySet:
+    """
+    Operations matching the export filters, oldest first, projected to plain tuples in EXPORT_FIELDS order.
+    Live and archived operations are read in one statement that merges both tables in order.
+
+    Parameters:
+        account_number (str | None): Operations that debited or credited this account.
+        agency_number (str | None): Operations that debited or credited an account of this agency.
+        operation_type (str | None): One of OperationsType.
+        start (datetime | None): Only operations at or after this instant.
+        end (datetime | None): Only operations before this instant.
+    """
+    tables = [export_table(model, account_number, agency_number, operation_type, start, end)
+              for model in OPERATION_MODELS]
+    return tables[0].union(*tables[1:], all=True).order_by('timestamp', 'pk')
+
+
+def export_table(model, account_number: str | None, agency_number: str | None, operation_type: str | None,
+                 start: datetime | None, end: datetime | None) -> QuerySet:
+    operations = model.objects.all()
+    if account_number is not None:
+        operations = operations.filter(Q(from_account__account_number=account_number) |
+                                       Q(to_account__account_number=account_number))
+    if agency_number is not None:
+        operations = operations.filter(Q(from_account__agency_number=agency_number) |
+                                       Q(to_account__agency_number=agency_number))
+    if operation_type is not None:
+        operations = operations.filter(type=operation_type)
+    if start is not None:
+        operations = operations.filter(timestamp__gte=start)
+    if end is not None:
+        operations = operations.filter(timestamp__lt=end)
+
+    return operations.values_list(
+        'pk', 'timestamp', 'type', 'way', 'amount', 'from_account__account_number', 'to_account__account_number',
+    )
+
+
+def parse_operation_type(name: str) -> str:
+    """
+    Accept an operation type by name ("deposit") or by value ("D").
+
+    Raises:
+        ValueError: If the name is not an operation type.
+    """
+    if name.upper() in OperationsType.names:
+        return OperationsType[name.upper()]
+    return OperationsType(name)
+
+
+def export_rows(operations: QuerySet) -> Iterator[list]:
+    # The chunked iterator keeps memory flat: rows are fetched and serialized chunk_size at a time.
+    for pk, timestamp, operation_type, way, amount, from_account, to_account in \
+            operations.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [pk, timestamp.isoformat(), operation_type, way, str(amount), from_account, to_account]
+
+
+def render_ndjson(rows: Iterable[list]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(rows: Iterable[list]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+EXPORT_FORMATS = {
+    'ndjson': (render_ndjson, 'application/x-ndjson'),
+    'csv': (render_csv, 'text/csv'),
+}
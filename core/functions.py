@@ -1,15 +1,79 @@
-from datetime import datetime
+import base64
+import json
+import sys
+from array import array
+from decimal import InvalidOperation
+from itertools import repeat
+from operator import add, mul
 
-from core.models import Withdrawal, Account
+from django.db.models import F
+from django.db.models.functions import Round
 
+from core.models import Account, OperationsType
 
-def can_make_withdrawal(account: Account) -> bool:
-    withdrawals = Withdrawal.objects.filter(from_account=account)
-    withdrawals_today = withdrawals.filter(timestamp__date=datetime.now().date()).count()
 
-    if withdrawals_today >= 3:
-        return False
-    return True
+def validate_operation(operation_type: str, amount, from_account: Account | None, to_account: Account | None) -> str | None:
+    """
+    Check the request rules shared by single and batch operations: required data, active accounts and an
+    amount that is positive once rounded to cents. Balance and limits depend on the posting context and are checked by the caller.
+
+    Parameters:
+        operation_type (str): One of OperationsType.
+        amount: The requested amount, as received in the request.
+        from_account (Account | None): The debited account, for withdrawals and transfers.
+        to_account (Account | None): The credited account, for deposits and transfers.
+
+    Returns:
+        str | None: The error message to return to the client, or None if the operation is valid.
+    """
+    accounts = [account for account, used in (
+        (from_account, operation_type != OperationsType.DEPOSIT),
+        (to_account, operation_type != OperationsType.WITHDRAWAL),
+    ) if used]
+
+    if amount is None or None in accounts:
+        return 'Invalid request data'
+
+    if not all(account.is_active for account in accounts):
+        return 'Account is inactive' if len(accounts) == 1 else 'One or both accounts are inactive'
+
+    # The amount as it will be posted: a sub-cent amount rounds to zero and is rejected here, not by the posting.
+    from core.posting import to_amount
+    try:
+        if isinstance(amount, bool) or to_amount(amount) <= 0:
+            return 'Amount must be greater than zero'
+    except (InvalidOperation, TypeError):
+        return 'Amount must be a number'
+
+    return None
+
+def add_cents(field: str, delta):
+    """
+    F(field) + delta, rounded to cents, for the UPDATEs that accumulate money. SQLite stores decimals as
+    floating point and adds them as such (0.10 + 0.20 is stored as 0.30000000000000004); rounding in the
+    same UPDATE keeps the stored value at the nearest cent, so balances do not drift and conditional checks
+    like balance >= amount compare exact amounts. A no-op on databases with a real decimal type.
+    """
+    return Round(F(field) + delta, 2)
+
+def encode_cursor(*values) -> str:
+    """
+    Encode the sort key of the last row of a page into an opaque, URL-safe cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> list | None:
+    """
+    Decode a cursor created by encode_cursor.
+
+    Returns:
+        list | None: The sort key values, or None if the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except ValueError:
+        return None
+    return values if isinstance(values, list) else None
 
 def is_cpf_valid(cpf: str) -> bool:
     """
@@ -54,6 +118,70 @@ def is_cpf_valid(cpf: str) -> bool:
     return cpf[-2:] == f"{first_digit}{second_digit}"
 
 
+CPF_FIRST_WEIGHTS = tuple(range(10, 1, -1))
+# Weights of the first nine digits for the second check digit; the first check digit itself weighs 2.
+CPF_SECOND_WEIGHTS = tuple(range(11, 2, -1))
+
+
+def _weighted_sums(columns: list[bytes], weights: tuple[int, ...]) -> array:
+    """
+    Per CPF, the sum of digit code * weight over the given digit columns.
+
+    Each column is widened to 16-bit lanes and read as one big integer, so a single multiplication scales the
+    whole column and a single addition accumulates it. The sums stay below 2 ** 16, so no lane carries into
+    the next.
+    """
+    size = len(columns[0])
+    total = 0
+    for column, weight in zip(columns, weights):
+        lanes = bytearray(2 * size)
+        lanes[::2] = column
+        total += int.from_bytes(lanes, 'little') * weight
+    sums = array('H', total.to_bytes(2 * size, 'little'))
+    if sys.byteorder == 'big':
+        sums.byteswap()
+    return sums
+
+
+def _check_digits(totals, offset: int) -> list[int]:
+    return [0 if remainder < 2 else 11 - remainder for remainder in ((total - offset) % 11 for total in totals)]
+
+
+def are_cpfs_valid(cpfs: list[str]) -> list[bool]:
+    """
+    Validate many CPFs at once, with the same rules as is_cpf_valid.
+
+    The well-formed CPFs are joined into one ASCII byte string and split into eleven digit columns (every
+    11th byte), so each weighted sum is a pass over whole columns instead of a loop per CPF and character.
+    The columns hold ASCII codes; the code of '0' times the weights is subtracted once from each sum.
+
+    Parameters:
+        cpfs (list[str]): CPFs as strings of 11 numeric digits.
+
+    Returns:
+        list[bool]: Whether each CPF is valid, in the same order.
+    """
+    candidates = [
+        index for index, cpf in enumerate(cpfs)
+        if isinstance(cpf, str) and len(cpf) == 11 and cpf.isascii() and cpf.isdigit() and cpf != cpf[0] * 11
+    ]
+    results = [False] * len(cpfs)
+    if not candidates:
+        return results
+
+    digits = ''.join(cpfs[index] for index in candidates).encode('ascii')
+    columns = [digits[position::11] for position in range(11)]
+    zero = ord('0')
+
+    first_digits = _check_digits(_weighted_sums(columns[:9], CPF_FIRST_WEIGHTS), zero * sum(CPF_FIRST_WEIGHTS))
+    second_totals = map(add, _weighted_sums(columns[:9], CPF_SECOND_WEIGHTS), map(mul, first_digits, repeat(2)))
+    second_digits = _check_digits(second_totals, zero * sum(CPF_SECOND_WEIGHTS))
+
+    for index, first, second, tenth, eleventh in zip(candidates, first_digits, second_digits, columns[9], columns[10]):
+        results[index] = first == tenth - zero and second == eleventh - zero
+    return results
+
+
 # def is_cpf_valid(cpf: str) -> bool:
 #     if not cpf or len(cpf) != 11 or not cpf.isdigit():
 #         return False
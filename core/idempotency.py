@@ -0,0 +1,103 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from core.cache import build_cache
+from core.models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+
+# Stored responses by key, as (request hash, status code, content type, content).
+result_cache = build_cache(getattr(settings, 'IDEMPOTENCY_CACHE', {}), 'idempotency')
+
+
+def request_hash(request) -> str:
+    return hashlib.sha256(request.method.encode() + request.path.encode() + b'\n' + request.body).hexdigest()
+
+
+def replay(result: tuple, current_hash: str) -> HttpResponse:
+    stored_hash, status_code, content_type, content = result
+    if stored_hash != current_hash:
+        return JsonResponse({'error': 'Idempotency-Key was already used with a different request'}, status=422)
+
+    response = HttpResponse(bytes(content), status=status_code, content_type=content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Make a POST view safe to retry with an Idempotency-Key header: the first request with a key runs the
+    view and stores its response, later requests with the same key get the stored response back.
+
+    The key is inserted in the same transaction as the view's work, so a concurrent duplicate blocks on the
+    unique key until the first request commits, then replays its response. If the first request fails (an
+    exception or a 5xx response), the transaction rolls back with the key and a retry runs the view again.
+    Requests without the header run the view as before.
+
+    Because the view runs inside that transaction, run_in_writer posts keyed requests inline, in the request
+    thread, instead of on the writer lanes of core/writer.py: the key must commit with the posting.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key or request.method != 'POST':
+            return view(request, *args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({'error': f'Idempotency-Key must have at most {MAX_KEY_LENGTH} characters'}, status=400)
+
+        current_hash = request_hash(request)
+        result = result_cache.get(key)
+        if result is not None:
+            return replay(result, current_hash)
+
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(key=key, request_hash=current_hash)
+            except IntegrityError:
+                result = IdempotencyKey.objects.filter(key=key).values_list(
+                    'request_hash', 'status_code', 'content_type', 'content',
+                ).get()
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code >= 500 or response.streaming:
+                    transaction.set_rollback(True)
+                    return response
+
+                result = (current_hash, response.status_code, response['Content-Type'], response.content)
+                IdempotencyKey.objects.filter(key=key).update(
+                    status_code=result[1], content_type=result[2], content=result[3],
+                )
+                transaction.on_commit(lambda: result_cache.set(key, result))
+                return response
+
+        result_cache.set(key, result)
+        return replay(result, current_hash)
+
+    return wrapper
+
+
+def key_retention() -> timedelta:
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_RETENTION_HOURS', 24))
+
+
+def prune_keys(retention: timedelta | None = None, limit: int = 5000) -> int:
+    """
+    Delete up to limit keys older than retention (IDEMPOTENCY_KEY_RETENTION_HOURS by default), oldest first.
+
+    Returns:
+        int: The number of keys deleted; 0 once none is left to prune.
+    """
+    before = timezone.now() - (retention or key_retention())
+    ids = list(IdempotencyKey.objects.filter(created_at__lt=before).order_by('created_at')
+               .values_list('pk', flat=True)[:limit])
+    if ids:
+        IdempotencyKey.objects.filter(pk__in=ids).delete()
+    return len(ids)
@@ -0,0 +1,188 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from decimal import Decimal, ROUND_HALF_EVEN
+from itertools import repeat
+from typing import Callable, NamedTuple
+
+import django
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, DecimalField, F, Max, Min, Q, Value, When
+from django.utils import timezone
+
+from core.functions import add_cents
+from core.models import Account, BatchJobCheckpoint, Operation, OperationsType, OperationsWay
+from core.outbox import record_events
+from core.posting import bump_version, invalidate_backdated, to_amount
+from core.rollups import record_batch_rollups
+
+
+class BatchJob(NamedTuple):
+    operation_type: str
+    way: str
+    debit: bool
+    # Coarse filter of the accounts the job applies to, evaluated by the database.
+    eligible: Q
+    # The amount to post for an eligible account's balance; nothing is posted when it is not positive.
+    amount: Callable[[Decimal], Decimal]
+
+
+class SliceResult(NamedTuple):
+    checkpoint: int
+    accounts: int
+    amount: Decimal
+    elapsed: float
+
+
+def job_settings() -> dict:
+    return {'MONTHLY_FEE': '12.90', 'MONTHLY_INTEREST_RATE': '0.005', 'CHUNK_SIZE': 1000,
+            **getattr(settings, 'BATCH_JOBS', {})}
+
+
+def monthly_fee() -> BatchJob:
+    # Accounts that cannot pay the fee are skipped, like any debit: balances never go negative.
+    fee = to_amount(job_settings()['MONTHLY_FEE'])
+    return BatchJob(OperationsType.FEE, OperationsWay.OUT, True, Q(balance__gte=fee), lambda balance: fee)
+
+
+def monthly_interest() -> BatchJob:
+    rate = Decimal(str(job_settings()['MONTHLY_INTEREST_RATE']))
+    return BatchJob(OperationsType.INTEREST, OperationsWay.IN, False, Q(balance__gt=0),
+                    lambda balance: (balance * rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_EVEN))
+
+
+BATCH_JOBS = {
+    'monthly_fee': monthly_fee,
+    'monthly_interest': monthly_interest,
+}
+
+
+def plan_slices(job_name: str, period: date, slices: int) -> list[BatchJobCheckpoint]:
+    """
+    The checkpoints of the run of the job for the period: the existing ones when the run is resumed, or
+    the active account primary keys split into slices contiguous ranges. Accounts opened after the run was
+    planned are not part of it.
+    """
+    checkpoints = list(BatchJobCheckpoint.objects.filter(job=job_name, period=period).order_by('first_account'))
+    if checkpoints:
+        return checkpoints
+
+    bounds = Account.objects.filter(is_active=True).aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return []
+    first, last = bounds['first'], bounds['last']
+    step = -(-(last - first + 1) // slices)
+    BatchJobCheckpoint.objects.bulk_create([
+        BatchJobCheckpoint(job=job_name, period=period, first_account=start,
+                           last_account=min(start + step - 1, last), position=start - 1)
+        for start in range(first, last + 1, step)
+    ])
+    return list(BatchJobCheckpoint.objects.filter(job=job_name, period=period).order_by('first_account'))
+
+
+def run_chunk(job: BatchJob, checkpoint_id: int, chunk_size: int) -> tuple[int, Decimal, bool]:
+    """
+    Post the job for the next chunk_size eligible accounts of a slice, in one transaction with a constant
+    number of statements: the account SELECT, one UPDATE of the balances, one bulk INSERT each of the
+    operations and of their outbox events, the daily totals (see record_batch_rollups) and the checkpoint
+    UPDATE.
+
+    Returns:
+        tuple[int, Decimal, bool]: The accounts posted, the total amount and whether the slice is done.
+    """
+    with transaction.atomic():
+        checkpoint = BatchJobCheckpoint.objects.select_for_update().get(pk=checkpoint_id)
+        if checkpoint.finished_at is not None:
+            return 0, Decimal('0'), True
+
+        rows = list(
+            Account.objects.select_for_update()
+            .filter(job.eligible, pk__gt=checkpoint.position, pk__lte=checkpoint.last_account, is_active=True)
+            .order_by('pk').values_list('pk', 'account_number', 'agency_number', 'balance')[:chunk_size]
+        )
+        amounts = [(Account(pk=pk, account_number=number, agency_number=agency), job.amount(balance))
+                   for pk, number, agency, balance in rows]
+        amounts = [(account, amount) for account, amount in amounts if amount > 0]
+
+        if amounts:
+            by_amount = defaultdict(list)
+            for account, amount in amounts:
+                by_amount[-amount if job.debit else amount].append(account.pk)
+            delta = Case(*[When(pk__in=pks, then=Value(amount)) for amount, pks in by_amount.items()],
+                         output_field=DecimalField(decimal_places=2, max_digits=10))
+            Account.objects.filter(pk__in=[account.pk for account, _ in amounts]).update(
+                balance=add_cents('balance', delta), **bump_version())
+            # Balance snapshots are left as they are: replaying from them still reaches these operations.
+            operations = Operation.objects.bulk_create([
+                Operation(type=job.operation_type, way=job.way, amount=amount,
+                          from_account=account if job.debit else None, to_account=None if job.debit else account)
+                for account, amount in amounts
+            ], batch_size=chunk_size)
+            record_batch_rollups(operations)
+            record_events(operations)
+            invalidate_backdated(operations)
+
+        done = len(rows) < chunk_size
+        total = sum((amount for _, amount in amounts), Decimal('0'))
+        BatchJobCheckpoint.objects.filter(pk=checkpoint_id).update(
+            position=checkpoint.last_account if done else rows[-1][0],
+            accounts=F('accounts') + len(amounts),
+            amount=add_cents('amount', total),
+            finished_at=timezone.now() if done else None,
+        )
+    return len(amounts), total, done
+
+
+def run_slice(job_name: str, checkpoint_id: int, chunk_size: int) -> SliceResult:
+    """
+    Run the job over one slice, chunk by chunk, from its checkpoint to its end.
+    """
+    job = BATCH_JOBS[job_name]()
+    start = time.perf_counter()
+    accounts, total, done = 0, Decimal('0'), False
+    try:
+        while not done:
+            posted, amount, done = run_chunk(job, checkpoint_id, chunk_size)
+            accounts += posted
+            total += amount
+    finally:
+        connections.close_all()
+    return SliceResult(checkpoint_id, accounts, total, time.perf_counter() - start)
+
+
+def _start_worker():
+    # Needed when worker processes are spawned instead of forked; each opens its own connections.
+    django.setup()
+
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    A pool of worker processes for database work. The connections of this process are closed first, so
+    forked workers do not share them.
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_start_worker)
+
+
+def run_batch_job(job_name: str, period: date, workers: int = 1, chunk_size: int | None = None) -> list[SliceResult]:
+    """
+    Run (or resume) the job for every active account, once per period. With more than one worker the
+    account range is split into that many slices, run by a pool of processes; a resumed run keeps the
+    slices it was planned with.
+
+    Raises:
+        ValueError: If there is no job with that name.
+    """
+    if job_name not in BATCH_JOBS:
+        raise ValueError(f'Unknown batch job: {job_name}')
+    chunk_size = chunk_size or job_settings()['CHUNK_SIZE']
+    pending = [checkpoint.pk for checkpoint in plan_slices(job_name, period, workers)
+               if checkpoint.finished_at is None]
+
+    if workers <= 1 or len(pending) <= 1:
+        return [run_slice(job_name, checkpoint_id, chunk_size) for checkpoint_id in pending]
+
+    with process_pool(workers) as pool:
+        return list(pool.map(run_slice, repeat(job_name), pending, repeat(chunk_size)))
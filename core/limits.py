@@ -0,0 +1,151 @@
+from datetime import date
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Q, F
+
+from core.functions import add_cents
+from core.models import Account, OperationLimit, DailyUsage, OperationsType
+
+
+class Limits(NamedTuple):
+    max_amount: Decimal | None = None
+    max_daily_count: int | None = None
+    max_daily_amount: Decimal | None = None
+
+
+# Used when neither the account nor its agency has an OperationLimit for the operation type.
+DEFAULT_LIMITS = {
+    operation_type: Limits(**values)
+    for operation_type, values in getattr(settings, 'OPERATION_LIMITS', {}).items()
+}
+
+
+class LimitExceeded(Exception):
+    pass
+
+
+def _plain(value) -> str:
+    text = f"{Decimal(value):.2f}"
+    return text[:-3] if text.endswith('.00') else text
+
+
+def usage_owner(operation_type: str, from_account: Account | None, to_account: Account | None) -> Account:
+    """
+    The account whose usage an operation counts against: the credited account of a deposit and the
+    debited account of withdrawals and transfers.
+    """
+    return to_account if operation_type == OperationsType.DEPOSIT else from_account
+
+
+def resolve_limits(accounts) -> dict[tuple[int, str], Limits]:
+    """
+    Resolve the limits of many accounts with a single query. An account limit wins over an agency limit,
+    which wins over DEFAULT_LIMITS; empty fields of the winning limit mean no limit.
+
+    Returns:
+        dict[tuple[int, str], Limits]: Limits by (account primary key, operation type).
+    """
+    accounts = list(accounts)
+    rows = OperationLimit.objects.filter(
+        Q(account__in=accounts) |
+        Q(account__isnull=True, agency_number__in={account.agency_number for account in accounts})
+    )
+    by_account, by_agency = {}, {}
+    for row in rows:
+        limits = Limits(row.max_amount, row.max_daily_count, row.max_daily_amount)
+        if row.account_id is not None:
+            by_account[(row.account_id, row.operation_type)] = limits
+        else:
+            by_agency[(row.agency_number, row.operation_type)] = limits
+
+    return {
+        (account.pk, operation_type): by_account.get(
+            (account.pk, operation_type),
+            by_agency.get((account.agency_number, operation_type), DEFAULT_LIMITS.get(operation_type, Limits())),
+        )
+        for account in accounts for operation_type in OperationsType.values
+    }
+
+
+def daily_usage(accounts, day: date) -> dict[tuple[int, str], tuple[int, Decimal]]:
+    """
+    Read the usage counters of many accounts for a day with a single query.
+
+    Returns:
+        dict[tuple[int, str], tuple[int, Decimal]]: (count, amount) by (account primary key, operation type).
+    """
+    rows = DailyUsage.objects.filter(account__in=list(accounts), day=day)
+    return {(row.account_id, row.operation_type): (row.count, row.amount) for row in rows}
+
+
+def limit_error(limits: Limits, operation_type: str, amount: Decimal, used_count: int = 0,
+                used_amount: Decimal = Decimal('0'), count: int = 1) -> str | None:
+    """
+    Check operations against the limits, given what was already used today.
+
+    Parameters:
+        limits (Limits): The limits of the account for the operation type.
+        operation_type (str): One of OperationsType.
+        amount (Decimal): Total amount of the operations being checked.
+        used_count (int): Operations of this type already posted today.
+        used_amount (Decimal): Amount of this type already posted today.
+        count (int): Number of operations being checked.
+
+    Returns:
+        str | None: The error message to return to the client, or None if the limits allow the operations.
+    """
+    label = OperationsType(operation_type).label
+    if limits.max_amount is not None and count == 1 and amount > limits.max_amount:
+        return f'{label} amount exceeds limit of {_plain(limits.max_amount)}'
+    if limits.max_daily_count is not None and used_count + count > limits.max_daily_count:
+        return f'{label} limit exceeded for today'
+    if limits.max_daily_amount is not None and used_amount + amount > limits.max_daily_amount:
+        return f'{label} daily amount limit of {_plain(limits.max_daily_amount)} exceeded'
+    return None
+
+
+def consume(account: Account, operation_type: str, day: date, amount: Decimal, limits: Limits, count: int = 1) -> None:
+    """
+    Add operations to the daily usage counter of the account, but only if the limits allow them.
+
+    The check is part of the UPDATE that increments the counter, so concurrent postings cannot both take
+    the last slot. Must run inside the posting transaction.
+
+    Raises:
+        LimitExceeded: If the operations would exceed the limits. The counter is left unchanged.
+    """
+    if count == 1 and limits.max_amount is not None and amount > limits.max_amount:
+        raise LimitExceeded(limit_error(limits, operation_type, amount))
+
+    usage = DailyUsage.objects.filter(account=account, day=day, operation_type=operation_type)
+
+    for _ in range(2):
+        allowed = usage
+        if limits.max_daily_count is not None:
+            allowed = allowed.filter(count__lte=limits.max_daily_count - count)
+        if limits.max_daily_amount is not None:
+            allowed = allowed.filter(amount__lte=limits.max_daily_amount - amount)
+
+        if allowed.update(count=F('count') + count, amount=add_cents('amount', amount)):
+            return
+
+        used = usage.values_list('count', 'amount').first()
+        error = limit_error(limits, operation_type, amount, *(used or (0, Decimal('0'))), count=count)
+        if error:
+            raise LimitExceeded(error)
+        if used is not None:
+            continue
+
+        try:
+            with transaction.atomic():
+                DailyUsage.objects.create(account=account, day=day, operation_type=operation_type,
+                                          count=count, amount=amount)
+            return
+        except IntegrityError:
+            # Another posting created today's counter first; retry the conditional update.
+            continue
+
+    raise LimitExceeded(f'{OperationsType(operation_type).label} limit exceeded for today')
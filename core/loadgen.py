@@ -0,0 +1,233 @@
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter, defaultdict
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db import connection
+from django.test import AsyncClient, Client as TestClient
+
+from core.benchmarks import percentile
+from core.models import Account
+
+LOAD_KINDS = ['deposit', 'withdrawal', 'transfer', 'statement']
+DEFAULT_MIX = {'deposit': 30, 'withdrawal': 20, 'transfer': 30, 'statement': 20}
+LOCK_ERRORS = ('database is locked', 'database table is locked', 'deadlock', 'could not obtain lock')
+
+
+class LoadRequest(NamedTuple):
+    kind: str
+    amount: int
+    from_account: str | None
+    to_account: str | None
+
+
+class Outcome(NamedTuple):
+    request: LoadRequest
+    status: int | None
+    latency: float
+    error: str | None = None
+
+
+def parse_mix(text: str) -> dict[str, int]:
+    """
+    Parse a workload mix like "deposit=40,transfer=40,statement=20".
+
+    Raises:
+        ValueError: If a kind is unknown or a weight is not a non-negative integer.
+    """
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind.strip() not in LOAD_KINDS or not weight.strip().isdigit():
+            raise ValueError(f'Invalid mix entry: {part}')
+        mix[kind.strip()] = int(weight)
+    if not any(mix.values()):
+        raise ValueError('The mix must have a positive weight')
+    return mix
+
+
+class Workload:
+    """
+    Random requests following a mix of kinds, over accounts picked with a Zipf distribution: the account of
+    rank k is chosen with weight 1 / k ** skew, so a few hot accounts get most of the traffic.
+    """
+
+    def __init__(self, account_numbers: list[str], mix: dict[str, int], skew: float, seed: int):
+        self.account_numbers = account_numbers
+        self.kinds, kind_weights = zip(*mix.items())
+        self.kind_weights = list(itertools.accumulate(kind_weights))
+        self.account_weights = list(itertools.accumulate(1 / rank ** skew for rank in range(1, len(account_numbers) + 1)))
+        self.seed = seed
+
+    def requests(self, worker: int):
+        rng = random.Random(self.seed + worker)
+        while True:
+            kind = rng.choices(self.kinds, cum_weights=self.kind_weights)[0]
+            from_account, to_account = self._pick(rng), self._pick(rng)
+            while len(self.account_numbers) > 1 and to_account == from_account:
+                to_account = self._pick(rng)
+            yield LoadRequest(kind, rng.randint(1, 50), from_account, to_account)
+
+    def _pick(self, rng: random.Random) -> str:
+        return rng.choices(self.account_numbers, cum_weights=self.account_weights)[0]
+
+
+def request_target(request: LoadRequest, async_views: bool = False) -> tuple[str, dict | None]:
+    """
+    The path and JSON body of a load request, or a None body for a read.
+    """
+    prefix = '/core/async/' if async_views else '/core/'
+    if request.kind == 'statement':
+        return f'{prefix}statement/{request.from_account}/', None
+    if request.kind == 'deposit':
+        return f'{prefix}deposit/', {'to_account': request.to_account, 'amount': request.amount}
+    if request.kind == 'withdrawal':
+        return f'{prefix}withdrawal/', {'from_account': request.from_account, 'amount': request.amount}
+    return f'{prefix}transfer/', {'from_account': request.from_account, 'to_account': request.to_account,
+                                  'amount': request.amount}
+
+
+def wsgi_transport(async_views: bool = False):
+    client = TestClient()
+
+    def send(request: LoadRequest) -> int:
+        path, body = request_target(request, async_views)
+        if body is None:
+            return client.get(path).status_code
+        return client.post(path, json.dumps(body), content_type='application/json').status_code
+
+    return send
+
+
+def http_transport(base_url: str, async_views: bool = False):
+    def send(request: LoadRequest) -> int:
+        path, body = request_target(request, async_views)
+        data = json.dumps(body).encode() if body is not None else None
+        http_request = urllib.request.Request(base_url.rstrip('/') + path, data=data,
+                                              headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(http_request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            body = e.read().decode('utf-8', 'replace')
+            if any(message in body for message in LOCK_ERRORS):
+                raise RuntimeError(body[:200])
+            return e.code
+
+    return send
+
+
+def _send(send, request: LoadRequest) -> Outcome:
+    start = time.perf_counter()
+    try:
+        status, error = send(request), None
+    except Exception as e:
+        status, error = None, f'{type(e).__name__}: {e}'
+    return Outcome(request, status, time.perf_counter() - start, error)
+
+
+def run_threads(workload: Workload, make_transport, workers: int, duration: float) -> tuple[list[Outcome], float]:
+    """
+    Send requests from worker threads, each with its own transport, until duration seconds have passed.
+    """
+    outcomes = [[] for _ in range(workers)]
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        send = make_transport()
+        try:
+            for request in workload.requests(index):
+                if time.perf_counter() >= deadline:
+                    break
+                outcomes[index].append(_send(send, request))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [outcome for results in outcomes for outcome in results], time.perf_counter() - start
+
+
+async def run_asgi(workload: Workload, workers: int, duration: float,
+                   async_views: bool = False) -> tuple[list[Outcome], float]:
+    """
+    Send requests through the ASGI handler from workers coroutines until duration seconds have passed.
+    """
+    client = AsyncClient()
+    outcomes = []
+    deadline = time.perf_counter() + duration
+
+    async def worker(index):
+        for request in workload.requests(index):
+            if time.perf_counter() >= deadline:
+                break
+            path, body = request_target(request, async_views)
+            start = time.perf_counter()
+            try:
+                if body is None:
+                    response = await client.get(path)
+                else:
+                    response = await client.post(path, json.dumps(body), content_type='application/json')
+                status, error = response.status_code, None
+            except Exception as e:
+                status, error = None, f'{type(e).__name__}: {e}'
+            outcomes.append(Outcome(request, status, time.perf_counter() - start, error))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(workers)))
+    return outcomes, time.perf_counter() - start
+
+
+def expected_balances(initial: dict[str, Decimal], outcomes: list[Outcome]) -> dict[str, Decimal]:
+    """
+    Balances the accounts should have if exactly the postings answered with 201 were applied.
+    """
+    balances = dict(initial)
+    for outcome in outcomes:
+        request = outcome.request
+        if outcome.status != 201:
+            continue
+        if request.kind in ('withdrawal', 'transfer'):
+            balances[request.from_account] -= request.amount
+        if request.kind in ('deposit', 'transfer'):
+            balances[request.to_account] += request.amount
+    return balances
+
+
+def current_balances(account_numbers: list[str]) -> dict[str, Decimal]:
+    return dict(Account.objects.filter(account_number__in=account_numbers).values_list('account_number', 'balance'))
+
+
+def summarize(outcomes: list[Outcome], elapsed: float) -> dict:
+    """
+    Throughput, latency percentiles (ms) and status and error counts, overall and by kind.
+    """
+    def stats(group: list[Outcome]) -> dict:
+        latencies = [outcome.latency * 1000 for outcome in group] or [0.0]
+        errors = [outcome.error for outcome in group if outcome.error]
+        return {
+            'requests': len(group),
+            'throughput': len(group) / elapsed if elapsed else 0.0,
+            'p50': percentile(latencies, 0.5),
+            'p99': percentile(latencies, 0.99),
+            'statuses': dict(Counter(outcome.status for outcome in group if outcome.status is not None)),
+            'errors': len(errors) + sum(1 for outcome in group if outcome.status and outcome.status >= 500),
+            'lock_errors': sum(1 for error in errors if any(message in error.lower() for message in LOCK_ERRORS)),
+        }
+
+    by_kind = defaultdict(list)
+    for outcome in outcomes:
+        by_kind[outcome.request.kind].append(outcome)
+    return {'total': stats(outcomes), **{kind: stats(group) for kind, group in by_kind.items()}}
@@ -0,0 +1,49 @@
+import atexit
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else on a record came from the extra argument.
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message and the fields passed in extra.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **{key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES},
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Hand records to a background thread that formats them as JSON and writes them to stderr, so logging
+    from a request only costs a queue put.
+    """
+
+    def __init__(self):
+        super().__init__(queue.SimpleQueue())
+        target = logging.StreamHandler()
+        target.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, target, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # Merge the arguments now, as they may change after the call, but keep the extra fields and the
+        # exception for JsonFormatter on the listener thread.
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        return record
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from core.archive import archive_cutoff, archive_operations, archive_settings
+
+
+class Command(BaseCommand):
+    help = ("Move operations older than OPERATION_ARCHIVE['AFTER_DAYS'] days from the live table to the archive, "
+            "in short chunked transactions that postings can interleave with. Safe to interrupt and run again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, help="Days; OPERATION_ARCHIVE['AFTER_DAYS'] by default")
+        parser.add_argument('--chunk-size', type=int, help="Operations per transaction")
+        parser.add_argument('--pause', type=float, default=0.0, help="Seconds to sleep between chunks")
+        parser.add_argument('--max-chunks', type=int, help="Stop after this many chunks")
+
+    def handle(self, *args, **options):
+        before = archive_cutoff(options['older_than'])
+        chunk_size = options['chunk_size'] or archive_settings()['CHUNK_SIZE']
+        self.stdout.write(f"Archiving operations before {before.isoformat()}, {chunk_size} at a time.")
+
+        archived = archive_operations(before, chunk_size, options['pause'], options['max_chunks'],
+                                      progress=lambda total: self.stdout.write(f"  {total} archived"))
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} operations."))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.benchmarks import add_operations, query_growth, route_names, run_benchmarks, seed
+
+
+class Command(BaseCommand):
+    help = ("Seed a throwaway test database and report latency percentiles and query counts for every route. "
+            "With --check, seed again --scale times larger, over --scale times more days, and fail if any "
+            "route's median or cold (first request) query count grew.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=10)
+        parser.add_argument('--accounts', type=int, default=2, help="Accounts per client")
+        parser.add_argument('--operations', type=int, default=50, help="Operations per account")
+        parser.add_argument('--days', type=int, default=5, help="Days of history the operations are spread over")
+        parser.add_argument('--repeats', type=int, default=20, help="Requests per route")
+        parser.add_argument('--route', action='append', dest='routes', help="Only this route (repeatable)")
+        parser.add_argument('--check', action='store_true')
+        parser.add_argument('--scale', type=int, default=10)
+
+    def handle(self, *args, **options):
+        unknown = set(options['routes'] or []) - set(route_names())
+        if unknown:
+            raise CommandError(f"Unknown routes: {', '.join(sorted(unknown))}")
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            data = seed(options['clients'], options['accounts'], options['operations'], days=options['days'])
+            results = run_benchmarks(data, options['repeats'], options['routes'])
+            self.report(results)
+
+            if options['check']:
+                data = seed(options['clients'] * (options['scale'] - 1), options['accounts'], 0, data)
+                add_operations(data, options['operations'] * (options['scale'] - 1), options['days'] * options['scale'])
+                grown = query_growth(results, run_benchmarks(data, options['repeats'], options['routes']))
+                if grown:
+                    raise CommandError("Query count grew with data size: " + ', '.join(
+                        f"{route} ({metric} {before} -> {after})" for route, metric, before, after in grown
+                    ))
+                self.stdout.write(f"No query count growth at {options['scale']}x data.")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def report(self, results):
+        self.stdout.write(f"{'route':<26} {'status':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'cold':>5}")
+        for result in results:
+            self.stdout.write(
+                f"{result.route:<26} {result.status:>6} {result.p50:>8.1f} {result.p95:>8.1f} "
+                f"{result.p99:>8.1f} {result.queries:>8} {result.cold_queries:>5}"
+            )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.models import Operation, OperationsType, OperationsWay
+
+# Child tables of the former multi-table Deposit, Withdrawal and Transfer models.
+LEGACY_TABLES = {
+    'core_deposit': (OperationsType.DEPOSIT, OperationsWay.IN),
+    'core_withdrawal': (OperationsType.WITHDRAWAL, OperationsWay.OUT),
+    'core_transfer': (OperationsType.TRANSFER, OperationsWay.IN_OUT),
+}
+
+
+class Command(BaseCommand):
+    help = ("Make the type of every operation match the legacy core_deposit, core_withdrawal and core_transfer "
+            "tables it was stored in, on databases created before Deposit, Withdrawal and Transfer became proxy "
+            "models. Missing tables are skipped; the legacy tables are left in place and can be dropped afterwards.")
+
+    def handle(self, *args, **options):
+        existing_tables = set(connection.introspection.table_names())
+        operation_table = connection.ops.quote_name(Operation._meta.db_table)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table, (operation_type, way) in LEGACY_TABLES.items():
+                if table not in existing_tables:
+                    continue
+
+                # One set-based UPDATE per table; every other column already lives in the operation table.
+                cursor.execute(
+                    f"UPDATE {operation_table} SET type = %s, way = %s "
+                    f"WHERE id IN (SELECT operation_ptr_id FROM {connection.ops.quote_name(table)}) "
+                    f"AND (type <> %s OR way <> %s)",
+                    [operation_type, way, operation_type, way],
+                )
+                self.stdout.write(f"{table}: {cursor.rowcount} operations updated")
+
+        self.stdout.write(self.style.SUCCESS("Operation types are consistent with the legacy tables"))
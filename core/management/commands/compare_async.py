@@ -0,0 +1,67 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+
+from core.benchmarks import percentile
+from core.models import Account
+
+READ_ENDPOINTS = {
+    'statement': ('/core/statement/{}/', '/core/async/statement/{}/'),
+    'details': ('/core/account/details/{}/', '/core/async/account/details/{}/'),
+}
+
+
+class Command(BaseCommand):
+    help = "Compare latency and throughput of the sync and async read endpoints for an account, in-process."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--account', required=True, help="Account number")
+        parser.add_argument('--endpoint', choices=list(READ_ENDPOINTS), default='statement')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        if not Account.objects.filter(account_number=options['account']).exists():
+            raise CommandError(f"Account not found: {options['account']}")
+
+        sync_url, async_url = (url.format(options['account']) for url in READ_ENDPOINTS[options['endpoint']])
+        self.report('sync (WSGI)', *self.run_sync(sync_url, options['requests'], options['concurrency']))
+        self.report('async (ASGI)', *asyncio.run(self.run_async(async_url, options['requests'], options['concurrency'])))
+
+    @staticmethod
+    def run_sync(url: str, requests: int, concurrency: int) -> tuple[list[float], float]:
+        client = Client()
+
+        def get(_):
+            start = time.perf_counter()
+            client.get(url)
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(get, range(requests)))
+        return latencies, time.perf_counter() - start
+
+    @staticmethod
+    async def run_async(url: str, requests: int, concurrency: int) -> tuple[list[float], float]:
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get():
+            async with semaphore:
+                start = time.perf_counter()
+                await client.get(url)
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(get() for _ in range(requests)))
+        return list(latencies), time.perf_counter() - start
+
+    def report(self, label: str, latencies: list[float], elapsed: float) -> None:
+        self.stdout.write(
+            f"{label}: {len(latencies) / elapsed:.0f} req/s, "
+            f"p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms"
+        )
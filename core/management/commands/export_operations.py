@@ -0,0 +1,43 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exports import EXPORT_FORMATS, export_queryset, export_rows, parse_operation_type
+from core.statements import day_start, day_end
+
+
+class Command(BaseCommand):
+    help = "Stream operations as NDJSON or CSV, filtered by account, agency, type and date range."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--account', help="Account number")
+        parser.add_argument('--agency', help="Agency number")
+        parser.add_argument('--type', help="deposit, withdrawal or transfer")
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help="First day (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help="Last day (YYYY-MM-DD)")
+        parser.add_argument('--output', help="File to write to; defaults to stdout")
+
+    def handle(self, *args, **options):
+        try:
+            operation_type = parse_operation_type(options['type']) if options['type'] else None
+        except ValueError:
+            raise CommandError(f"Unknown operation type: {options['type']}")
+
+        operations = export_queryset(
+            account_number=options['account'],
+            agency_number=options['agency'],
+            operation_type=operation_type,
+            start=day_start(options['start']) if options['start'] else None,
+            end=day_end(options['end']) if options['end'] else None,
+        )
+        render, _ = EXPORT_FORMATS[options['format']]
+
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for chunk in render(export_rows(operations)):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,30 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.onboarding import IMPORTERS, IMPORT_FORMATS, read_rows
+
+
+class Command(BaseCommand):
+    help = "Import clients or accounts from a CSV or NDJSON file, reporting the rejected rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help="Defaults to the file extension")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        import_format = options['format'] or path.suffix.lstrip('.').lower()
+
+        if import_format not in IMPORT_FORMATS:
+            raise CommandError(f"Unknown format for {path}; use --format")
+
+        with path.open(newline='', encoding='utf-8') as lines:
+            report = IMPORTERS[options['kind']](read_rows(lines, import_format))
+
+        for rejected in report['rejected']:
+            self.stderr.write(f"Row {rejected['row']}: {rejected['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} {options['kind']}, rejected {len(report['rejected'])} rows"
+        ))
@@ -0,0 +1,84 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.benchmarks import seed
+from core.loadgen import DEFAULT_MIX, Workload, current_balances, expected_balances, http_transport, parse_mix, \
+    run_asgi, run_threads, summarize, wsgi_transport
+from core.models import Account
+
+
+class Command(BaseCommand):
+    help = ("Drive a mix of deposits, withdrawals, transfers and statement reads over Zipf-distributed hot "
+            "accounts, in-process (wsgi, asgi) on a throwaway database or against a local server (http), and "
+            "report throughput, latency, errors, lock failures and whether the final balances are consistent.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['wsgi', 'asgi', 'http'], default='wsgi')
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Server of the http mode")
+        parser.add_argument('--workers', type=int, default=16, help="Concurrent clients")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds")
+        parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                            help="Weights by kind, e.g. deposit=30,withdrawal=20,transfer=30,statement=20")
+        parser.add_argument('--accounts', type=int, default=20, help="Accounts in the hot set")
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent; 0 is uniform")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--async-views', action='store_true', help="Use the /core/async/ endpoints")
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'http':
+            # The server must use the same database as this command for the consistency check to hold.
+            account_numbers = list(Account.objects.filter(is_active=True).order_by('pk')
+                                   .values_list('account_number', flat=True)[:options['accounts']])
+            if not account_numbers:
+                raise CommandError("No active accounts to load")
+            self.run(account_numbers, options)
+            return
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            data = seed(1, options['accounts'], 10)
+            self.run(data.account_numbers, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, account_numbers, options):
+        workload = Workload(account_numbers, options['mix'], options['skew'], options['seed'])
+        initial = current_balances(account_numbers)
+
+        if options['mode'] == 'asgi':
+            outcomes, elapsed = asyncio.run(run_asgi(workload, options['workers'], options['duration'],
+                                                     options['async_views']))
+        elif options['mode'] == 'http':
+            outcomes, elapsed = run_threads(workload, lambda: http_transport(options['url'], options['async_views']),
+                                            options['workers'], options['duration'])
+        else:
+            outcomes, elapsed = run_threads(workload, lambda: wsgi_transport(options['async_views']),
+                                            options['workers'], options['duration'])
+
+        self.report(summarize(outcomes, elapsed))
+
+        expected = expected_balances(initial, outcomes)
+        final = current_balances(account_numbers)
+        mismatches = {number: (expected[number], final[number]) for number in account_numbers
+                      if expected[number] != final[number]}
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"Inconsistent balances on {len(mismatches)} accounts:"))
+            for number, (want, got) in mismatches.items():
+                self.stdout.write(f"  {number}: expected {want}, found {got}")
+        else:
+            self.stdout.write(self.style.SUCCESS("Balances consistent with the acknowledged postings."))
+
+    def report(self, summary):
+        self.stdout.write(f"{'kind':<12} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+                          f"{'errors':>7} {'locked':>7}  statuses")
+        for kind, stats in summary.items():
+            statuses = ' '.join(f"{status}:{count}" for status, count in sorted(stats['statuses'].items()))
+            self.stdout.write(
+                f"{kind:<12} {stats['requests']:>9} {stats['throughput']:>8.0f} {stats['p50']:>8.1f} "
+                f"{stats['p99']:>8.1f} {stats['errors']:>7} {stats['lock_errors']:>7}  {statuses}"
+            )
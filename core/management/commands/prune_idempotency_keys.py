@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.idempotency import key_retention, prune_keys
+
+
+class Command(BaseCommand):
+    help = ("Delete the stored Idempotency-Key responses older than IDEMPOTENCY_KEY_RETENTION_HOURS, in chunks. "
+            "Meant to run periodically, e.g. from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=float, help="Hours; IDEMPOTENCY_KEY_RETENTION_HOURS by default")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Keys deleted per statement")
+
+    def handle(self, *args, **options):
+        retention = timedelta(hours=options['older_than']) if options['older_than'] else key_retention()
+        total = 0
+        while deleted := prune_keys(retention, options['chunk_size']):
+            total += deleted
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} idempotency keys."))
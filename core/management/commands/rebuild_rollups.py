@@ -0,0 +1,17 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from core.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily account and agency totals from the operations, e.g. after a backfill."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=date.fromisoformat, help="First day (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='end', type=date.fromisoformat, help="Last day (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        accounts, agencies = rebuild_rollups(options['start'], options['end'])
+        self.stdout.write(f"Rebuilt {accounts} account rows and {agencies} agency rows.")
@@ -0,0 +1,47 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.reconcile import RECONCILE_CHUNK_SIZE, reconcile
+
+REPORT_FIELDS = ['account_id', 'account_number', 'balance', 'ledger', 'difference']
+
+
+class Command(BaseCommand):
+    help = ("Check that every account balance equals the sum of its operations (live and archived), with one "
+            "grouped aggregate query per chunk of accounts, in a process pool. Discrepancies are written as CSV "
+            "as the chunks finish. --incremental only rechecks accounts modified since the last run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true')
+        parser.add_argument('--workers', type=int, default=1, help="Processes checking chunks in parallel")
+        parser.add_argument('--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE, help="Accounts per query")
+        parser.add_argument('--output', help="CSV file for the discrepancy report; defaults to stdout")
+        parser.add_argument('--check', action='store_true', help="Fail if any discrepancy is found")
+
+    def handle(self, *args, **options):
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        writer = csv.writer(output)
+        writer.writerow(REPORT_FIELDS)
+
+        start = time.perf_counter()
+        accounts = discrepancies = 0
+        try:
+            for result in reconcile(options['incremental'], options['workers'], options['chunk_size']):
+                accounts += result.accounts
+                discrepancies += len(result.discrepancies)
+                for discrepancy in result.discrepancies:
+                    writer.writerow([*discrepancy, discrepancy.difference])
+                output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        elapsed = time.perf_counter() - start
+
+        summary = (f"Checked {accounts} accounts in {elapsed:.1f}s "
+                   f"({accounts / elapsed if elapsed else 0.0:.0f} accounts/s): {discrepancies} discrepancies.")
+        if discrepancies and options['check']:
+            raise CommandError(summary)
+        self.stderr.write(self.style.ERROR(summary) if discrepancies else self.style.SUCCESS(summary))
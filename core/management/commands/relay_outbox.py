@@ -0,0 +1,31 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import build_sink, outbox_settings, relay
+
+
+class Command(BaseCommand):
+    help = ("Deliver the posted events of the outbox to the sink of OUTBOX['SINK'], in batches, oldest first. "
+            "Runs until interrupted; safe to stop at any time, undelivered events are sent on the next run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Stop once no event is pending")
+        parser.add_argument('--batch-size', type=int, help="Events per batch; OUTBOX['BATCH_SIZE'] by default")
+
+    def handle(self, *args, **options):
+        config = outbox_settings()
+        batch_size = options['batch_size'] or config['BATCH_SIZE']
+        stop = threading.Event()
+        # The batch in flight is finished before stopping, so it is not sent twice.
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+        self.stdout.write(f"Relaying outbox events to {config['SINK']}, {batch_size} at a time.")
+
+        sink = build_sink(config)
+        try:
+            delivered = relay(sink, batch_size, stop, once=options['once'])
+        finally:
+            sink.close()
+        self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} events."))
@@ -0,0 +1,47 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.jobs import BATCH_JOBS, run_batch_job
+
+
+def parse_period(text: str) -> date:
+    return date.fromisoformat(f'{text}-01')
+
+
+class Command(BaseCommand):
+    help = ("Post a month-end batch job (fees or interest) to every active account with set-based, chunked "
+            "transactions, optionally split across a process pool. Runs once per period: running it again "
+            "resumes an interrupted run from its checkpoints.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('job', choices=sorted(BATCH_JOBS))
+        parser.add_argument('--period', type=parse_period, help="Month, YYYY-MM; the current month by default")
+        parser.add_argument('--workers', type=int, default=1, help="Processes, each running one slice of accounts")
+        parser.add_argument('--chunk-size', type=int, help="Accounts per transaction")
+
+    def handle(self, *args, **options):
+        period = options['period'] or timezone.localdate().replace(day=1)
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1")
+
+        start = time.perf_counter()
+        results = run_batch_job(options['job'], period, options['workers'], options['chunk_size'])
+        elapsed = time.perf_counter() - start
+
+        if not results:
+            self.stdout.write(f"{options['job']} {period:%Y-%m} is already complete.")
+            return
+
+        for result in results:
+            rate = result.accounts / result.elapsed if result.elapsed else 0.0
+            self.stdout.write(f"  slice {result.checkpoint}: {result.accounts} accounts, R${result.amount} "
+                              f"in {result.elapsed:.1f}s ({rate:.0f} accounts/s)")
+        accounts = sum(result.accounts for result in results)
+        amount = sum(result.amount for result in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['job']} {period:%Y-%m}: {accounts} accounts, R${amount} in {elapsed:.1f}s "
+            f"({accounts / elapsed if elapsed else 0.0:.0f} accounts/s)"
+        ))
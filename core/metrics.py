@@ -0,0 +1,210 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+# Upper bounds, in seconds, of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RouteStats:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.latency = 0.0
+        self.statuses = Counter()
+        self.response_bytes = 0
+        self.sized_responses = 0
+        self.queries = 0
+        self.query_time = 0.0
+
+
+class MetricsRegistry:
+    """
+    In-process request aggregates by (route, method): a fixed-bucket latency histogram, status codes,
+    response sizes and database query counts and time. Observing a request is a few additions under a lock.
+    Other modules can add labelled counters and gauges of their own.
+    """
+
+    def __init__(self):
+        self._routes = defaultdict(RouteStats)
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, help_text: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            self._help[name] = ('counter', help_text)
+            self._counters[(name, tuple(sorted(labels.items())))] += value
+
+    def set_gauge(self, name: str, help_text: str, value: float, **labels) -> None:
+        with self._lock:
+            self._help[name] = ('gauge', help_text)
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, route: str, method: str, status: int, latency: float, size: int | None = None,
+                queries: int = 0, query_time: float = 0.0) -> None:
+        with self._lock:
+            stats = self._routes[(route, method)]
+            stats.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            stats.count += 1
+            stats.latency += latency
+            stats.statuses[status] += 1
+            if size is not None:
+                stats.response_bytes += size
+                stats.sized_responses += 1
+            stats.queries += queries
+            stats.query_time += query_time
+
+    def clear(self) -> None:
+        with self._lock:
+            self._routes.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def render(self) -> str:
+        """
+        The aggregates in the Prometheus text exposition format.
+        """
+        with self._lock:
+            routes = sorted((key, _copy(stats)) for key, stats in self._routes.items())
+            series = sorted({**self._counters, **self._gauges}.items())
+            help_texts = dict(self._help)
+
+        lines = [
+            '# HELP bancodio_http_requests_total Requests by route, method and status code.',
+            '# TYPE bancodio_http_requests_total counter',
+        ]
+        for (route, method), stats in routes:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'bancodio_http_requests_total{_labels(route, method, status=status)} {count}')
+
+        lines += [
+            '# HELP bancodio_http_request_duration_seconds Request latency by route and method.',
+            '# TYPE bancodio_http_request_duration_seconds histogram',
+        ]
+        for (route, method), stats in routes:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), stats.buckets):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'bancodio_http_request_duration_seconds_bucket{_labels(route, method, le=le)} {cumulative}')
+            lines.append(f'bancodio_http_request_duration_seconds_sum{_labels(route, method)} {stats.latency}')
+            lines.append(f'bancodio_http_request_duration_seconds_count{_labels(route, method)} {stats.count}')
+
+        lines += [
+            '# HELP bancodio_http_response_size_bytes Size of non-streaming responses by route and method.',
+            '# TYPE bancodio_http_response_size_bytes summary',
+        ]
+        for (route, method), stats in routes:
+            lines.append(f'bancodio_http_response_size_bytes_sum{_labels(route, method)} {stats.response_bytes}')
+            lines.append(f'bancodio_http_response_size_bytes_count{_labels(route, method)} {stats.sized_responses}')
+
+        lines += [
+            '# HELP bancodio_db_queries_total Database queries run on the request thread, by route and method.',
+            '# TYPE bancodio_db_queries_total counter',
+        ]
+        for (route, method), stats in routes:
+            lines.append(f'bancodio_db_queries_total{_labels(route, method)} {stats.queries}')
+
+        lines += [
+            '# HELP bancodio_db_query_seconds_total Time spent in those queries, by route and method.',
+            '# TYPE bancodio_db_query_seconds_total counter',
+        ]
+        for (route, method), stats in routes:
+            lines.append(f'bancodio_db_query_seconds_total{_labels(route, method)} {stats.query_time}')
+
+        previous = None
+        for (name, labels), value in series:
+            if name != previous:
+                metric_type, help_text = help_texts[name]
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}']
+                previous = name
+            label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+            lines.append(f'{name}{{{label_text}}} {value}' if labels else f'{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _copy(stats: RouteStats) -> RouteStats:
+    copy = RouteStats()
+    copy.__dict__.update({**stats.__dict__, 'buckets': list(stats.buckets), 'statuses': Counter(stats.statuses)})
+    return copy
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(route: str, method: str, **extra) -> str:
+    labels = {'route': route, 'method': method, **extra}
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+registry = MetricsRegistry()
+
+
+class QueryTimer:
+    """
+    Database execute wrapper that counts the queries of a request and the time spent in them.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.queries += 1
+
+
+def route_label(request) -> str:
+    # The URL pattern, not the path, so account numbers and CPFs do not multiply the series.
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+def response_size(response) -> int | None:
+    return None if response.streaming else len(response.content)
+
+
+class MetricsMiddleware:
+    """
+    Record every request in the metrics registry. Under ASGI, queries run by async views happen on other
+    threads and are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        registry.observe(route_label(request), request.method, response.status_code, time.perf_counter() - start,
+                         response_size(response), timer.queries, timer.time)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        registry.observe(route_label(request), request.method, response.status_code, time.perf_counter() - start,
+                         response_size(response))
+        return response
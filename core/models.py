@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.db.models import enums
 
+from core.writer import run_in_writer
+
 
 class Client(models.Model):
     name = models.CharField(max_length=100, verbose_name="Client Name")
@@ -29,21 +31,37 @@ class Account(models.Model):
     account_number = models.CharField(max_length=20, unique=True, verbose_name="Account Number")
     agency_number = models.CharField(max_length=10, verbose_name="Agency Number", default='0001')
     balance = models.DecimalField(decimal_places=2, max_digits=10, default=0.00, verbose_name="Balance")
+    # The balance the account was created with, which no operation explains; see core/reconcile.py.
+    opening_balance = models.DecimalField(decimal_places=2, max_digits=10, default=0.00, verbose_name="Opening Balance")
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='accounts', verbose_name="Client")
     is_active = models.BooleanField(default=True, verbose_name="Is Active")
+    # Bumped by every posting and change of the account, for conditional GETs.
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Version")
+    modified_at = models.DateTimeField(null=True, blank=True, verbose_name="Modified At")
 
     def __str__(self):
         return f"{self.agency_number} - {self.account_number}"
 
+    def save(self, **kwargs):
+        if self._state.adding:
+            self.opening_balance = self.balance
+        super().save(**kwargs)
+
     class Meta:
         verbose_name = "Account"
         verbose_name_plural = "Accounts"
+        indexes = [
+            models.Index(fields=['agency_number', 'id'], name='account_agency_idx'),
+        ]
 
 
 class OperationsType(enums.TextChoices):
     TRANSFER = 'T', 'Transfer'
     DEPOSIT = 'D', 'Deposit'
     WITHDRAWAL = 'W', 'Withdrawal'
+    # Posted only by the batch jobs of core/jobs.py.
+    FEE = 'F', 'Fee'
+    INTEREST = 'I', 'Interest'
 
 class OperationsWay(enums.TextChoices):
     IN = 'IN', 'In'
@@ -62,57 +80,284 @@ class Operation(models.Model):
         return f"{self.get_type_display()} - {self.timestamp.strftime('%Y-%m-%d - %H:%M:%S')}"
 
     def save(self, **kwargs):
-        if self.type == OperationsType.DEPOSIT:
-            self.from_account = None
-            self.way = OperationsWay.IN
-            self.to_account.balance += self.amount
-            self.to_account.save()
-
-        elif self.type == OperationsType.WITHDRAWAL:
-            self.to_account = None
-            self.way = OperationsWay.OUT
-            self.from_account.balance -= self.amount
-            self.from_account.save()
-
-        else:
-            if self.from_account is None or self.to_account is None:
-                raise ValueError("Both from_account and to_account must be set for transfers.")
-
+        if not self._state.adding:
+            super().save(**kwargs)
+            return
 
-            self.way = OperationsWay.IN_OUT
+        run_in_writer({self.from_account_id, self.to_account_id} - {None}, self._post, **kwargs)
 
-            self.from_account.balance -= self.amount
-            self.from_account.save()
+    def _post(self, **kwargs):
+        from core.posting import apply_operation, record_postings
 
-            self.to_account.balance += self.amount
-            self.to_account.save()
-
-        super().save()
+        with transaction.atomic():
+            apply_operation(self)
+            super().save(**kwargs)
+            record_postings([self])
 
     class Meta:
         verbose_name = "Operation"
         verbose_name_plural = "Operations"
+        indexes = [
+            models.Index(fields=['from_account', 'timestamp', 'id'], name='operation_from_timestamp_idx'),
+            models.Index(fields=['to_account', 'timestamp', 'id'], name='operation_to_timestamp_idx'),
+            models.Index(fields=['type', 'timestamp'], name='operation_type_timestamp_idx'),
+        ]
+
+class OperationTypeManager(models.Manager):
+    def __init__(self, operation_type):
+        super().__init__()
+        self.operation_type = operation_type
+
+    def get_queryset(self):
+        return super().get_queryset().filter(type=self.operation_type)
 
 class Deposit(Operation):
-    type = OperationsType.DEPOSIT
-    way = OperationsWay.IN
+    objects = OperationTypeManager(OperationsType.DEPOSIT)
+
+    def save(self, **kwargs):
+        self.type = OperationsType.DEPOSIT
+        super().save(**kwargs)
 
     class Meta:
+        proxy = True
         verbose_name = "Deposit"
         verbose_name_plural = "Deposits"
 
 class Withdrawal(Operation):
-    type = OperationsType.WITHDRAWAL
-    way = OperationsWay.OUT
+    objects = OperationTypeManager(OperationsType.WITHDRAWAL)
+
+    def save(self, **kwargs):
+        self.type = OperationsType.WITHDRAWAL
+        super().save(**kwargs)
 
     class Meta:
+        proxy = True
         verbose_name = "Withdrawal"
         verbose_name_plural = "Withdrawals"
 
 class Transfer(Operation):
-    type = OperationsType.TRANSFER
-    way = OperationsWay.IN_OUT
+    objects = OperationTypeManager(OperationsType.TRANSFER)
+
+    def save(self, **kwargs):
+        self.type = OperationsType.TRANSFER
+        super().save(**kwargs)
 
     class Meta:
+        proxy = True
         verbose_name = "Transfer"
-        verbose_name_plural = "Transfers"
\ No newline at end of file
+        verbose_name_plural = "Transfers"
+
+
+class ArchivedOperation(models.Model):
+    # An operation moved out of Operation by core/archive.py, with its original primary key. Period is the
+    # first day of its month, so a whole period can be exported or dropped with one indexed query.
+    id = models.BigIntegerField(primary_key=True)
+    type = models.CharField(max_length=10, choices=OperationsType.choices)
+    way = models.CharField(max_length=10, choices=OperationsWay.choices)
+    amount = models.DecimalField(decimal_places=2, max_digits=10)
+    timestamp = models.DateTimeField()
+    from_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='archived_from', verbose_name="From Account", null=True, blank=True)
+    to_account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='archived_to', verbose_name="To Account", null=True, blank=True)
+    period = models.DateField(verbose_name="Period")
+
+    def __str__(self):
+        return f"{self.get_type_display()} - {self.timestamp.strftime('%Y-%m-%d - %H:%M:%S')}"
+
+    class Meta:
+        verbose_name = "Archived Operation"
+        verbose_name_plural = "Archived Operations"
+        indexes = [
+            models.Index(fields=['from_account', 'timestamp', 'id'], name='archived_from_timestamp_idx'),
+            models.Index(fields=['to_account', 'timestamp', 'id'], name='archived_to_timestamp_idx'),
+            models.Index(fields=['type', 'timestamp'], name='archived_type_timestamp_idx'),
+            models.Index(fields=['period', 'timestamp'], name='archived_period_timestamp_idx'),
+        ]
+
+
+class BalanceSnapshot(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='snapshots', verbose_name="Account")
+    day = models.DateField(verbose_name="Day")
+    balance = models.DecimalField(decimal_places=2, max_digits=10, verbose_name="Balance")
+    timestamp = models.DateTimeField(verbose_name="Last Operation Timestamp")
+    last_operation = models.BigIntegerField(verbose_name="Last Operation ID")
+    operation_count = models.PositiveIntegerField(default=0, verbose_name="Operation Count")
+
+    def __str__(self):
+        return f"{self.account} - {self.timestamp.strftime('%Y-%m-%d - %H:%M:%S')} - {self.balance}"
+
+    class Meta:
+        verbose_name = "Balance Snapshot"
+        verbose_name_plural = "Balance Snapshots"
+        indexes = [
+            models.Index(fields=['account', 'timestamp', 'last_operation'], name='snapshot_account_timestamp_idx'),
+            models.Index(fields=['account', 'day'], name='snapshot_account_day_idx'),
+        ]
+
+
+class OperationLimit(models.Model):
+    operation_type = models.CharField(max_length=10, choices=OperationsType.choices, verbose_name="Operation Type")
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='limits', verbose_name="Account", null=True, blank=True)
+    agency_number = models.CharField(max_length=10, verbose_name="Agency Number", null=True, blank=True)
+    max_amount = models.DecimalField(decimal_places=2, max_digits=10, verbose_name="Max Amount per Operation", null=True, blank=True)
+    max_daily_count = models.PositiveIntegerField(verbose_name="Max Operations per Day", null=True, blank=True)
+    max_daily_amount = models.DecimalField(decimal_places=2, max_digits=12, verbose_name="Max Amount per Day", null=True, blank=True)
+
+    def __str__(self):
+        scope = self.account if self.account_id else f"Agency {self.agency_number}"
+        return f"{self.get_operation_type_display()} - {scope}"
+
+    class Meta:
+        verbose_name = "Operation Limit"
+        verbose_name_plural = "Operation Limits"
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'operation_type'], name='unique_account_limit'),
+            models.UniqueConstraint(fields=['agency_number', 'operation_type'], condition=models.Q(account__isnull=True), name='unique_agency_limit'),
+        ]
+
+
+class DailyUsage(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='daily_usage', verbose_name="Account")
+    day = models.DateField(verbose_name="Day")
+    operation_type = models.CharField(max_length=10, choices=OperationsType.choices, verbose_name="Operation Type")
+    count = models.PositiveIntegerField(default=0, verbose_name="Count")
+    amount = models.DecimalField(decimal_places=2, max_digits=12, default=0, verbose_name="Amount")
+
+    def __str__(self):
+        return f"{self.account} - {self.day} - {self.get_operation_type_display()}"
+
+    class Meta:
+        verbose_name = "Daily Usage"
+        verbose_name_plural = "Daily Usage"
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'day', 'operation_type'], name='unique_daily_usage'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(max_length=255, unique=True, verbose_name="Key")
+    request_hash = models.CharField(max_length=64, verbose_name="Request Hash")
+    status_code = models.PositiveSmallIntegerField(verbose_name="Status Code", null=True, blank=True)
+    content_type = models.CharField(max_length=100, verbose_name="Content Type", blank=True)
+    content = models.BinaryField(verbose_name="Content", null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name="Created At")
+
+    def __str__(self):
+        return f"{self.key} - {self.status_code}"
+
+    class Meta:
+        verbose_name = "Idempotency Key"
+        verbose_name_plural = "Idempotency Keys"
+
+
+class DailyTotals(models.Model):
+    day = models.DateField(verbose_name="Day")
+    deposits = models.DecimalField(decimal_places=2, max_digits=14, default=0, verbose_name="Deposits")
+    withdrawals = models.DecimalField(decimal_places=2, max_digits=14, default=0, verbose_name="Withdrawals")
+    transfers_in = models.DecimalField(decimal_places=2, max_digits=14, default=0, verbose_name="Transfers In")
+    transfers_out = models.DecimalField(decimal_places=2, max_digits=14, default=0, verbose_name="Transfers Out")
+    fees = models.DecimalField(decimal_places=2, max_digits=14, default=0, verbose_name="Fees")
+    interest = models.DecimalField(decimal_places=2, max_digits=14, default=0, verbose_name="Interest")
+    deposit_count = models.PositiveIntegerField(default=0, verbose_name="Deposit Count")
+    withdrawal_count = models.PositiveIntegerField(default=0, verbose_name="Withdrawal Count")
+    transfer_in_count = models.PositiveIntegerField(default=0, verbose_name="Transfer In Count")
+    transfer_out_count = models.PositiveIntegerField(default=0, verbose_name="Transfer Out Count")
+    fee_count = models.PositiveIntegerField(default=0, verbose_name="Fee Count")
+    interest_count = models.PositiveIntegerField(default=0, verbose_name="Interest Count")
+
+    class Meta:
+        abstract = True
+
+
+class DailyAccountTotals(DailyTotals):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='daily_totals', verbose_name="Account")
+
+    def __str__(self):
+        return f"{self.account} - {self.day}"
+
+    class Meta:
+        verbose_name = "Daily Account Totals"
+        verbose_name_plural = "Daily Account Totals"
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'day'], name='unique_daily_account_totals'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='account_totals_day_idx'),
+        ]
+
+
+class DailyAgencyTotals(DailyTotals):
+    agency_number = models.CharField(max_length=10, verbose_name="Agency Number")
+
+    def __str__(self):
+        return f"Agency {self.agency_number} - {self.day}"
+
+    class Meta:
+        verbose_name = "Daily Agency Totals"
+        verbose_name_plural = "Daily Agency Totals"
+        constraints = [
+            models.UniqueConstraint(fields=['agency_number', 'day'], name='unique_daily_agency_totals'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='agency_totals_day_idx'),
+        ]
+
+
+class BatchJobCheckpoint(models.Model):
+    # Progress of a batch job run (core/jobs.py) over one slice of the account primary keys, committed with
+    # each chunk of postings, so a run resumes after the last committed chunk and never posts twice.
+    job = models.CharField(max_length=50, verbose_name="Job")
+    period = models.DateField(verbose_name="Period")
+    first_account = models.BigIntegerField(verbose_name="First Account ID")
+    last_account = models.BigIntegerField(verbose_name="Last Account ID")
+    position = models.BigIntegerField(verbose_name="Last Processed Account ID")
+    accounts = models.PositiveIntegerField(default=0, verbose_name="Accounts Posted")
+    amount = models.DecimalField(decimal_places=2, max_digits=16, default=0, verbose_name="Amount Posted")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished At")
+
+    def __str__(self):
+        return f"{self.job} - {self.period} - {self.first_account}..{self.last_account}"
+
+    class Meta:
+        verbose_name = "Batch Job Checkpoint"
+        verbose_name_plural = "Batch Job Checkpoints"
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'period', 'first_account'], name='unique_batch_job_slice'),
+        ]
+
+
+class ReconcileRun(models.Model):
+    # A run of core/reconcile.py. An incremental run only rechecks the accounts modified since the start of
+    # the last finished run.
+    started_at = models.DateTimeField(verbose_name="Started At")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished At")
+    incremental = models.BooleanField(default=False, verbose_name="Incremental")
+    accounts = models.PositiveIntegerField(default=0, verbose_name="Accounts Checked")
+    discrepancies = models.PositiveIntegerField(default=0, verbose_name="Discrepancies")
+
+    def __str__(self):
+        return f"{self.started_at.strftime('%Y-%m-%d - %H:%M:%S')} - {self.discrepancies} discrepancies"
+
+    class Meta:
+        verbose_name = "Reconcile Run"
+        verbose_name_plural = "Reconcile Runs"
+
+
+class OutboxEvent(models.Model):
+    # An event for downstream systems, inserted in the transaction of the posting it describes and delivered
+    # at least once, oldest first, by the relay of core/outbox.py. Delivered events are pruned after a while.
+    event_type = models.CharField(max_length=50, verbose_name="Event Type")
+    payload = models.JSONField(verbose_name="Payload")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    delivered_at = models.DateTimeField(null=True, blank=True, verbose_name="Delivered At")
+
+    def __str__(self):
+        return f"{self.event_type} - {self.pk}"
+
+    class Meta:
+        verbose_name = "Outbox Event"
+        verbose_name_plural = "Outbox Events"
+        indexes = [
+            # Only the pending events, so the relay's scan stays small however many were delivered.
+            models.Index(fields=['id'], condition=models.Q(delivered_at__isnull=True), name='outbox_pending_idx'),
+            models.Index(fields=['delivered_at'], name='outbox_delivered_idx'),
+        ]
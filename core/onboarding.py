@@ -0,0 +1,176 @@
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator
+
+from django.db import transaction, IntegrityError
+
+from core.cache import lookup_cache, account_key, client_key
+from core.functions import are_cpfs_valid
+from core.models import Client, Account
+
+CLIENT_FIELDS = ['name', 'cpf', 'birth_date', 'street_address', 'street_number', 'neighborhood', 'city', 'state_code']
+ACCOUNT_FIELDS = ['client_cpf', 'account_number', 'agency_number']
+IMPORT_FORMATS = ['csv', 'ndjson']
+IMPORT_CHUNK_SIZE = 1000
+
+
+def read_rows(lines: Iterable[str], import_format: str) -> Iterator[dict]:
+    """
+    Parse an import file lazily, one row at a time. CSV files must have a header line.
+    """
+    if import_format == 'csv':
+        yield from csv.DictReader(lines)
+        return
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield row if isinstance(row, dict) else {}
+
+
+def chunks(rows: Iterable[dict], size: int = IMPORT_CHUNK_SIZE) -> Iterator[list[tuple[int, dict]]]:
+    numbered = enumerate(rows, start=1)
+    while chunk := list(islice(numbered, size)):
+        yield chunk
+
+
+def _clean(row: dict, fields: list[str]) -> dict:
+    return {field: str(row.get(field) or '').strip() for field in fields}
+
+
+def _bulk_insert(objects: list[tuple[int, object]], rejected: list[dict], error: str) -> int:
+    """
+    Insert (row number, instance) pairs with one bulk insert, relying on the unique constraints. If a row
+    was created concurrently by another request, fall back to one insert per row to report the conflicts.
+    """
+    if not objects:
+        return 0
+
+    model = type(objects[0][1])
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create([instance for _, instance in objects])
+        _invalidate_lookups([instance for _, instance in objects])
+        return len(objects)
+    except IntegrityError:
+        created = 0
+        for number, instance in objects:
+            try:
+                with transaction.atomic():
+                    instance.save()
+                created += 1
+            except IntegrityError:
+                rejected.append({'row': number, 'error': error})
+        return created
+
+
+def _invalidate_lookups(instances: list) -> None:
+    # bulk_create sends no post_save, so the lookup cache receivers in core/signals.py do not run. A client
+    # entry lists the client's accounts, so new accounts make their client's entry stale.
+    for instance in instances:
+        if isinstance(instance, Account):
+            lookup_cache.delete(account_key(instance.account_number))
+            lookup_cache.delete(client_key(instance.client.cpf))
+        else:
+            lookup_cache.delete(client_key(instance.cpf))
+
+
+def import_clients(rows: Iterable[dict]) -> dict:
+    """
+    Create clients from import rows, a chunk at a time: one batch CPF validation, one query for the CPFs
+    that already exist and one bulk insert per chunk. Invalid rows are reported and skipped.
+
+    Returns:
+        dict: The number of created clients and the rejected rows, with their row number and error.
+    """
+    created, rejected = 0, []
+
+    for chunk in chunks(rows):
+        cleaned = [(number, _clean(row, CLIENT_FIELDS)) for number, row in chunk]
+        valid_cpfs = are_cpfs_valid([row['cpf'] for _, row in cleaned])
+        existing = set(Client.objects.filter(cpf__in=[row['cpf'] for _, row in cleaned]).values_list('cpf', flat=True))
+
+        new_clients = []
+        for (number, row), cpf_valid in zip(cleaned, valid_cpfs):
+            if not all(row.values()):
+                error = 'All fields are required'
+            elif not cpf_valid:
+                error = 'Invalid CPF'
+            elif row['cpf'] in existing:
+                error = 'Client with this CPF already exists'
+            else:
+                try:
+                    row['birth_date'] = datetime.strptime(row['birth_date'], '%d/%m/%Y').date()
+                    error = None
+                except ValueError:
+                    error = 'Invalid birth date'
+
+            if error:
+                rejected.append({'row': number, 'error': error})
+                continue
+
+            existing.add(row['cpf'])
+            new_clients.append((number, Client(**row)))
+
+        created += _bulk_insert(new_clients, rejected, 'Client with this CPF already exists')
+
+    return {'created': created, 'rejected': rejected}
+
+
+def import_accounts(rows: Iterable[dict]) -> dict:
+    """
+    Create accounts from import rows, a chunk at a time: one query for the clients, one for the account
+    numbers that already exist and one bulk insert per chunk. Invalid rows are reported and skipped.
+
+    Returns:
+        dict: The number of created accounts and the rejected rows, with their row number and error.
+    """
+    created, rejected = 0, []
+
+    for chunk in chunks(rows):
+        cleaned = [(number, _clean(row, ACCOUNT_FIELDS)) for number, row in chunk]
+        valid_cpfs = are_cpfs_valid([row['client_cpf'] for _, row in cleaned])
+        clients = Client.objects.in_bulk([row['client_cpf'] for _, row in cleaned], field_name='cpf')
+        existing = set(Account.objects.filter(
+            account_number__in=[row['account_number'] for _, row in cleaned],
+        ).values_list('account_number', flat=True))
+
+        new_accounts = []
+        for (number, row), cpf_valid in zip(cleaned, valid_cpfs):
+            if not row['client_cpf'] or not row['account_number']:
+                error = 'Client CPF and account number are required'
+            elif not cpf_valid:
+                error = 'Invalid CPF'
+            elif row['client_cpf'] not in clients:
+                error = 'Client not found'
+            elif row['account_number'] in existing:
+                error = 'Account with this number already exists'
+            else:
+                error = None
+
+            if error:
+                rejected.append({'row': number, 'error': error})
+                continue
+
+            existing.add(row['account_number'])
+            new_accounts.append((number, Account(
+                account_number=row['account_number'],
+                agency_number=row['agency_number'] or '0001',
+                client=clients[row['client_cpf']],
+            )))
+
+        created += _bulk_insert(new_accounts, rejected, 'Account with this number already exists')
+
+    return {'created': created, 'rejected': rejected}
+
+
+IMPORTERS = {
+    'clients': import_clients,
+    'accounts': import_accounts,
+}
@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import socket
+import threading
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.metrics import registry
+from core.models import Operation, OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+OPERATION_POSTED = 'operation.posted'
+
+
+class Backpressure(Exception):
+    """
+    Raised by a sink that cannot take more events right now; the relay backs off and retries the batch.
+    """
+
+
+def outbox_settings() -> dict:
+    return {'SINK': 'core.outbox.FileSink', 'OPTIONS': {}, 'BATCH_SIZE': 500, 'POLL_INTERVAL': 1.0,
+            'MAX_BACKOFF': 30.0, 'RETENTION_HOURS': 24, **getattr(settings, 'OUTBOX', {})}
+
+
+def operation_payload(operation: Operation) -> dict:
+    return {
+        'id': operation.pk,
+        'type': operation.type,
+        'way': operation.way,
+        'amount': str(operation.amount),
+        'timestamp': operation.timestamp.isoformat(),
+        'from_account': operation.from_account.account_number if operation.from_account_id else None,
+        'to_account': operation.to_account.account_number if operation.to_account_id else None,
+    }
+
+
+def record_events(operations: list) -> None:
+    """
+    Add a posted event for each operation to the outbox, with one INSERT. Must run in the posting
+    transaction, so an event exists if and only if its operation was committed.
+    """
+    OutboxEvent.objects.bulk_create([
+        OutboxEvent(event_type=OPERATION_POSTED, payload=operation_payload(operation)) for operation in operations
+    ])
+
+
+def event_message(event: OutboxEvent) -> dict:
+    # Consumers deduplicate by id: an event can be delivered more than once.
+    return {'id': event.pk, 'type': event.event_type, 'created_at': event.created_at.isoformat(),
+            'data': event.payload}
+
+
+class MemorySink:
+    """
+    Keeps delivered messages in memory, up to capacity; used by the tests and as an example of backpressure.
+    """
+
+    def __init__(self, capacity: int | None = None):
+        self.capacity = capacity
+        self.messages = deque()
+        self.lock = threading.Lock()
+
+    def send(self, messages: list[dict]) -> None:
+        with self.lock:
+            if self.capacity is not None and len(self.messages) + len(messages) > self.capacity:
+                raise Backpressure(f'{len(self.messages)} of {self.capacity} messages waiting')
+            self.messages.extend(messages)
+
+    def take(self) -> list[dict]:
+        with self.lock:
+            messages, self.messages = list(self.messages), deque()
+        return messages
+
+    def close(self) -> None:
+        pass
+
+
+class FileSink:
+    """
+    Appends messages to a file as NDJSON, synced to disk before the batch counts as delivered.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def send(self, messages: list[dict]) -> None:
+        self.file.write(''.join(json.dumps(message) + '\n' for message in messages))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class SocketSink:
+    """
+    Writes messages as NDJSON to a TCP socket, reconnecting on the next batch after an error.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 10.0):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.socket = None
+
+    def send(self, messages: list[dict]) -> None:
+        data = ''.join(json.dumps(message) + '\n' for message in messages).encode()
+        try:
+            if self.socket is None:
+                self.socket = socket.create_connection(self.address, self.timeout)
+            self.socket.sendall(data)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+def build_sink(config: dict | None = None):
+    config = config or outbox_settings()
+    return import_string(config['SINK'])(**config.get('OPTIONS', {}))
+
+
+def deliver_batch(sink, batch_size: int) -> int:
+    """
+    Send the oldest pending events to the sink and mark them delivered. If the process stops between the
+    two, the batch is sent again: delivery is at least once.
+
+    Returns:
+        int: The number of events delivered.
+    """
+    events = list(OutboxEvent.objects.filter(delivered_at__isnull=True).order_by('pk')[:batch_size])
+    if not events:
+        return 0
+    sink.send([event_message(event) for event in events])
+    OutboxEvent.objects.filter(pk__in=[event.pk for event in events]).update(delivered_at=timezone.now())
+    registry.increment('bancodio_outbox_delivered_total', "Outbox events delivered to the sink.", len(events))
+    return len(events)
+
+
+def prune_delivered(retention: timedelta, limit: int = 5000) -> int:
+    ids = list(OutboxEvent.objects.filter(delivered_at__lt=timezone.now() - retention)
+               .order_by('delivered_at').values_list('pk', flat=True)[:limit])
+    if ids:
+        OutboxEvent.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def outbox_lag() -> tuple[int, float]:
+    """
+    The number of pending events and the age in seconds of the oldest one.
+    """
+    pending = OutboxEvent.objects.filter(delivered_at__isnull=True)
+    oldest = pending.order_by('pk').values_list('created_at', flat=True).first()
+    if oldest is None:
+        return 0, 0.0
+    return pending.count(), max(0.0, (timezone.now() - oldest).total_seconds())
+
+
+def record_outbox_lag() -> None:
+    pending, lag = outbox_lag()
+    registry.set_gauge('bancodio_outbox_pending_events', "Outbox events not delivered yet.", pending)
+    registry.set_gauge('bancodio_outbox_lag_seconds', "Age of the oldest undelivered outbox event.", lag)
+
+
+def relay(sink, batch_size: int | None = None, stop: threading.Event | None = None, once: bool = False) -> int:
+    """
+    Deliver outbox events until stop is set, or until none is pending when once is true. Full batches
+    are sent back to back; when idle the relay polls every POLL_INTERVAL seconds and prunes delivered
+    events. A failed or refused batch is retried after an exponential backoff of up to MAX_BACKOFF seconds.
+
+    Returns:
+        int: The number of events delivered.
+    """
+    config = outbox_settings()
+    batch_size = batch_size or config['BATCH_SIZE']
+    stop = stop or threading.Event()
+    retention = timedelta(hours=config['RETENTION_HOURS'])
+    delivered, backoff = 0, 0.0
+
+    while not stop.is_set():
+        try:
+            sent = deliver_batch(sink, batch_size)
+        except Exception as e:
+            backoff = min(max(backoff * 2, config['POLL_INTERVAL']), config['MAX_BACKOFF'])
+            registry.increment('bancodio_outbox_delivery_failures_total', "Outbox batches the sink refused or failed.",
+                               reason='backpressure' if isinstance(e, Backpressure) else 'error')
+            logger.warning('Outbox delivery failed', extra={'error': str(e), 'backoff': backoff},
+                           exc_info=not isinstance(e, Backpressure))
+            if once:
+                raise
+            stop.wait(backoff)
+            continue
+
+        backoff = 0.0
+        delivered += sent
+        if sent == batch_size:
+            continue
+        if once:
+            break
+        prune_delivered(retention)
+        stop.wait(config['POLL_INTERVAL'])
+
+    return delivered
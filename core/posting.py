@@ -0,0 +1,227 @@
+from collections import defaultdict, Counter
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.functions import add_cents
+from core.limits import usage_owner, resolve_limits, consume
+from core.models import Account, Operation, OperationsType, OperationsWay, BalanceSnapshot
+from core.outbox import record_events
+from core.rollups import record_rollups
+from core.statements import invalidate_statements
+from core.writer import in_writer
+
+BALANCE_SNAPSHOT_INTERVAL = getattr(settings, 'BALANCE_SNAPSHOT_INTERVAL', 100)
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def to_amount(value) -> Decimal:
+    """
+    Convert an amount received from a request (int, float, str or Decimal) to a Decimal with two places.
+    """
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def bump_version() -> dict:
+    # Extra fields for the UPDATEs that change a balance, so conditional GETs see the change.
+    return {'version': F('version') + 1, 'modified_at': timezone.now()}
+
+
+def credit(account: Account, amount: Decimal) -> None:
+    Account.objects.filter(pk=account.pk).update(balance=add_cents('balance', amount), **bump_version())
+
+
+def debit(account: Account, amount: Decimal) -> None:
+    """
+    Subtract amount from the account balance, but only if the balance covers it.
+
+    The check and the write happen in a single UPDATE, so two concurrent debits can never
+    both see the same balance.
+
+    Raises:
+        InsufficientFunds: If the balance is lower than amount.
+    """
+    updated = Account.objects.filter(pk=account.pk, balance__gte=amount).update(
+        balance=add_cents('balance', -amount), **bump_version())
+    if not updated:
+        raise InsufficientFunds(f"Insufficient funds in account {account}")
+
+
+def refresh_balances(*accounts: Account) -> None:
+    balances = dict(Account.objects.filter(pk__in=[account.pk for account in accounts]).values_list('pk', 'balance'))
+    for account in accounts:
+        account.balance = balances[account.pk]
+
+
+def normalize_operation(operation: Operation) -> None:
+    """
+    Normalize the amount and the way of a new operation and clear the account it does not use.
+
+    Raises:
+        ValueError: If the amount is not positive or a transfer is missing one of its accounts.
+    """
+    operation.amount = to_amount(operation.amount)
+    if operation.amount <= 0:
+        raise ValueError("Amount must be greater than zero.")
+
+    if operation.type == OperationsType.DEPOSIT:
+        operation.from_account = None
+        operation.way = OperationsWay.IN
+
+    elif operation.type == OperationsType.WITHDRAWAL:
+        operation.to_account = None
+        operation.way = OperationsWay.OUT
+
+    else:
+        if operation.from_account is None or operation.to_account is None:
+            raise ValueError("Both from_account and to_account must be set for transfers.")
+
+        operation.way = OperationsWay.IN_OUT
+
+
+def apply_operation(operation: Operation) -> None:
+    """
+    Apply the balance changes of a new operation. Must run inside the transaction that inserts the operation.
+
+    Transfers touch both accounts in primary key order, so the row locks taken by the UPDATEs are always
+    acquired in the same order and two opposite transfers cannot deadlock.
+
+    Raises:
+        ValueError: If the operation is invalid (see normalize_operation).
+        InsufficientFunds: If the debited account does not have enough balance.
+        LimitExceeded: If the operation exceeds the limits of the account.
+    """
+    normalize_operation(operation)
+
+    owner = usage_owner(operation.type, operation.from_account, operation.to_account)
+    limits = resolve_limits([owner])[(owner.pk, operation.type)]
+    consume(owner, operation.type, timezone.localdate(), operation.amount, limits)
+
+    if operation.type == OperationsType.DEPOSIT:
+        credit(operation.to_account, operation.amount)
+        refresh_balances(operation.to_account)
+
+    elif operation.type == OperationsType.WITHDRAWAL:
+        debit(operation.from_account, operation.amount)
+        refresh_balances(operation.from_account)
+
+    else:
+        if operation.from_account.pk < operation.to_account.pk:
+            debit(operation.from_account, operation.amount)
+            credit(operation.to_account, operation.amount)
+        else:
+            credit(operation.to_account, operation.amount)
+            debit(operation.from_account, operation.amount)
+        refresh_balances(operation.from_account, operation.to_account)
+
+
+def operation_accounts(operations: list[Operation]) -> set[int]:
+    return {account_id for operation in operations
+            for account_id in (operation.from_account_id, operation.to_account_id) if account_id is not None}
+
+
+@in_writer(operation_accounts)
+def post_operations(operations: list[Operation]) -> list[Operation]:
+    """
+    Post many new operations in a single transaction.
+
+    The balance changes are netted per account and applied with one conditional UPDATE per account,
+    in primary key order, and the operations are written with bulk inserts. Operation.save is not called.
+
+    Usage counters are checked against the daily limits per account and type; the limit per operation
+    must be checked by the caller.
+
+    Raises:
+        ValueError: If any operation is invalid (see normalize_operation).
+        InsufficientFunds: If the net debit of an account is larger than its balance. Nothing is written.
+        LimitExceeded: If the operations exceed the daily limits of an account. Nothing is written.
+    """
+    deltas = defaultdict(Decimal)
+    usage = {}
+    for operation in operations:
+        normalize_operation(operation)
+        if operation.from_account is not None:
+            deltas[operation.from_account.pk] -= operation.amount
+        if operation.to_account is not None:
+            deltas[operation.to_account.pk] += operation.amount
+
+        owner = usage_owner(operation.type, operation.from_account, operation.to_account)
+        _, count, amount = usage.get((owner.pk, operation.type), (owner, 0, Decimal('0')))
+        usage[(owner.pk, operation.type)] = (owner, count + 1, amount + operation.amount)
+
+    with transaction.atomic():
+        day = timezone.localdate()
+        limits = resolve_limits({owner for owner, _, _ in usage.values()})
+        for (owner_pk, operation_type), (owner, count, amount) in sorted(usage.items(), key=lambda item: item[0]):
+            consume(owner, operation_type, day, amount, limits[(owner_pk, operation_type)], count=count)
+
+        for account_pk in sorted(deltas):
+            delta = deltas[account_pk]
+            accounts = Account.objects.filter(pk=account_pk)
+            if delta < 0:
+                accounts = accounts.filter(balance__gte=-delta)
+            # Accounts with a zero net change still get a new version: their statement changed.
+            if not accounts.update(balance=add_cents('balance', delta), **bump_version()):
+                raise InsufficientFunds(f"Insufficient funds in account {account_pk}")
+
+        Operation.objects.bulk_create(operations)
+
+        refresh_balances(*[account for operation in operations
+                           for account in (operation.from_account, operation.to_account) if account is not None])
+        record_postings(operations)
+
+    return operations
+
+
+def record_snapshots(operations: list[Operation]) -> None:
+    """
+    Fold posted operations into the balance snapshots of their accounts.
+
+    Each account has an open snapshot per day that follows its balance until it covers
+    BALANCE_SNAPSHOT_INTERVAL operations; after that, or on the next day, a new one is opened. Replaying
+    from the nearest snapshot therefore never touches more than a day or an interval of operations.
+    """
+    last_operations = {}
+    counts = Counter()
+    for operation in operations:
+        for account in {operation.from_account, operation.to_account} - {None}:
+            last_operations[account.pk] = (account, operation)
+            counts[account.pk] += 1
+
+    for account_pk, (account, operation) in last_operations.items():
+        day = timezone.localdate(operation.timestamp)
+        fields = {'balance': account.balance, 'timestamp': operation.timestamp, 'last_operation': operation.pk}
+        updated = BalanceSnapshot.objects.filter(
+            account_id=account_pk, day=day, operation_count__lt=BALANCE_SNAPSHOT_INTERVAL,
+        ).update(operation_count=F('operation_count') + counts[account_pk], **fields)
+        if not updated:
+            BalanceSnapshot.objects.create(account_id=account_pk, day=day, operation_count=counts[account_pk], **fields)
+
+
+def record_postings(operations: list[Operation]) -> None:
+    """
+    Bookkeeping that must commit together with newly inserted operations. The account balances on the
+    operations must already be refreshed.
+    """
+    record_snapshots(operations)
+    record_rollups(operations)
+    record_events(operations)
+    invalidate_backdated(operations)
+
+
+def invalidate_backdated(operations: list[Operation]) -> None:
+    """
+    Drop the cached statement days of the accounts of operations posted on a day that is already closed,
+    once the posting transaction commits.
+    """
+    today = timezone.localdate()
+    backdated = {account_id for operation in operations if timezone.localdate(operation.timestamp) < today
+                 for account_id in (operation.from_account_id, operation.to_account_id) if account_id is not None}
+    if backdated:
+        transaction.on_commit(lambda: invalidate_statements(backdated))
@@ -0,0 +1,145 @@
+from collections import defaultdict
+from concurrent.futures import as_completed
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Iterator, NamedTuple
+
+from django.db.models import DecimalField, F, Max, Min, Sum, Value
+from django.utils import timezone
+
+from core.archive import OPERATION_MODELS
+from core.jobs import process_pool
+from core.models import Account, ReconcileRun
+
+RECONCILE_CHUNK_SIZE = 1000
+# Incremental runs also recheck accounts modified shortly before the last run started: a posting stamps the
+# account before it commits, so it can commit after the last run read the account.
+RECONCILE_OVERLAP = timedelta(minutes=5)
+
+ZERO = Value(Decimal('0'), output_field=DecimalField(decimal_places=2, max_digits=16))
+
+
+class AccountChunk(NamedTuple):
+    # A range of account primary keys, or the given keys when pks is set.
+    first: int
+    last: int
+    pks: tuple[int, ...] | None = None
+
+    def lookup(self, field: str) -> dict:
+        if self.pks is not None:
+            return {f'{field}__in': self.pks}
+        return {f'{field}__gte': self.first, f'{field}__lte': self.last}
+
+
+class Discrepancy(NamedTuple):
+    account_id: int
+    account_number: str
+    balance: Decimal
+    ledger: Decimal
+
+    @property
+    def difference(self) -> Decimal:
+        return self.balance - self.ledger
+
+
+class ChunkResult(NamedTuple):
+    accounts: int
+    discrepancies: list[Discrepancy]
+
+
+def ledger_query(chunk: AccountChunk):
+    """
+    (account, balance, credits, debits) rows of the accounts of the chunk: one row per account with its
+    balance and its opening balance as a credit, and one row per table and side with the grouped sums of the
+    operations. A single statement,
+    so the balances and the sums are read from the same snapshot even while postings go on.
+    """
+    arms = [
+        Account.objects.filter(**chunk.lookup('pk')).order_by()
+        .annotate(current=F('balance'), credits=F('opening_balance'), debits=ZERO).values_list('pk', 'current', 'credits', 'debits')
+    ]
+    for model in OPERATION_MODELS:
+        for side, credits, debits in (('to_account', Sum('amount'), ZERO), ('from_account', ZERO, Sum('amount'))):
+            arms.append(
+                model.objects.filter(**chunk.lookup(side)).order_by().values(side)
+                .annotate(current=ZERO, credits=credits, debits=debits)
+                .values_list(side, 'current', 'credits', 'debits')
+            )
+    return arms[0].union(*arms[1:], all=True)
+
+
+def check_chunk(chunk: AccountChunk) -> ChunkResult:
+    """
+    Compare the balance of every account of the chunk with its ledger: the opening balance plus credits
+    minus debits over the live and archived operations. The two must be equal.
+    """
+    balances, ledgers = defaultdict(Decimal), defaultdict(Decimal)
+    for account_id, balance, credits, debits in ledger_query(chunk):
+        balances[account_id] += balance
+        ledgers[account_id] += credits - debits
+
+    # The database may sum amounts as floating point; anything below a cent is rounding, not drift.
+    wrong = {}
+    for account_id, balance in balances.items():
+        ledger = ledgers[account_id].quantize(Decimal('0.01'))
+        if balance != ledger:
+            wrong[account_id] = (balance, ledger)
+
+    numbers = dict(Account.objects.filter(pk__in=wrong).values_list('pk', 'account_number')) if wrong else {}
+    return ChunkResult(len(balances), [
+        Discrepancy(account_id, numbers.get(account_id, ''), balance, ledger)
+        for account_id, (balance, ledger) in sorted(wrong.items())
+    ])
+
+
+def plan_chunks(since: datetime | None = None, chunk_size: int = RECONCILE_CHUNK_SIZE) -> list[AccountChunk]:
+    """
+    Split the accounts into chunks of chunk_size primary keys: every account, or only the accounts modified
+    since the instant.
+    """
+    if since is None:
+        bounds = Account.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            return []
+        return [AccountChunk(first, min(first + chunk_size - 1, bounds['last']))
+                for first in range(bounds['first'], bounds['last'] + 1, chunk_size)]
+
+    pks = list(Account.objects.filter(modified_at__gte=since).order_by('pk').values_list('pk', flat=True))
+    return [AccountChunk(pks[start], pks[min(start + chunk_size, len(pks)) - 1], tuple(pks[start:start + chunk_size]))
+            for start in range(0, len(pks), chunk_size)]
+
+
+def check_chunks(chunks: list[AccountChunk], workers: int = 1) -> Iterator[ChunkResult]:
+    """
+    Check the chunks, in a pool of worker processes when workers is more than one, yielding each result as
+    soon as it is ready.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield check_chunk(chunk)
+        return
+
+    with process_pool(workers) as pool:
+        for future in as_completed([pool.submit(check_chunk, chunk) for chunk in chunks]):
+            yield future.result()
+
+
+def reconcile(incremental: bool = False, workers: int = 1,
+              chunk_size: int = RECONCILE_CHUNK_SIZE) -> Iterator[ChunkResult]:
+    """
+    Reconcile the balances with the ledger, yielding the result of every chunk as it is checked; the run is
+    recorded in ReconcileRun once all chunks are done. An incremental run only checks the accounts modified
+    since the last finished run started, or every account if there is none.
+    """
+    started_at = timezone.now()
+    last_run = ReconcileRun.objects.filter(finished_at__isnull=False).order_by('-started_at').first()
+    since = last_run.started_at - RECONCILE_OVERLAP if incremental and last_run is not None else None
+
+    accounts = discrepancies = 0
+    for result in check_chunks(plan_chunks(since, chunk_size), workers):
+        accounts += result.accounts
+        discrepancies += len(result.discrepancies)
+        yield result
+
+    ReconcileRun.objects.create(started_at=started_at, finished_at=timezone.now(), incremental=since is not None,
+                                accounts=accounts, discrepancies=discrepancies)
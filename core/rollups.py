@@ -0,0 +1,171 @@
+from collections import defaultdict, Counter
+from itertools import product
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction, IntegrityError
+from django.db.models import Case, Count, DecimalField, F, QuerySet, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.archive import OPERATION_MODELS
+from core.functions import add_cents
+from core.models import Account, Operation, OperationsType, DailyAccountTotals, DailyAgencyTotals
+from core.statements import day_start, day_end
+
+ROLLUP_FIELDS = [
+    'deposits', 'withdrawals', 'transfers_in', 'transfers_out', 'fees', 'interest',
+    'deposit_count', 'withdrawal_count', 'transfer_in_count', 'transfer_out_count', 'fee_count', 'interest_count',
+]
+
+# (operation type, account side, amount field, count field) for every way an operation adds to a rollup.
+ROLLUP_SIDES = [
+    (OperationsType.DEPOSIT, 'to_account', 'deposits', 'deposit_count'),
+    (OperationsType.WITHDRAWAL, 'from_account', 'withdrawals', 'withdrawal_count'),
+    (OperationsType.TRANSFER, 'to_account', 'transfers_in', 'transfer_in_count'),
+    (OperationsType.TRANSFER, 'from_account', 'transfers_out', 'transfer_out_count'),
+    (OperationsType.FEE, 'from_account', 'fees', 'fee_count'),
+    (OperationsType.INTEREST, 'to_account', 'interest', 'interest_count'),
+]
+
+
+def _add(model, lookup: dict, delta: Counter) -> None:
+    """
+    Add delta to the rollup row of lookup, creating it if it does not exist yet.
+    """
+    updates = {field: add_cents(field, value) if isinstance(value, Decimal) else F(field) + value
+               for field, value in delta.items()}
+    for _ in range(2):
+        if model.objects.filter(**lookup).update(**updates):
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **delta)
+            return
+        except IntegrityError:
+            # Another posting created the row first; retry the update.
+            continue
+
+
+def record_rollups(operations: list[Operation]) -> None:
+    """
+    Add posted operations to the daily totals of their accounts and agencies, with one UPDATE per
+    (day, account) and (day, agency) touched. Must run in the posting transaction.
+    """
+    by_account, by_agency = defaultdict(Counter), defaultdict(Counter)
+    for operation in operations:
+        day = timezone.localdate(operation.timestamp)
+        for operation_type, side, amount_field, count_field in ROLLUP_SIDES:
+            account = getattr(operation, side)
+            if operation.type != operation_type or account is None:
+                continue
+            for totals in (by_account[(day, account.pk)], by_agency[(day, account.agency_number)]):
+                totals[amount_field] += operation.amount
+                totals[count_field] += 1
+
+    for (day, account_id), delta in sorted(by_account.items()):
+        _add(DailyAccountTotals, {'day': day, 'account_id': account_id}, delta)
+    for (day, agency_number), delta in sorted(by_agency.items()):
+        _add(DailyAgencyTotals, {'day': day, 'agency_number': agency_number}, delta)
+
+
+def record_batch_rollups(operations: list[Operation]) -> None:
+    """
+    record_rollups for the operations of a batch job, at most one per account, with a constant number of
+    statements for the account rows however many there are (a SELECT of the existing rows, one UPDATE per
+    day and side and one bulk INSERT) and one UPDATE per (day, agency). The caller must hold the locks of
+    the accounts, so no posting creates their rows meanwhile.
+    """
+    by_side, by_agency = defaultdict(dict), defaultdict(Counter)
+    for operation in operations:
+        day = timezone.localdate(operation.timestamp)
+        for operation_type, side, amount_field, count_field in ROLLUP_SIDES:
+            account = getattr(operation, side)
+            if operation.type != operation_type or account is None:
+                continue
+            by_side[(day, amount_field, count_field)][account.pk] = operation.amount
+            by_agency[(day, account.agency_number)].update({amount_field: operation.amount, count_field: 1})
+
+    for (day, amount_field, count_field), amounts in by_side.items():
+        existing = set(DailyAccountTotals.objects.filter(day=day, account_id__in=amounts)
+                       .values_list('account_id', flat=True))
+        if existing:
+            by_amount = defaultdict(list)
+            for account_id in existing:
+                by_amount[amounts[account_id]].append(account_id)
+            delta = Case(*[When(account_id__in=ids, then=Value(amount)) for amount, ids in by_amount.items()],
+                         output_field=DecimalField(decimal_places=2, max_digits=14))
+            DailyAccountTotals.objects.filter(day=day, account_id__in=existing).update(
+                **{amount_field: add_cents(amount_field, delta), count_field: F(count_field) + 1})
+        DailyAccountTotals.objects.bulk_create([
+            DailyAccountTotals(day=day, account_id=account_id, **{amount_field: amount, count_field: 1})
+            for account_id, amount in amounts.items() if account_id not in existing
+        ], batch_size=1000)
+
+    for (day, agency_number), delta in sorted(by_agency.items()):
+        _add(DailyAgencyTotals, {'day': day, 'agency_number': agency_number}, delta)
+
+
+def rebuild_rollups(start: date | None = None, end: date | None = None) -> tuple[int, int]:
+    """
+    Recompute the daily totals of the days from start to end (inclusive; open ends mean all days) from the
+    live and archived operations, with one aggregate query per rollup side and table, replacing the existing rows of those days.
+
+    Returns:
+        tuple[int, int]: The number of account and agency rows written.
+    """
+    tables = [model.objects.all() for model in OPERATION_MODELS]
+    account_rows = DailyAccountTotals.objects.all()
+    agency_rows = DailyAgencyTotals.objects.all()
+    if start is not None:
+        tables = [operations.filter(timestamp__gte=day_start(start)) for operations in tables]
+        account_rows, agency_rows = account_rows.filter(day__gte=start), agency_rows.filter(day__gte=start)
+    if end is not None:
+        tables = [operations.filter(timestamp__lt=day_end(end)) for operations in tables]
+        account_rows, agency_rows = account_rows.filter(day__lte=end), agency_rows.filter(day__lte=end)
+
+    by_account = defaultdict(Counter)
+    for (operation_type, side, amount_field, count_field), operations in product(ROLLUP_SIDES, tables):
+        rows = operations.filter(type=operation_type, **{f'{side}__isnull': False}).annotate(
+            day=TruncDate('timestamp'),
+        ).values_list('day', side).annotate(total=Sum('amount'), count=Count('pk')).order_by()
+        for day, account_id, total, count in rows:
+            by_account[(day, account_id)][amount_field] += total
+            by_account[(day, account_id)][count_field] += count
+
+    agencies = dict(Account.objects.filter(pk__in={account_id for _, account_id in by_account})
+                    .values_list('pk', 'agency_number'))
+    by_agency = defaultdict(Counter)
+    for (day, account_id), totals in by_account.items():
+        by_agency[(day, agencies[account_id])].update(totals)
+
+    with transaction.atomic():
+        account_rows.delete()
+        agency_rows.delete()
+        DailyAccountTotals.objects.bulk_create([
+            DailyAccountTotals(day=day, account_id=account_id, **totals)
+            for (day, account_id), totals in by_account.items()
+        ], batch_size=1000)
+        DailyAgencyTotals.objects.bulk_create([
+            DailyAgencyTotals(day=day, agency_number=agency_number, **totals)
+            for (day, agency_number), totals in by_agency.items()
+        ], batch_size=1000)
+
+    return len(by_account), len(by_agency)
+
+
+def analytics_rows(start: date, end: date, account_number: str | None = None,
+                   agency_number: str | None = None) -> QuerySet:
+    """
+    Daily totals from start to end (inclusive), oldest first: of one account, of one agency, or of every
+    agency when neither is given.
+    """
+    if account_number is not None:
+        rows = DailyAccountTotals.objects.filter(account__account_number=account_number).values(
+            'day', *ROLLUP_FIELDS, account_number=F('account__account_number'),
+        )
+    else:
+        rows = DailyAgencyTotals.objects.values('day', 'agency_number', *ROLLUP_FIELDS)
+        if agency_number is not None:
+            rows = rows.filter(agency_number=agency_number)
+    return rows.filter(day__gte=start, day__lte=end).order_by('day', 'pk')
@@ -0,0 +1,134 @@
+import logging
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from core.metrics import registry
+from core.models import Operation
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Database alias for reads in the current request, set by replica_reads; None means the primary.
+_read_alias = ContextVar('read_alias', default=None)
+
+
+class ReadReplicaRouter:
+    """
+    Send reads to the alias chosen by replica_reads for the current request, and everything else, including
+    every write, to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are copies of the primary, so objects from any of them can be related.
+        return True
+
+
+def is_pinned(request) -> bool:
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def choose_read_alias(request) -> str | None:
+    """
+    A random replica from DATABASE_REPLICAS, or None (the primary) when there are none or the client wrote
+    within the last READ_YOUR_WRITES_WINDOW seconds.
+    """
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    if not replicas:
+        return None
+
+    alias, reason = (None, 'pinned') if is_pinned(request) else (random.choice(replicas), 'replica')
+    registry.increment('bancodio_db_read_routing_total', 'Read requests by database alias and reason.',
+                       alias=alias or 'default', reason=reason)
+    logger.debug('Read routed', extra={'path': request.path, 'alias': alias or 'default', 'reason': reason})
+    return alias
+
+
+def replica_reads(view):
+    """
+    Run the reads of a view, sync or async, on a replica (see choose_read_alias).
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _read_alias.set(choose_read_alias(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _read_alias.set(choose_read_alias(request))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+def pin_to_primary(request, response):
+    # A successful write pins the client's reads to the primary until its write has reached the replicas.
+    window = getattr(settings, 'READ_YOUR_WRITES_WINDOW', 5)
+    if request.method not in SAFE_METHODS and response.status_code < 400 and window:
+        response.set_cookie(PIN_COOKIE, str(time.time() + window), max_age=window, httponly=True, samesite='Lax')
+    return response
+
+
+class PrimaryPinMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return pin_to_primary(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return pin_to_primary(request, await self.get_response(request))
+
+
+def replica_lag(alias: str) -> float | None:
+    """
+    How far behind the primary a replica is, in seconds: the age of its latest operation compared with
+    the primary's latest, or None if either has no operations.
+    """
+    latest = [
+        Operation.objects.using(db).order_by('-pk').values_list('timestamp', flat=True).first()
+        for db in ('default', alias)
+    ]
+    if None in latest:
+        return None
+    return max(0.0, (latest[0] - latest[1]).total_seconds())
+
+
+def record_replica_lag() -> None:
+    for alias in getattr(settings, 'DATABASE_REPLICAS', []):
+        lag = replica_lag(alias)
+        if lag is not None:
+            registry.set_gauge('bancodio_db_replica_lag_seconds',
+                               "Age of a replica's latest operation compared with the primary's.", lag, alias=alias)
+            if lag > getattr(settings, 'READ_YOUR_WRITES_WINDOW', 5):
+                logger.warning('Replica lag exceeds the read-your-writes window', extra={'alias': alias, 'lag': lag})
@@ -0,0 +1,72 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core.cache import lookup_cache, account_key, client_key
+from core.models import Account, Client, Operation, Deposit, Withdrawal, Transfer, ArchivedOperation
+from core.posting import bump_version
+from core.statements import invalidate_statements
+
+
+@receiver(pre_save, sender=Account)
+def invalidate_previous_account(sender, instance, **kwargs):
+    # An edit can change the account number or the client: drop the entries under the previous values too.
+    if instance.pk is None:
+        return
+    previous = Account.objects.filter(pk=instance.pk).values_list('account_number', 'client__cpf').first()
+    if previous is not None:
+        account_number, client_cpf = previous
+        lookup_cache.delete(account_key(account_number))
+        lookup_cache.delete(client_key(client_cpf))
+
+
+@receiver([post_save, post_delete], sender=Account)
+def invalidate_account(sender, instance, signal, **kwargs):
+    lookup_cache.delete(account_key(instance.account_number))
+    if signal is post_save:
+        # Activation and edits change the account's responses too.
+        Account.objects.filter(pk=instance.pk).update(**bump_version())
+    # The client entry lists the client's accounts.
+    if Account.client.is_cached(instance):
+        client_cpf = instance.client.cpf
+    else:
+        client_cpf = Client.objects.filter(pk=instance.client_id).values_list('cpf', flat=True).first()
+    if client_cpf is not None:
+        lookup_cache.delete(client_key(client_cpf))
+
+
+@receiver(pre_save, sender=Client)
+def invalidate_previous_client(sender, instance, **kwargs):
+    # The client entry is keyed by CPF, so a CPF change leaves the old entry behind.
+    if instance.pk is None:
+        return
+    previous_cpf = Client.objects.filter(pk=instance.pk).values_list('cpf', flat=True).first()
+    if previous_cpf is not None and previous_cpf != instance.cpf:
+        lookup_cache.delete(client_key(previous_cpf))
+
+
+@receiver([post_save, post_delete], sender=Client)
+def invalidate_client(sender, instance, signal, **kwargs):
+    lookup_cache.delete(client_key(instance.cpf))
+    # Account entries carry the client name and CPF.
+    accounts = Account.objects.filter(client_id=instance.pk)
+    for account_number in accounts.values_list('account_number', flat=True):
+        lookup_cache.delete(account_key(account_number))
+    if signal is post_save:
+        accounts.update(**bump_version())
+
+
+def invalidate_operation_statements(sender, instance, created=False, **kwargs):
+    # Corrections of posted or archived operations; new postings are handled by the posting path.
+    if created:
+        return
+    account_ids = {instance.from_account_id, instance.to_account_id} - {None}
+    Account.objects.filter(pk__in=account_ids).update(**bump_version())
+    transaction.on_commit(lambda: invalidate_statements(account_ids))
+
+
+# Connected per model, proxies included: a receiver without a sender would make every bulk delete of any
+# model fetch its rows to send post_delete.
+for model in (Operation, Deposit, Withdrawal, Transfer, ArchivedOperation):
+    post_save.connect(invalidate_operation_statements, sender=model)
+    post_delete.connect(invalidate_operation_statements, sender=model)
@@ -0,0 +1,309 @@
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as day_time
+from decimal import Decimal
+from itertools import groupby
+
+from django.conf import settings
+from django.http import QueryDict
+
+from django.db.models import Q, Case, When, F, Sum, Value, DecimalField, QuerySet
+from django.utils import timezone
+
+from core.archive import OPERATION_MODELS
+from core.cache import build_cache
+from core.functions import encode_cursor, decode_cursor
+from core.models import Account, Operation
+
+CLOSED_DAY_GRACE = timedelta(minutes=5)
+
+# Rendered statement lines of closed days, by account and day (see day_blocks).
+statement_cache = build_cache(getattr(settings, 'STATEMENT_CACHE', {}), 'statement')
+
+
+def day_start(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, day_time.min))
+
+
+def day_end(day: date) -> datetime:
+    return day_start(day + timedelta(days=1))
+
+
+def account_operations(account: Account, start: datetime | None = None, end: datetime | None = None,
+                       model=Operation) -> QuerySet:
+    """
+    Operations that moved money in or out of the account, oldest first, with both accounts joined in.
+
+    Parameters:
+        account (Account): The account of the statement.
+        start (datetime | None): Only operations at or after this instant.
+        end (datetime | None): Only operations before this instant.
+        model: The table to read, Operation or ArchivedOperation.
+    """
+    operations = model.objects.filter(Q(from_account=account) | Q(to_account=account))
+    if start is not None:
+        operations = operations.filter(timestamp__gte=start)
+    if end is not None:
+        operations = operations.filter(timestamp__lt=end)
+    return operations.select_related('from_account', 'to_account').order_by('timestamp', 'pk')
+
+
+def after(operations: QuerySet, timestamp: datetime, pk: int | None = None) -> QuerySet:
+    """
+    Keyset filter: operations that sort after (timestamp, pk) in account_operations order. Without pk,
+    operations after timestamp.
+    """
+    if pk is None:
+        return operations.filter(timestamp__gt=timestamp)
+    return operations.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk))
+
+
+def up_to(operations: QuerySet, timestamp: datetime, pk: int | None = None) -> QuerySet:
+    """
+    Keyset filter: operations that sort at or before (timestamp, pk). Without pk, operations up to timestamp.
+    """
+    if pk is None:
+        return operations.filter(timestamp__lte=timestamp)
+    return operations.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lte=pk))
+
+
+def signed_amount(account: Account) -> Case:
+    """
+    Expression for the effect of an operation on the account balance: positive when money comes in,
+    negative when it goes out and zero for a transfer to the account itself.
+    """
+    return Case(
+        When(from_account=account, to_account=account, then=Value(Decimal('0'))),
+        When(to_account=account, then=F('amount')),
+        default=-F('amount'),
+        output_field=DecimalField(decimal_places=2, max_digits=10),
+    )
+
+
+def operation_effect(account: Account, operation: Operation) -> Decimal:
+    if operation.from_account_id == operation.to_account_id:
+        return Decimal('0')
+    return operation.amount if operation.to_account_id == account.pk else -operation.amount
+
+
+def sum_effects(account: Account, windows: list[QuerySet]) -> Decimal:
+    """
+    Total effect on the account balance of the operations of windows, one queryset per table, summed in a
+    single statement so an operation being archived meanwhile is counted exactly once.
+    """
+    totals = [
+        window.order_by().annotate(group=Value(1)).values('group')
+        .annotate(total=Sum(signed_amount(account))).values_list('total', flat=True)
+        for window in windows
+    ]
+    return sum((total or Decimal('0') for total in totals[0].union(*totals[1:], all=True)), Decimal('0'))
+
+
+def balance_at(account: Account, timestamp: datetime, pk: int | None = None) -> Decimal:
+    """
+    Balance of the account once every operation up to (timestamp, pk) was posted.
+
+    Starts from the nearest balance snapshot and replays only the operations between it and the requested
+    point, so the cost depends on the snapshot interval instead of the account history. Without any
+    earlier snapshot, it replays backwards from the next snapshot or from the current balance.
+    """
+    tables = [model.objects.filter(Q(from_account=account) | Q(to_account=account)) for model in OPERATION_MODELS]
+    snapshots = account.snapshots.order_by('timestamp', 'last_operation')
+
+    if pk is None:
+        previous = snapshots.filter(timestamp__lte=timestamp).last()
+    else:
+        previous = snapshots.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, last_operation__lte=pk)).last()
+
+    if previous is not None:
+        windows = [up_to(after(operations, previous.timestamp, previous.last_operation), timestamp, pk)
+                   for operations in tables]
+        return previous.balance + sum_effects(account, windows)
+
+    following = snapshots.first()
+    windows = [after(operations, timestamp, pk) for operations in tables]
+    if following is None:
+        return account.balance - sum_effects(account, windows)
+    return following.balance - sum_effects(account, [up_to(window, following.timestamp, following.last_operation)
+                                                      for window in windows])
+
+
+def balance_before(account: Account, operation: Operation) -> Decimal:
+    """
+    Balance of the account right before the operation was posted.
+    """
+    # Primary keys are integers, so "up to pk - 1" is "strictly before the operation" within its timestamp.
+    return balance_at(account, operation.timestamp, operation.pk - 1)
+
+
+def statement_line(account: Account, operation: Operation, balance: Decimal) -> dict:
+    """
+    Serialize an operation as a statement line of the account, with the balance right after it.
+    """
+    line = {
+        'time': timezone.localtime(operation.timestamp).strftime('%H:%M:%S'),
+        'type': operation.get_type_display(),
+        'way': operation.get_way_display(),
+        'amount': f'R${float(operation.amount):.2f}',
+        'balance': f'R${float(balance):.2f}',
+    }
+    if operation.from_account_id != account.pk and operation.from_account_id is not None:
+        line['from_account'] = operation.from_account.account_number
+    if operation.to_account_id != account.pk and operation.to_account_id is not None:
+        line['to_account'] = operation.to_account.account_number
+    return line
+
+
+def statement_query(account: Account, params: QueryDict, page_size: int,
+                    max_page_size: int) -> tuple[list[QuerySet], int]:
+    """
+    Build the statement query from the request parameters: from/to dates, limit and cursor.
+
+    Returns:
+        tuple[list[QuerySet], int]: The operations after the cursor, oldest first, one queryset per table
+            (live and archive), and the page size.
+
+    Raises:
+        ValueError: With the message to return to the client if a parameter is invalid.
+    """
+    try:
+        start = day_start(date.fromisoformat(params['from'])) if 'from' in params else None
+        end = day_end(date.fromisoformat(params['to'])) if 'to' in params else None
+        limit = int(params.get('limit', page_size))
+    except ValueError:
+        raise ValueError('Invalid query parameters')
+
+    if not 0 < limit <= max_page_size:
+        raise ValueError(f'Limit must be between 1 and {max_page_size}')
+
+    operations = [account_operations(account, start, end, model) for model in OPERATION_MODELS]
+
+    if 'cursor' in params:
+        key = decode_cursor(params['cursor'])
+        try:
+            operations = [after(table, datetime.fromisoformat(key[0]), int(key[1])) for table in operations]
+        except (TypeError, ValueError, IndexError):
+            raise ValueError('Invalid cursor')
+
+    return operations, limit
+
+
+def is_closed(day: date) -> bool:
+    """
+    Whether no more operations can be posted on the day. A grace period covers postings that started
+    before midnight and commit after it.
+    """
+    return day_end(day) + CLOSED_DAY_GRACE <= timezone.now()
+
+
+def _generation_key(account_id: int) -> str:
+    return f'statement-generation:{account_id}'
+
+
+def invalidate_statements(account_ids) -> None:
+    """
+    Drop the cached days of the accounts' statements, after a correction or a backdated operation, by
+    moving them to a new generation. Call it once the change is committed.
+    """
+    for account_id in account_ids:
+        statement_cache.set(_generation_key(account_id), time.time_ns())
+
+
+def day_blocks(account: Account, days: list[date], generation: int,
+               refresh: bool = False) -> dict[date, dict[int, tuple[dict, str]]]:
+    """
+    The statement lines of every operation of closed days, with the balance after each, by day and then by
+    operation primary key. The blocks the cache cannot serve are built together, with one scan from the
+    first to the last of them and one balance lookup, however many days they span, then cached.
+
+    Parameters:
+        days (list[date]): Closed days, oldest first.
+        refresh (bool): Rebuild every block instead of reading the cache.
+    """
+    keys = {day: f'statement:{account.pk}:{generation}:{day.isoformat()}' for day in days}
+    blocks = {} if refresh else {day: statement_cache.get(key) for day, key in keys.items()}
+    missing = [day for day in days if blocks.get(day) is None]
+    if missing:
+        operations = sorted({
+            operation.pk: operation for model in OPERATION_MODELS
+            for operation in account_operations(account, day_start(missing[0]), day_end(missing[-1]), model)
+        }.values(), key=lambda operation: (operation.timestamp, operation.pk))
+        balance = balance_before(account, operations[0]) if operations else Decimal('0')
+        built = {day: {} for day in missing}
+        # Operations of cached days in between are replayed too, to carry the balance across them.
+        for operation in operations:
+            balance += operation_effect(account, operation)
+            block = built.get(timezone.localdate(operation.timestamp))
+            if block is not None:
+                block[operation.pk] = (statement_line(account, operation, balance), str(balance))
+        for day, block in built.items():
+            statement_cache.set(keys[day], block)
+        blocks.update(built)
+    return blocks
+
+
+def statement_page(account: Account, operations: QuerySet, limit: int) -> dict:
+    """
+    A page of the statement, grouped by day, with the running balance on each line.
+
+    Only the keys of the page are queried, from the live and archive tables in one statement. Lines of
+    closed days come from the cached day blocks, the missing ones built together; the operations of the current day (and of any day the
+    cache could not serve) are fetched and rendered, continuing from the balance of the line before them.
+
+    Parameters:
+        account (Account): The account of the statement.
+        operations (list[QuerySet]): The operations of the statement after the cursor, oldest first, one
+            queryset per table, as built by statement_query.
+        limit (int): The page size.
+    """
+    tables = [table.order_by().values_list('timestamp', 'pk') for table in operations]
+    keys = list(tables[0].union(*tables[1:], all=True).order_by('timestamp', 'pk')[:limit + 1])
+    next_cursor = encode_cursor(keys[limit - 1][0].isoformat(), keys[limit - 1][1]) if len(keys) > limit else None
+    keys = keys[:limit]
+
+    generation = statement_cache.get(_generation_key(account.pk)) or 0
+    page_days = [(day, [pk for _, pk in day_keys])
+                 for day, day_keys in groupby(keys, key=lambda item: timezone.localdate(item[0]))]
+    blocks = day_blocks(account, [day for day, _ in page_days if is_closed(day)], generation)
+    # A cached block without some of the page's operations is stale (e.g. a late commit); rebuild those.
+    stale = [day for day, pks in page_days if day in blocks and not all(pk in blocks[day] for pk in pks)]
+    if stale:
+        blocks.update(day_blocks(account, stale, generation, refresh=True))
+
+    lines = {}
+    open_pks = []
+    for day, pks in page_days:
+        block = blocks.get(day)
+        if block is not None and all(pk in block for pk in pks):
+            lines.update((pk, block[pk]) for pk in pks)
+        else:
+            open_pks.extend(pks)
+
+    if open_pks:
+        fetched, missing = [], set(open_pks)
+        for model in OPERATION_MODELS:
+            # Almost always found in the live table; the archive is read only for what was moved there.
+            if missing:
+                fetched += model.objects.filter(pk__in=missing).select_related('from_account', 'to_account')
+                missing -= {operation.pk for operation in fetched}
+        fetched.sort(key=lambda operation: (operation.timestamp, operation.pk))
+        positions = {pk: position for position, (_, pk) in enumerate(keys)}
+        for operation in fetched:
+            position = positions[operation.pk]
+            previous = lines.get(keys[position - 1][1]) if position else None
+            balance = Decimal(previous[1]) if previous else balance_before(account, operation)
+            balance += operation_effect(account, operation)
+            lines[operation.pk] = (statement_line(account, operation, balance), str(balance))
+
+    statement_data = []
+    for timestamp, pk in keys:
+        date_formatted = timezone.localtime(timestamp).strftime('%d/%m/%Y')
+        if not statement_data or statement_data[-1]['date'] != date_formatted:
+            statement_data.append({'date': date_formatted, 'operations': []})
+        statement_data[-1]['operations'].append(lines[pk][0])
+
+    return {
+        'statement': statement_data,
+        'balance': f'R${float(account.balance):.2f}',
+        'next_cursor': next_cursor,
+    }
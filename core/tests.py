@@ -1,3 +1,1151 @@
-from django.test import TestCase
+import atexit
+import io
+import json
+import logging
+import random
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, models, router, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, Client as TestClient, override_settings
+from django.utils import timezone
+
+from core.archive import archive_cutoff, archive_operations
+from core.benchmarks import add_operations, make_cpf, query_growth, run_benchmarks, seed
+from core.cache import DjangoCache, get_account_info, get_client_info, lookup_cache
+from core.functions import are_cpfs_valid, is_cpf_valid
+from core.idempotency import result_cache
+from core.jobs import BATCH_JOBS, plan_slices, run_batch_job, run_chunk
+from core.limits import LimitExceeded, Limits, consume, resolve_limits
+from core.log import QueueLogHandler
+from core.metrics import registry
+from core.onboarding import _bulk_insert
+from core.outbox import Backpressure, MemorySink, relay
+from core.models import Account, ArchivedOperation, Client, Deposit, Operation, OperationsType, OperationsWay, \
+    Withdrawal, DailyAccountTotals, DailyAgencyTotals, DailyUsage, IdempotencyKey, ReconcileRun, OutboxEvent, \
+    OperationLimit
+from core.posting import InsufficientFunds, bump_version, post_operations
+from core.reconcile import reconcile
+from core.rollups import rebuild_rollups
+from core.routers import PIN_COOKIE, replica_reads
+from core.statements import balance_at, balance_before, day_end, day_start, statement_cache
+from core.writer import get_writer
+
+
+def legacy_post(operation_type, amount, from_account_id=None, to_account_id=None):
+    # Read-modify-write path of Operation.save and make_withdrawal before the posting engine, kept only as
+    # a baseline: autocommitted account saves, the daily COUNT query and the operation insert.
+    from_account = Account.objects.get(pk=from_account_id) if from_account_id else None
+    to_account = Account.objects.get(pk=to_account_id) if to_account_id else None
+    if operation_type == OperationsType.WITHDRAWAL:
+        Withdrawal.objects.filter(from_account=from_account, timestamp__date=timezone.localdate()).count()
+    if from_account is not None:
+        from_account.balance -= amount
+        from_account.save()
+    if to_account is not None:
+        to_account.balance += amount
+        to_account.save()
+    models.Model.save(Operation(
+        type=operation_type, way=OperationsWay.IN, amount=amount, from_account=from_account, to_account=to_account,
+    ))
+
+
+def engine_post(operation_type, amount, from_account_id=None, to_account_id=None):
+    Operation(
+        type=operation_type,
+        amount=amount,
+        from_account=Account.objects.get(pk=from_account_id) if from_account_id else None,
+        to_account=Account.objects.get(pk=to_account_id) if to_account_id else None,
+    ).save()
+
+
+def create_client(name: str, cpf: str = '52998224725', **fields) -> Client:
+    return Client.objects.create(**{
+        'name': name, 'birth_date': date(1990, 1, 1), 'cpf': cpf, 'street_address': 'Rua A', 'street_number': '1',
+        'neighborhood': 'Centro', 'city': 'Rio de Janeiro', 'state_code': 'RJ', **fields,
+    })
+
+
+class PostingStressTest(TransactionTestCase):
+    threads = 8
+    operations_per_thread = 250
+    hot_accounts = 4
+    initial_balance = Decimal('1000.00')
+
+    def setUp(self):
+        client = create_client('Stress')
+        self.account_ids = [
+            Account.objects.create(account_number=f'hot-{i}', client=client, balance=self.initial_balance).pk
+            for i in range(self.hot_accounts)
+        ]
+
+    def run_workload(self, post, seed):
+        deltas = [dict.fromkeys(self.account_ids, Decimal('0')) for _ in range(self.threads)]
+        errors = []
+
+        def worker(index):
+            rng = random.Random(seed + index)
+            delta = deltas[index]
+            try:
+                for _ in range(self.operations_per_thread):
+                    kind = rng.choice([OperationsType.DEPOSIT, OperationsType.WITHDRAWAL, OperationsType.TRANSFER])
+                    from_id, to_id = rng.sample(self.account_ids, 2)
+                    amount = Decimal(rng.randint(1, 5000)) / 100
+                    try:
+                        if kind == OperationsType.DEPOSIT:
+                            post(kind, amount, to_account_id=to_id)
+                            delta[to_id] += amount
+                        elif kind == OperationsType.WITHDRAWAL:
+                            post(kind, amount, from_account_id=from_id)
+                            delta[from_id] -= amount
+                        else:
+                            post(kind, amount, from_account_id=from_id, to_account_id=to_id)
+                            delta[from_id] -= amount
+                            delta[to_id] += amount
+                    except (InsufficientFunds, LimitExceeded):
+                        pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(self.threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(errors, [])
+        expected = {
+            account_id: self.initial_balance + sum(delta[account_id] for delta in deltas)
+            for account_id in self.account_ids
+        }
+        return expected, self.threads * self.operations_per_thread / elapsed
+
+    def stored_balances(self) -> dict:
+        # The values as stored, before the model field rounds them to cents.
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, balance FROM core_account')
+            return {pk: Decimal(str(balance)) for pk, balance in cursor.fetchall()}
+
+    def test_concurrent_postings_keep_exact_balances(self):
+        expected, _ = self.run_workload(engine_post, seed=1)
+
+        balances = dict(Account.objects.values_list('pk', 'balance'))
+        self.assertEqual(balances, expected)
+        self.assertEqual(self.stored_balances(), expected)
+        self.assertTrue(all(balance >= 0 for balance in balances.values()))
+
+    def test_fractional_amounts_do_not_drift(self):
+        account = Account.objects.get(pk=self.account_ids[0])
+        Account.objects.filter(pk=account.pk).update(balance=0)
+        for amount in ('0.10', '0.20'):
+            Operation(type=OperationsType.DEPOSIT, amount=amount, to_account=account).save()
+        self.assertEqual(self.stored_balances()[account.pk], Decimal('0.3'))
+
+        Operation(type=OperationsType.WITHDRAWAL, amount='0.10', from_account=account).save()
+        # Compared with the stored balance: 0.30 - 0.10 must cover exactly 0.20.
+        post_operations([Operation(type=OperationsType.WITHDRAWAL, amount='0.20', from_account=account)])
+        self.assertEqual(self.stored_balances()[account.pk], Decimal('0'))
+        usage = DailyUsage.objects.get(account=account, operation_type=OperationsType.WITHDRAWAL)
+        self.assertEqual((usage.count, Decimal(str(usage.amount))), (2, Decimal('0.30')))
+
+    @override_settings(POSTING_WRITER={'ENABLED': True, 'BATCH_SIZE': 64})
+    def test_writer_queue_keeps_exact_balances(self):
+        expected, _ = self.run_workload(engine_post, seed=3)
+
+        balances = dict(Account.objects.values_list('pk', 'balance'))
+        self.assertEqual(balances, expected)
+        self.assertLess(get_writer().batches, get_writer().operations)
+
+    @override_settings(POSTING_WRITER={'ENABLED': True, 'LANES': 3, 'BATCH_SIZE': 64})
+    def test_writer_lanes_keep_exact_balances(self):
+        expected, _ = self.run_workload(engine_post, seed=4)
+
+        balances = dict(Account.objects.values_list('pk', 'balance'))
+        self.assertEqual(balances, expected)
+        self.assertTrue(all(lane.operations for lane in get_writer().lanes))
+
+    def test_throughput_not_worse_than_legacy_path(self):
+        _, legacy_rate = self.run_workload(legacy_post, seed=2)
+        Account.objects.update(balance=self.initial_balance)
+        _, engine_rate = self.run_workload(engine_post, seed=2)
+
+        # Allow for scheduler noise; the engine should be in the same range or faster.
+        self.assertGreaterEqual(engine_rate, legacy_rate * 0.8)
+
+
+
+class OperationRequestTest(TransactionTestCase):
+    def setUp(self):
+        client = create_client('Request')
+        self.first = Account.objects.create(account_number='req-1', client=client, balance=100)
+        self.second = Account.objects.create(account_number='req-2', client=client)
+
+    def post(self, path, data):
+        response = TestClient().post(path, json.dumps(data), content_type='application/json')
+        return response.status_code, json.loads(response.content)
+
+    def test_amounts_are_validated_as_posted(self):
+        for path in ('/core/deposit/', '/core/async/deposit/'):
+            for amount, error in [(0.001, 'Amount must be greater than zero'), ('abc', 'Amount must be a number'),
+                                  ([1], 'Amount must be a number'), (True, 'Amount must be greater than zero')]:
+                with self.subTest(path=path, amount=amount):
+                    self.assertEqual(self.post(path, {'to_account': 'req-2', 'amount': amount}), (400, {'error': error}))
+
+        status, _ = self.post('/core/withdrawal/', {'from_account': 'req-1', 'amount': '10.005'})
+        self.assertEqual(status, 201)
+        self.assertEqual(Account.objects.get(pk=self.first.pk).balance, Decimal('90.00'))
+
+        status, data = self.post('/core/operations/batch/', {'atomic': False, 'operations': [
+            {'type': 'deposit', 'to_account': 'req-2', 'amount': 0.001},
+            {'type': 'deposit', 'to_account': 'req-2', 'amount': 'abc'},
+        ]})
+        self.assertEqual(status, 201)
+        self.assertEqual([result['error'] for result in data['results']],
+                         ['Amount must be greater than zero', 'Amount must be a number'])
+        self.assertEqual(Operation.objects.count(), 1)
+
+    def test_activation_keeps_concurrent_postings(self):
+        stale = Account.objects.get(pk=self.first.pk)
+        Operation(type=OperationsType.DEPOSIT, amount=50, to_account=self.first).save()
+
+        for path in ('/core/account/inactivate/req-1/', '/core/account/activate/req-1/'):
+            # The view reads the account before the deposit commits.
+            with mock.patch('core.views.Account') as model:
+                model.objects.filter.return_value.first.return_value = stale
+                self.assertEqual(TestClient().post(path).status_code, 200)
+            account = Account.objects.get(pk=self.first.pk)
+            self.assertEqual((account.is_active, account.balance), (path.endswith('/activate/req-1/'), Decimal('150.00')))
+
+    def test_batch_modes(self):
+        operations = [
+            {'type': 'transfer', 'from_account': 'req-1', 'to_account': 'req-2', 'amount': 60},
+            {'type': 'withdrawal', 'from_account': 'req-1', 'amount': 60},
+            {'type': 'deposit', 'to_account': 'req-2', 'amount': 5},
+        ]
+
+        status, data = self.post('/core/operations/batch/', {'operations': operations})
+        self.assertEqual((status, data['error'], data['rejected']), (400, 'Batch rejected', 1))
+        self.assertEqual(Operation.objects.count(), 0)
+
+        # Per item, the withdrawal sees the balance left by the transfer before it.
+        status, data = self.post('/core/operations/batch/', {'atomic': False, 'operations': operations})
+        self.assertEqual((status, data['posted'], data['rejected']), (201, 2, 1))
+        self.assertEqual(data['results'], [
+            {'index': 0, 'status': 'posted'},
+            {'index': 1, 'status': 'rejected', 'error': 'Insufficient funds'},
+            {'index': 2, 'status': 'posted'},
+        ])
+        self.assertEqual(dict(Account.objects.values_list('account_number', 'balance')),
+                         {'req-1': Decimal('40.00'), 'req-2': Decimal('65.00')})
+
+        for data in [{}, {'operations': []}, {'operations': ['deposit']},
+                     {'operations': [{'type': 'loan', 'to_account': 'req-2', 'amount': 5}]},
+                     {'operations': [{'type': 'deposit', 'to_account': 'req-9', 'amount': 5}]}]:
+            with self.subTest(data=data):
+                self.assertEqual(self.post('/core/operations/batch/', data)[0], 400)
+        self.assertEqual(Operation.objects.count(), 2)
+
+    def test_batch_items_are_validated_like_single_operations(self):
+        Account.objects.create(account_number='None', client=self.first.client)
+        status, data = self.post('/core/operations/batch/', {'atomic': False, 'operations': [
+            {'type': 'deposit', 'to_account': 'req-2', 'amount': '10.50'},
+            {'type': 'deposit', 'amount': 5},
+            {'type': 'deposit', 'to_account': ['req-2'], 'amount': 5},
+            {'type': 'transfer', 'from_account': {'n': 1}, 'to_account': 'req-2', 'amount': 5},
+            {'type': 'deposit', 'to_account': True, 'amount': 5},
+        ]})
+        self.assertEqual(status, 201)
+        self.assertEqual([result.get('error') for result in data['results']],
+                         [None] + ['Invalid request data'] * 4)
+        self.assertEqual(dict(Account.objects.values_list('account_number', 'balance')),
+                         {'req-1': Decimal('100.00'), 'req-2': Decimal('10.50'), 'None': Decimal('0.00')})
+
+    def test_batch_limits_and_concurrent_changes(self):
+        Account.objects.filter(pk=self.first.pk).update(balance=2000)
+        status, data = self.post('/core/operations/batch/', {'atomic': False, 'operations': [
+            {'type': 'withdrawal', 'from_account': 'req-1', 'amount': 600},
+            *[{'type': 'withdrawal', 'from_account': 'req-1', 'amount': 10}] * 4,
+        ]})
+        self.assertEqual((status, data['posted']), (201, 3))
+        self.assertEqual([result.get('error') for result in data['results']], [
+            'Withdrawal amount exceeds limit of 500', None, None, None, 'Withdrawal limit exceeded for today',
+        ])
+        self.assertEqual(DailyUsage.objects.get(account=self.first, operation_type=OperationsType.WITHDRAWAL).count, 3)
+
+        # Balances or usage changed between the checks and the posting: nothing is posted.
+        batch = {'operations': [{'type': 'deposit', 'to_account': 'req-2', 'amount': 5}]}
+        for error in (InsufficientFunds(), LimitExceeded('Deposit limit exceeded for today')):
+            with self.subTest(error=error), mock.patch('core.views.post_operations', side_effect=error):
+                status, data = self.post('/core/operations/batch/', batch)
+                self.assertEqual(status, 409)
+        self.assertEqual(Operation.objects.count(), 3)
+
+
+
+class LookupCacheTest(TransactionTestCase):
+    def setUp(self):
+        lookup_cache.clear()
+        self.client_record = create_client('Cache')
+        self.account = Account.objects.create(account_number='cache-1', client=self.client_record)
+
+    def test_entries_are_served_from_cache(self):
+        self.assertEqual(get_account_info('cache-1')['client_name'], 'Cache')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_account_info('cache-1')['client_name'], 'Cache')
+            self.assertEqual(get_client_info('52998224725')['accounts'], [f'{self.account.agency_number} - cache-1'])
+            self.assertEqual(get_client_info('52998224725')['name'], 'Cache')
+        # Only the client miss reached the database.
+        self.assertEqual(len(queries), 2)
+
+    def test_shared_cache_clear_is_scoped(self):
+        backend = caches['default']
+        backend.set('other-app', 'kept')
+        lookups, statements = DjangoCache('default', prefix='lookup'), DjangoCache('default', prefix='statement')
+        lookups.set('account:1', {'pk': 1})
+        statements.set('account:1', 'lines')
+
+        # Another process with the same prefix sees the clear, and only this cache's entries are dropped.
+        DjangoCache('default', prefix='lookup').clear()
+        self.assertIsNone(lookups.get('account:1'))
+        self.assertEqual(statements.get('account:1'), 'lines')
+        self.assertEqual(backend.get('other-app'), 'kept')
+
+        lookups.set('account:1', {'pk': 2})
+        self.assertEqual(lookups.get('account:1'), {'pk': 2})
+        self.assertEqual(lookups.stats(), {'hits': 1, 'misses': 1})
+
+    def test_changes_invalidate_entries(self):
+        get_account_info('cache-1')
+        get_client_info('52998224725')
+
+        self.client_record.name = 'Renamed'
+        self.client_record.save()
+        self.assertEqual(get_account_info('cache-1')['client_name'], 'Renamed')
+        self.assertEqual(get_client_info('52998224725')['name'], 'Renamed')
+
+        other = Account.objects.create(account_number='cache-2', client=self.client_record)
+        self.assertEqual(len(get_client_info('52998224725')['accounts']), 2)
+        other.delete()
+        self.assertIsNone(get_account_info('cache-2'))
+        self.assertEqual(len(get_client_info('52998224725')['accounts']), 1)
+
+        # Entries under the previous CPF and account number must not survive the change.
+        self.client_record.cpf = '11144477735'
+        self.client_record.save()
+        self.assertIsNone(get_client_info('52998224725'))
+        self.assertEqual(get_account_info('cache-1')['client_cpf'], '11144477735')
+
+        self.account.account_number = 'cache-3'
+        self.account.save()
+        self.assertIsNone(get_account_info('cache-1'))
+        self.assertEqual(get_client_info('11144477735')['accounts'], [f'{self.account.agency_number} - cache-3'])
+
+
+
+class BalanceSnapshotTest(TransactionTestCase):
+    def setUp(self):
+        self.account = Account.objects.create(account_number='snap-1', client=create_client('Snapshot'))
+        self.first_day = date(2026, 1, 5)
+
+    def deposit(self, day, minute, amount):
+        deposit = Deposit(type=OperationsType.DEPOSIT, way=OperationsWay.IN, amount=amount, to_account=self.account)
+        with mock.patch('django.utils.timezone.now', return_value=day_start(day) + timedelta(hours=10, minutes=minute)):
+            deposit.save()
+        return deposit
+
+    @mock.patch('core.posting.BALANCE_SNAPSHOT_INTERVAL', 3)
+    def test_balance_at_every_operation(self):
+        next_day = self.first_day + timedelta(days=1)
+        postings = [(self.first_day, minute, amount) for minute, amount in enumerate([10, 20, 30, 40, 50])]
+        postings += [(next_day, minute, amount) for minute, amount in enumerate([1, 2])]
+        operations = [self.deposit(*posting) for posting in postings]
+
+        # Three operations close the first snapshot; the next day opens a new one.
+        self.assertEqual(list(self.account.snapshots.order_by('pk').values_list('day', 'operation_count', 'balance')), [
+            (self.first_day, 3, Decimal('60.00')), (self.first_day, 2, Decimal('150.00')), (next_day, 2, Decimal('153.00')),
+        ])
+
+        account = Account.objects.get(pk=self.account.pk)
+        balance = Decimal('0')
+        for operation in operations:
+            with self.subTest(operation=operation.pk):
+                # Points before the first snapshot, taken after the third operation, are replayed backwards from it.
+                self.assertEqual(balance_before(account, operation), balance)
+                balance += operation.amount
+                self.assertEqual(balance_at(account, operation.timestamp, operation.pk), balance)
+
+        self.assertEqual(balance_at(account, day_start(self.first_day)), Decimal('0'))
+        self.assertEqual(balance_at(account, day_end(self.first_day)), Decimal('150.00'))
+        self.assertEqual(balance_at(account, day_start(next_day)), Decimal('150.00'))
+        self.assertEqual(balance_at(account, day_end(next_day)), Decimal('153.00'))
+
+    def test_balance_before_the_first_snapshot_without_later_ones(self):
+        operation = self.deposit(self.first_day, 0, 10)
+        self.deposit(self.first_day, 1, 5)
+        self.account.snapshots.all().delete()
+
+        # Without any snapshot, the balance is replayed backwards from the current one.
+        account = Account.objects.get(pk=self.account.pk)
+        self.assertEqual(balance_before(account, operation), Decimal('0'))
+        self.assertEqual(balance_at(account, operation.timestamp, operation.pk), Decimal('10.00'))
+
+
+class LimitsTest(TransactionTestCase):
+    def setUp(self):
+        client = create_client('Limits')
+        self.account = Account.objects.create(account_number='lim-1', agency_number='0002', client=client)
+        self.other = Account.objects.create(account_number='lim-2', agency_number='0003', client=client)
+        self.day = date(2026, 1, 5)
+
+    def usage(self):
+        return DailyUsage.objects.filter(account=self.account, day=self.day, operation_type=OperationsType.WITHDRAWAL) \
+            .values_list('count', 'amount').first()
+
+    def test_account_limit_wins_over_agency_limit_and_defaults(self):
+        OperationLimit.objects.create(operation_type=OperationsType.WITHDRAWAL, agency_number='0002', max_amount=1000)
+        OperationLimit.objects.create(operation_type=OperationsType.DEPOSIT, agency_number='0002', max_daily_count=1)
+        OperationLimit.objects.create(operation_type=OperationsType.DEPOSIT, account=self.account, max_daily_amount=50)
+
+        limits = resolve_limits([self.account, self.other])
+
+        self.assertEqual(limits[(self.account.pk, OperationsType.WITHDRAWAL)], Limits(max_amount=Decimal('1000.00')))
+        self.assertEqual(limits[(self.account.pk, OperationsType.DEPOSIT)], Limits(max_daily_amount=Decimal('50.00')))
+        self.assertEqual(limits[(self.other.pk, OperationsType.WITHDRAWAL)], Limits(max_amount=500, max_daily_count=3))
+        self.assertEqual(limits[(self.other.pk, OperationsType.TRANSFER)], Limits())
+
+    def test_consume_checks_max_amount_and_daily_count(self):
+        limits = Limits(max_amount=Decimal('500'), max_daily_count=2, max_daily_amount=Decimal('100'))
+
+        with self.assertRaisesMessage(LimitExceeded, 'Withdrawal amount exceeds limit of 500'):
+            consume(self.account, OperationsType.WITHDRAWAL, self.day, Decimal('500.01'), limits)
+        self.assertIsNone(self.usage())
+
+        consume(self.account, OperationsType.WITHDRAWAL, self.day, Decimal('60.10'), limits)
+        with self.assertRaisesMessage(LimitExceeded, 'Withdrawal daily amount limit of 100 exceeded'):
+            consume(self.account, OperationsType.WITHDRAWAL, self.day, Decimal('40'), limits)
+        consume(self.account, OperationsType.WITHDRAWAL, self.day, Decimal('39.90'), limits)
+        with self.assertRaisesMessage(LimitExceeded, 'Withdrawal limit exceeded for today'):
+            consume(self.account, OperationsType.WITHDRAWAL, self.day, Decimal('0.01'), limits)
+
+        self.assertEqual(self.usage(), (2, Decimal('100.00')))
+
+    def race(self, limits):
+        """
+        Consume from two threads that both miss the conditional UPDATE and find no counter, then both try to
+        create it: one insert wins, the other gets the IntegrityError and goes back to the UPDATE.
+        """
+        barrier = threading.Barrier(2, timeout=10)
+        atomic = transaction.atomic
+        errors = []
+
+        def create_after_the_other_thread_looked(*args, **kwargs):
+            barrier.wait()
+            return atomic(*args, **kwargs)
+
+        def posting():
+            try:
+                consume(self.account, OperationsType.WITHDRAWAL, self.day, Decimal('5'), limits)
+            except LimitExceeded as e:
+                errors.append(str(e))
+            finally:
+                connection.close()
+
+        with mock.patch('core.limits.transaction') as limits_transaction:
+            limits_transaction.atomic.side_effect = create_after_the_other_thread_looked
+            threads = [threading.Thread(target=posting) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return errors
+
+    def test_concurrent_first_postings_of_the_day(self):
+        self.assertEqual(self.race(Limits(max_daily_count=3)), [])
+        self.assertEqual(self.usage(), (2, Decimal('10.00')))
+
+        DailyUsage.objects.all().delete()
+        self.assertEqual(self.race(Limits(max_daily_count=1)), ['Withdrawal limit exceeded for today'])
+        self.assertEqual(self.usage(), (1, Decimal('5.00')))
+
+
+class ImportTest(TransactionTestCase):
+    header = 'name,cpf,birth_date,street_address,street_number,neighborhood,city,state_code'
+
+    def client_row(self, cpf, name='Imported', birth_date='01/02/1990'):
+        return f'{name},{cpf},{birth_date},Rua A,1,Centro,Rio de Janeiro,RJ'
+
+    def test_are_cpfs_valid_matches_is_cpf_valid(self):
+        cpfs = [make_cpf(number) for number in range(1, 200)] + [
+            '52998224725', '52998224724', '11111111111', '5299822472', '529982247250', '5299822472a', '',
+            '５２９９８２２４７２５', None,
+        ]
+        self.assertEqual(are_cpfs_valid(cpfs), [isinstance(cpf, str) and cpf.isascii() and is_cpf_valid(cpf)
+                                                for cpf in cpfs])
+        self.assertEqual(are_cpfs_valid([]), [])
+
+    def test_client_import_reports_rejected_rows(self):
+        create_client('Existing', cpf=make_cpf(1))
+        body = '\n'.join([
+            self.header,
+            self.client_row(make_cpf(2)),
+            self.client_row('52998224724'),
+            self.client_row(make_cpf(2)),
+            self.client_row(make_cpf(1)),
+            self.client_row(make_cpf(3), name=''),
+            self.client_row(make_cpf(4), birth_date='1990-02-01'),
+            self.client_row(make_cpf(5)),
+        ])
+        response = TestClient().post('/core/client/import/', body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'success': 'Import finished', 'created': 2, 'rejected': [
+            {'row': 2, 'error': 'Invalid CPF'},
+            {'row': 3, 'error': 'Client with this CPF already exists'},
+            {'row': 4, 'error': 'Client with this CPF already exists'},
+            {'row': 5, 'error': 'All fields are required'},
+            {'row': 6, 'error': 'Invalid birth date'},
+        ]})
+        self.assertEqual(Client.objects.get(cpf=make_cpf(2)).birth_date, date(1990, 2, 1))
+
+    def test_account_import_invalidates_client_entry(self):
+        client = create_client('Owner')
+        lookup_cache.clear()
+        self.assertEqual(get_client_info(client.cpf)['accounts'], [])
+
+        body = '\n'.join(json.dumps(row) for row in [
+            {'client_cpf': client.cpf, 'account_number': 'imp-1'},
+            {'client_cpf': client.cpf, 'account_number': 'imp-1'},
+            {'client_cpf': make_cpf(7), 'account_number': 'imp-2'},
+            {'client_cpf': '123', 'account_number': 'imp-3'},
+        ])
+        response = TestClient().post('/core/account/import/?format=ndjson', body, content_type='application/x-ndjson')
+
+        self.assertEqual(json.loads(response.content)['rejected'], [
+            {'row': 2, 'error': 'Account with this number already exists'},
+            {'row': 3, 'error': 'Client not found'},
+            {'row': 4, 'error': 'Invalid CPF'},
+        ])
+        # bulk_create sent no post_save: the importer dropped the cached entry itself.
+        self.assertEqual(get_client_info(client.cpf)['accounts'], ['0001 - imp-1'])
+
+    def test_bulk_insert_falls_back_to_single_inserts(self):
+        create_client('Concurrent', cpf=make_cpf(1))
+        fields = {'birth_date': date(1990, 1, 1), 'street_address': 'Rua A', 'street_number': '1',
+                  'neighborhood': 'Centro', 'city': 'Rio de Janeiro', 'state_code': 'RJ'}
+        objects = [(1, Client(name='New', cpf=make_cpf(2), **fields)), (2, Client(name='Taken', cpf=make_cpf(1), **fields))]
+        rejected = []
+
+        # The client created concurrently makes the bulk insert fail; the rows are then inserted one by one.
+        created = _bulk_insert(objects, rejected, 'Client with this CPF already exists')
+
+        self.assertEqual(created, 1)
+        self.assertEqual(rejected, [{'row': 2, 'error': 'Client with this CPF already exists'}])
+        self.assertEqual(Client.objects.filter(cpf=make_cpf(2)).count(), 1)
+
+
+class AccountPaginationTest(TransactionTestCase):
+    def setUp(self):
+        client = create_client('Pages')
+        other = create_client('Other', cpf='11144477735')
+        for i in range(5):
+            Account.objects.create(account_number=f'page-{i}', agency_number='0002' if i % 2 else '0001', client=client)
+        Account.objects.create(account_number='page-other', client=other)
+
+    def get(self, path='/core/account/get/', **params):
+        response = TestClient().get(path, params)
+        return response.status_code, json.loads(response.content)
+
+    def test_pages_cover_every_account_once(self):
+        accounts, cursor, pages = [], None, 0
+        while True:
+            status, body = self.get('/core/account/get/52998224725/', limit=2, **({'cursor': cursor} if cursor else {}))
+            self.assertEqual(status, 200)
+            self.assertNotIn('count', body['data'])
+            accounts += body['data']['accounts']
+            cursor, pages = body['data']['next_cursor'], pages + 1
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual([account.split(' - ')[1] for account in accounts], [f'page-{i}' for i in range(5)])
+
+        _, body = self.get(agency='0002', limit=1, count='true')
+        self.assertEqual((body['data']['accounts'], body['data']['count']), (['0002 - page-1'], 2))
+        _, body = self.get(agency='0002', cursor=body['data']['next_cursor'])
+        self.assertEqual((body['data']['accounts'], body['data']['next_cursor']), (['0002 - page-3'], None))
+
+    def test_invalid_parameters(self):
+        for params, error in [({'cursor': 'not-a-cursor'}, 'Invalid cursor'), ({'cursor': 'W10='}, 'Invalid cursor'),
+                              ({'limit': 0}, 'Limit must be between 1 and 1000'),
+                              ({'min_balance': 'abc'}, 'Invalid query parameters')]:
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params), (400, {'error': error}))
+
+
+class IdempotencyTest(TransactionTestCase):
+    def setUp(self):
+        result_cache.clear()
+        client = create_client('Retry')
+        self.account = Account.objects.create(account_number='retry-1', client=client)
+
+    def deposit(self, key, amount=100, path='/core/deposit/'):
+        return TestClient().post(
+            path, json.dumps({'to_account': 'retry-1', 'amount': amount}),
+            content_type='application/json', headers={'Idempotency-Key': key} if key else {},
+        )
+
+    def test_retry_replays_stored_response(self):
+        first = self.deposit('key-1')
+        result_cache.clear()
+        replayed = self.deposit('key-1')
+        cached = self.deposit('key-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((replayed.status_code, replayed.content), (first.status_code, first.content))
+        self.assertEqual((cached.status_code, cached.content), (first.status_code, first.content))
+        self.assertEqual(cached['Idempotent-Replayed'], 'true')
+        self.assertEqual(Operation.objects.count(), 1)
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('100.00'))
+
+    def test_async_views_are_idempotent_and_logged(self):
+        with self.assertLogs('core.async_views', 'INFO') as logs:
+            first = self.deposit('key-1', path='/core/async/deposit/')
+            replayed = self.deposit('key-1', path='/core/async/deposit/')
+            self.deposit(None, amount=5, path='/core/async/deposit/')
+
+        self.assertEqual((replayed.status_code, replayed.content), (201, first.content))
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('105.00'))
+        # Keyed requests run the synchronous view, which logs under core.views.
+        self.assertEqual([record.getMessage() for record in logs.records], ['Received deposit request'])
+        self.assertEqual((logs.records[0].amount, logs.records[0].to_account), (5, 'retry-1'))
+
+    def test_key_reused_with_different_request_is_rejected(self):
+        self.deposit('key-1')
+
+        self.assertEqual(self.deposit('key-1', amount=50).status_code, 422)
+        self.assertEqual(Operation.objects.count(), 1)
+
+    def test_expired_keys_are_pruned(self):
+        self.deposit('key-1')
+        self.deposit('key-2')
+        IdempotencyKey.objects.filter(key='key-1').update(created_at=timezone.now() - timedelta(days=2))
+
+        call_command('prune_idempotency_keys', stdout=io.StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['key-2'])
+        # A retry after the retention window is a new request.
+        result_cache.clear()
+        self.assertNotIn('Idempotent-Replayed', self.deposit('key-1'))
+        self.assertEqual(Operation.objects.count(), 3)
+
+    def test_concurrent_duplicates_post_once(self):
+        responses, errors = [], []
+
+        def worker():
+            try:
+                responses.append(self.deposit('key-1'))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual({response.status_code for response in responses}, {201})
+        self.assertEqual(len({response.content for response in responses}), 1)
+        self.assertEqual(Operation.objects.count(), 1)
+        self.assertEqual(Account.objects.get(pk=self.account.pk).balance, Decimal('100.00'))
+
+
+class QueryCountRegressionTest(TransactionTestCase):
+    def test_query_counts_do_not_grow_with_data(self):
+        data = seed(clients=2, accounts_per_client=2, operations_per_account=4, days=3)
+        small = run_benchmarks(data, repeats=3)
+
+        data = seed(clients=8, accounts_per_client=2, operations_per_account=0, data=data)
+        add_operations(data, operations_per_account=40, days=12)
+        large = run_benchmarks(data, repeats=3)
+
+        self.assertEqual(query_growth(small, large), [])
+
+
+
+@replica_reads
+def read_alias(request):
+    return HttpResponse(router.db_for_read(Account))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], READ_YOUR_WRITES_WINDOW=5)
+class ReplicaRoutingTest(TransactionTestCase):
+    def setUp(self):
+        self.account = Account.objects.create(account_number='replica-1', client=create_client('Replica'))
+
+    def read_alias(self, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return read_alias(request).content.decode()
+
+    def test_writes_pin_reads_to_primary(self):
+        self.assertEqual(self.read_alias(), 'replica_1')
+        # Outside replica_reads, reads and writes use the primary.
+        self.assertEqual((router.db_for_read(Account), router.db_for_write(Account)), ('default', 'default'))
+
+        client = TestClient()
+        response = client.post('/core/deposit/', json.dumps({'to_account': 'replica-1', 'amount': 10}),
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        pin = {PIN_COOKIE: client.cookies[PIN_COOKIE].value}
+        self.assertEqual(self.read_alias(pin), 'default')
+
+        # Failed writes do not pin, and the pin ends with the window.
+        response = TestClient().post('/core/deposit/', json.dumps({'to_account': 'replica-9', 'amount': 10}),
+                                     content_type='application/json')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.read_alias({PIN_COOKIE: str(time.time() - 1)}), 'replica_1')
+        self.assertEqual(self.read_alias({PIN_COOKIE: 'garbage'}), 'replica_1')
+
+
+class RollupTest(TransactionTestCase):
+    def setUp(self):
+        client = create_client('Rollup')
+        self.first = Account.objects.create(account_number='roll-1', agency_number='0001', client=client)
+        self.second = Account.objects.create(account_number='roll-2', agency_number='0002', client=client)
+
+    def rows(self):
+        return (
+            sorted(DailyAccountTotals.objects.values_list('day', 'account_id', 'deposits', 'withdrawals', 'transfers_in',
+                                                          'transfers_out', 'deposit_count', 'withdrawal_count',
+                                                          'transfer_in_count', 'transfer_out_count')),
+            sorted(DailyAgencyTotals.objects.values_list('day', 'agency_number', 'deposits', 'withdrawals',
+                                                         'transfers_in', 'transfers_out', 'deposit_count',
+                                                         'withdrawal_count', 'transfer_in_count', 'transfer_out_count')),
+        )
+
+    def test_postings_keep_rollups_equal_to_rebuild(self):
+        Operation(type=OperationsType.DEPOSIT, amount=100, to_account=self.first).save()
+        Operation(type=OperationsType.WITHDRAWAL, amount=10, from_account=self.first).save()
+        post_operations([
+            Operation(type=OperationsType.TRANSFER, amount=25, from_account=self.first, to_account=self.second),
+            Operation(type=OperationsType.DEPOSIT, amount=5, to_account=self.second),
+        ])
+
+        incremental = self.rows()
+        rebuild_rollups()
+
+        self.assertEqual(self.rows(), incremental)
+        self.assertEqual(incremental[1][0][2:], (Decimal('100.00'), Decimal('10.00'), Decimal('0.00'),
+                                                 Decimal('25.00'), 1, 1, 0, 1))
+
+    def test_analytics_totals(self):
+        Operation(type=OperationsType.DEPOSIT, amount=100, to_account=self.first).save()
+        Operation(type=OperationsType.TRANSFER, amount=40, from_account=self.first, to_account=self.second).save()
+
+        response = TestClient().get('/core/analytics/', {'account': 'roll-2'})
+        totals = json.loads(response.content)['totals']
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((totals['transfers_in'], totals['transfer_in_count']), ('40.00', 1))
+
+        empty = json.loads(TestClient().get('/core/analytics/', {'account': 'roll-9'}).content)['totals']
+        self.assertEqual((empty['deposits'], empty['deposit_count']), ('0.00', 0))
+
+
+class StatementCacheTest(TransactionTestCase):
+    def setUp(self):
+        statement_cache.clear()
+        client = create_client('Statement')
+        self.first = Account.objects.create(account_number='stmt-1', client=client)
+        self.second = Account.objects.create(account_number='stmt-2', client=client)
+
+        now = timezone.now()
+        for days_ago, operation in [
+            (3, Operation(type=OperationsType.DEPOSIT, amount=100, to_account=self.first)),
+            (3, Operation(type=OperationsType.WITHDRAWAL, amount=10, from_account=self.first)),
+            (2, Operation(type=OperationsType.TRANSFER, amount=20, from_account=self.first, to_account=self.second)),
+            (0, Operation(type=OperationsType.DEPOSIT, amount=5, to_account=self.first)),
+        ]:
+            with mock.patch('django.utils.timezone.now', return_value=now - timedelta(days=days_ago)):
+                operation.save()
+
+    def statement(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = TestClient().get('/core/statement/stmt-1/', params)
+        return json.loads(response.content), len(queries)
+
+    def test_closed_days_are_served_from_cache(self):
+        cold, cold_queries = self.statement()
+        warm, warm_queries = self.statement()
+
+        self.assertEqual(warm, cold)
+        self.assertLess(warm_queries, cold_queries)
+        balances = [line['balance'] for day in cold['statement'] for line in day['operations']]
+        self.assertEqual(balances, ['R$100.00', 'R$90.00', 'R$70.00', 'R$75.00'])
+
+    def test_pages_match_full_statement(self):
+        full, _ = self.statement()
+        lines, cursor = [], None
+        while True:
+            page, _ = self.statement(limit=1, **({'cursor': cursor} if cursor else {}))
+            lines += [line for day in page['statement'] for line in day['operations']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(lines, [line for day in full['statement'] for line in day['operations']])
+
+    def test_corrections_invalidate_cached_days(self):
+        self.statement()
+        deposit = Operation.objects.filter(to_account=self.first).order_by('pk').first()
+        deposit.amount = Decimal('50.00')
+        deposit.save()
+
+        statement, _ = self.statement()
+        self.assertEqual(statement['statement'][0]['operations'][0]['amount'], 'R$50.00')
+
+        Withdrawal.objects.get(from_account=self.first).delete()
+        statement, _ = self.statement()
+        self.assertEqual([line['type'] for line in statement['statement'][0]['operations']], ['Deposit'])
+
+    def test_unrelated_bulk_deletes_stay_fast(self):
+        OutboxEvent.objects.bulk_create([OutboxEvent(event_type='test', payload={}) for _ in range(3)])
+        with CaptureQueriesContext(connection) as queries:
+            OutboxEvent.objects.all().delete()
+        # One DELETE, without fetching the rows to send signals.
+        self.assertEqual([query['sql'] for query in queries if 'core_outboxevent' in query['sql']],
+                         ['DELETE FROM "core_outboxevent"'])
+
+
+class ConditionalGetTest(TransactionTestCase):
+    def setUp(self):
+        client = create_client('Conditional')
+        self.account = Account.objects.create(account_number='cond-1', client=client)
+        Deposit(type=OperationsType.DEPOSIT, amount=100, to_account=self.account).save()
+
+    def test_unchanged_account_is_not_modified(self):
+        for path in ['/core/statement/cond-1/', '/core/account/details/cond-1/',
+                     '/core/async/statement/cond-1/', '/core/async/account/details/cond-1/']:
+            with self.subTest(path=path):
+                first = TestClient().get(path)
+                self.assertEqual(first.status_code, 200)
+                self.assertIn('Last-Modified', first.headers)
+
+                with CaptureQueriesContext(connection) as queries:
+                    second = TestClient().get(path, headers={'If-None-Match': first['ETag']})
+                self.assertEqual(second.status_code, 304)
+                self.assertEqual(second['ETag'], first['ETag'])
+                if not path.startswith('/core/async/'):
+                    self.assertEqual(len(queries), 1)
+
+    def test_postings_and_changes_give_new_etags(self):
+        etag = TestClient().get('/core/statement/cond-1/')['ETag']
+        Deposit(type=OperationsType.DEPOSIT, amount=5, to_account=self.account).save()
+        response = TestClient().get('/core/statement/cond-1/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        TestClient().get('/core/account/inactivate/cond-1/')
+        response = TestClient().get('/core/statement/cond-1/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveTest(TransactionTestCase):
+    def setUp(self):
+        statement_cache.clear()
+        client = create_client('Archive')
+        self.first = Account.objects.create(account_number='arch-1', client=client)
+        self.second = Account.objects.create(account_number='arch-2', client=client)
+
+        now = timezone.now()
+        for days_ago, operation in [
+            (400, Operation(type=OperationsType.DEPOSIT, amount=100, to_account=self.first)),
+            (300, Operation(type=OperationsType.TRANSFER, amount=30, from_account=self.first, to_account=self.second)),
+            (200, Operation(type=OperationsType.WITHDRAWAL, amount=10, from_account=self.first)),
+            (2, Operation(type=OperationsType.DEPOSIT, amount=5, to_account=self.first)),
+            (0, Operation(type=OperationsType.TRANSFER, amount=1, from_account=self.second, to_account=self.first)),
+        ]:
+            with mock.patch('django.utils.timezone.now', return_value=now - timedelta(days=days_ago)):
+                operation.save()
+        self.moments = [(now - timedelta(days=days)).isoformat() for days in (350, 250, 1)]
+
+    def snapshot(self):
+        statement = json.loads(TestClient().get('/core/statement/arch-1/').content)
+        pages, cursor = [], None
+        while True:
+            page = json.loads(TestClient().get('/core/statement/arch-1/', {
+                'limit': 2, **({'cursor': cursor} if cursor else {}),
+            }).content)
+            pages += [line for day in page['statement'] for line in day['operations']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        export = TestClient().get('/core/operations/export/', {'account': 'arch-1', 'format': 'csv'})
+        balances = [json.loads(TestClient().get('/core/account/balance/arch-1/', {'at': moment}).content)['data']
+                    for moment in self.moments]
+        return statement, pages, b''.join(export.streaming_content), balances
+
+    def test_archived_operations_read_like_live_ones(self):
+        before = self.snapshot()
+        rebuild_rollups()
+        rollups = sorted(DailyAccountTotals.objects.values_list('day', 'account_id', 'deposits', 'transfers_out'))
+
+        self.assertEqual(archive_operations(archive_cutoff(180), chunk_size=2), 3)
+        self.assertEqual(Operation.objects.count(), 2)
+        self.assertEqual(ArchivedOperation.objects.count(), 3)
+        self.assertEqual(archive_operations(archive_cutoff(180)), 0)
+
+        statement_cache.clear()
+        self.assertEqual(self.snapshot(), before)
+        rebuild_rollups()
+        self.assertEqual(sorted(DailyAccountTotals.objects.values_list('day', 'account_id', 'deposits',
+                                                                       'transfers_out')), rollups)
+
+    def export(self, **params):
+        response = TestClient().get('/core/operations/export/', params)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_merges_live_and_archived_operations(self):
+        archive_operations(archive_cutoff(180))
+        ids = sorted([*Operation.objects.values_list('pk', flat=True),
+                      *ArchivedOperation.objects.values_list('pk', flat=True)])
+
+        response, content = self.export(account='arch-1')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([(row['id'], row['type'], row['amount']) for row in rows], list(zip(
+            ids, ['D', 'T', 'W', 'D', 'T'], ['100.00', '30.00', '10.00', '5.00', '1.00'],
+        )))
+        self.assertEqual((rows[1]['from_account'], rows[1]['to_account']), ('arch-1', 'arch-2'))
+
+        _, content = self.export(account='arch-2', type='transfer', format='csv')
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'id,timestamp,type,way,amount,from_account,to_account')
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(ids[1]), str(ids[4])])
+
+        since = (timezone.localdate() - timedelta(days=250)).isoformat()
+        _, content = self.export(**{'from': since, 'to': timezone.localdate().isoformat()})
+        self.assertEqual([json.loads(line)['id'] for line in content.splitlines()], ids[2:])
+        self.assertEqual(TestClient().get('/core/operations/export/', {'format': 'xml'}).status_code, 400)
+
+
+@override_settings(BATCH_JOBS={'MONTHLY_FEE': '10', 'MONTHLY_INTEREST_RATE': '0.01', 'CHUNK_SIZE': 2})
+class BatchJobTest(TransactionTestCase):
+    def setUp(self):
+        client = create_client('Batch')
+        self.accounts = [
+            Account.objects.create(account_number=f'batch-{i}', client=client, balance=balance, is_active=active)
+            for i, (balance, active) in enumerate([(0, True), (5, True), (100, True), (1000, True), (500, False)])
+        ]
+        self.period = date(2026, 1, 1)
+
+    def balances(self):
+        return [balance for balance in Account.objects.order_by('pk').values_list('balance', flat=True)]
+
+    def test_fee_resumes_and_posts_once_per_period(self):
+        Operation(type=OperationsType.DEPOSIT, amount=10, to_account=self.accounts[2]).save()
+        job = BATCH_JOBS['monthly_fee']()
+        checkpoint = plan_slices('monthly_fee', self.period, 1)[0]
+        # An interrupted run: only the first chunk was committed.
+        self.assertEqual(run_chunk(job, checkpoint.pk, 1)[0], 1)
+
+        results = run_batch_job('monthly_fee', self.period)
+        self.assertEqual(run_batch_job('monthly_fee', self.period), [])
+
+        self.assertEqual(self.balances(), [0, 5, 100, 990, 500])
+        self.assertEqual(sum(result.accounts for result in results), 1)
+        self.assertEqual(Operation.objects.filter(type=OperationsType.FEE, way=OperationsWay.OUT).count(), 2)
+        statement = json.loads(TestClient().get('/core/statement/batch-3/').content)
+        self.assertEqual(statement['statement'][0]['operations'][0]['type'], 'Fee')
+
+        totals = list(DailyAccountTotals.objects.order_by('account_id').values_list('deposits', 'fees', 'fee_count'))
+        self.assertEqual(totals, [(Decimal('10.00'), Decimal('10.00'), 1), (Decimal('0.00'), Decimal('10.00'), 1)])
+        rebuild_rollups()
+        self.assertEqual(list(DailyAccountTotals.objects.order_by('account_id')
+                              .values_list('deposits', 'fees', 'fee_count')), totals)
+        analytics = json.loads(TestClient().get('/core/analytics/').content)
+        self.assertEqual((analytics['totals']['fees'], analytics['totals']['fee_count']), ('20.00', 2))
+
+    def test_interest_in_process_pool(self):
+        results = run_batch_job('monthly_interest', self.period, workers=2)
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.balances(), [0, Decimal('5.05'), 101, 1010, 500])
+        self.assertEqual(sum(result.amount for result in results), Decimal('11.05'))
+        self.assertEqual(Operation.objects.filter(type=OperationsType.INTEREST).count(), 3)
+
+
+class ReconcileTest(TransactionTestCase):
+    def setUp(self):
+        client = create_client('Reconcile')
+        self.accounts = [Account.objects.create(account_number=f'rec-{i}', client=client) for i in range(5)]
+        first, second = self.accounts[:2]
+        Operation(type=OperationsType.DEPOSIT, amount='100.10', to_account=first).save()
+        Operation(type=OperationsType.TRANSFER, amount='30.05', from_account=first, to_account=second).save()
+        Operation(type=OperationsType.TRANSFER, amount=5, from_account=second, to_account=second).save()
+        Operation(type=OperationsType.WITHDRAWAL, amount='0.05', from_account=second).save()
+
+    def discrepancies(self, **options):
+        return [(d.account_number, d.balance, d.ledger)
+                for result in reconcile(chunk_size=2, **options) for d in result.discrepancies]
+
+    def test_full_run_finds_drift(self):
+        self.assertEqual(self.discrepancies(), [])
+        # Drift that bypassed the posting path.
+        Account.objects.filter(pk=self.accounts[1].pk).update(balance=F('balance') + 1)
+
+        expected = [('rec-1', Decimal('31.00'), Decimal('30.00'))]
+        self.assertEqual(self.discrepancies(), expected)
+        self.assertEqual(self.discrepancies(workers=2), expected)
+
+    def test_opening_balance_is_part_of_the_ledger(self):
+        opened = Account.objects.create(account_number='rec-open', client=self.accounts[0].client, balance='250.50')
+        Operation(type=OperationsType.WITHDRAWAL, amount='0.50', from_account=opened).save()
+
+        self.assertEqual(Account.objects.get(pk=opened.pk).opening_balance, Decimal('250.50'))
+        self.assertEqual(self.discrepancies(), [])
+        # Editing the balance later is still drift: only the balance at creation is recorded.
+        opened.balance = 300
+        opened.save(update_fields=['balance'])
+        self.assertEqual(self.discrepancies(), [('rec-open', Decimal('300.00'), Decimal('250.00'))])
+
+    def test_incremental_run_rechecks_modified_accounts(self):
+        Account.objects.update(modified_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.discrepancies(), [])
+        Account.objects.filter(pk=self.accounts[2].pk).update(balance=7)
+        Account.objects.filter(pk=self.accounts[3].pk).update(balance=9, **bump_version())
+
+        results = list(reconcile(incremental=True))
+        self.assertEqual(sum(result.accounts for result in results), 1)
+        self.assertEqual([d.account_number for result in results for d in result.discrepancies], ['rec-3'])
+        self.assertEqual(ReconcileRun.objects.filter(incremental=True).count(), 1)
+
+
+class MetricsTest(TransactionTestCase):
+    route = 'core/account/details/<str:account_number>/'
+
+    def setUp(self):
+        registry.clear()
+        Account.objects.create(account_number='met-1', client=create_client('Metrics'))
+
+    def test_middleware_counts_requests_by_route(self):
+        client = TestClient()
+        for account_number in ('met-1', 'met-1', 'met-9'):
+            client.get(f'/core/account/details/{account_number}/')
+
+        lines = registry.render().splitlines()
+        labels = f'route="{self.route}",method="GET"'
+        self.assertIn(f'bancodio_http_requests_total{{{labels},status="200"}} 2', lines)
+        self.assertIn(f'bancodio_http_requests_total{{{labels},status="404"}} 1', lines)
+        self.assertIn(f'bancodio_http_request_duration_seconds_count{{{labels}}} 3', lines)
+        self.assertIn(f'bancodio_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3', lines)
+        self.assertIn(f'bancodio_http_response_size_bytes_count{{{labels}}} 3', lines)
+        queries = next(line for line in lines if line.startswith(f'bancodio_db_queries_total{{{labels}}}'))
+        self.assertGreater(int(queries.split()[-1]), 0)
+
+    def test_metrics_endpoint_renders_prometheus_text(self):
+        registry.observe('core/x/', 'POST', 201, 0.03, 10)
+        registry.observe('core/x/', 'POST', 201, 20.0, 30)
+        registry.increment('bancodio_test_total', 'Test counter.', 2, lane='a "b"')
+        registry.set_gauge('bancodio_test_gauge', 'Test gauge.', 1.5)
+
+        response = TestClient().get('/core/metrics/')
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        lines = response.content.decode().splitlines()
+        labels = 'route="core/x/",method="POST"'
+        # Cumulative buckets: one latency under 0.05 s, the other only in +Inf.
+        self.assertIn(f'bancodio_http_request_duration_seconds_bucket{{{labels},le="0.025"}} 0', lines)
+        self.assertIn(f'bancodio_http_request_duration_seconds_bucket{{{labels},le="0.05"}} 1', lines)
+        self.assertIn(f'bancodio_http_request_duration_seconds_bucket{{{labels},le="10.0"}} 1', lines)
+        self.assertIn(f'bancodio_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', lines)
+        self.assertIn(f'bancodio_http_response_size_bytes_sum{{{labels}}} 40', lines)
+        self.assertIn('# TYPE bancodio_test_total counter', lines)
+        self.assertIn('bancodio_test_total{lane="a \\"b\\""} 2', lines)
+        self.assertIn('# TYPE bancodio_test_gauge gauge', lines)
+        self.assertIn('bancodio_test_gauge 1.5', lines)
+
+    def test_log_records_are_json_lines(self):
+        handler = QueueLogHandler()
+        atexit.unregister(handler.listener.stop)
+        stream = io.StringIO()
+        handler.listener.handlers[0].setStream(stream)
+        logger = logging.getLogger('core.tests.json')
+        logger.addHandler(handler)
+        logger.propagate = False
+
+        logger.warning('Posted %s', 'deposit', extra={'account': 'met-1', 'amount': Decimal('10.50')})
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            logger.exception('Failed')
+        logger.removeHandler(handler)
+        handler.listener.stop()
+
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual({key: value for key, value in first.items() if key != 'time'}, {
+            'level': 'WARNING', 'logger': 'core.tests.json', 'message': 'Posted deposit', 'account': 'met-1',
+            'amount': '10.50',
+        })
+        self.assertEqual((second['message'], second['level']), ('Failed', 'ERROR'))
+        self.assertIn('ValueError: boom', second['exception'])
+
+
+class OutboxTest(TransactionTestCase):
+    def setUp(self):
+        client = create_client('Outbox')
+        self.first = Account.objects.create(account_number='out-1', client=client)
+        self.second = Account.objects.create(account_number='out-2', client=client)
+
+    def test_events_commit_with_postings(self):
+        Operation(type=OperationsType.DEPOSIT, amount=50, to_account=self.first).save()
+        post_operations([Operation(type=OperationsType.TRANSFER, amount=20, from_account=self.first,
+                                   to_account=self.second)])
+        with self.assertRaises(InsufficientFunds):
+            post_operations([Operation(type=OperationsType.WITHDRAWAL, amount=100, from_account=self.second)])
+        run_batch_job('monthly_fee', date(2026, 1, 1))
+
+        payloads = list(OutboxEvent.objects.order_by('pk').values_list('payload', flat=True))
+        self.assertEqual([(p['type'], p['amount'], p['from_account'], p['to_account']) for p in payloads], [
+            ('D', '50.00', None, 'out-1'),
+            ('T', '20.00', 'out-1', 'out-2'),
+            ('F', '12.90', 'out-1', None),
+            ('F', '12.90', 'out-2', None),
+        ])
+        self.assertEqual([p['id'] for p in payloads], list(Operation.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_relay_delivers_in_order_at_least_once(self):
+        for _ in range(5):
+            Operation(type=OperationsType.DEPOSIT, amount=1, to_account=self.first).save()
+        sink = MemorySink(capacity=3)
+
+        with self.assertRaises(Backpressure):
+            relay(sink, batch_size=2, once=True)
+        # The refused batch stays pending and is delivered once the consumer caught up.
+        self.assertEqual(len(sink.take()), 2)
+        self.assertEqual(OutboxEvent.objects.filter(delivered_at__isnull=True).count(), 3)
+        self.assertIn('bancodio_outbox_pending_events 3', TestClient().get('/core/metrics/').content.decode())
+
+        sink.capacity = None
+        self.assertEqual(relay(sink, batch_size=2, once=True), 3)
+        ids = [message['id'] for message in sink.take()]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(ids), 3)
+        self.assertFalse(OutboxEvent.objects.filter(delivered_at__isnull=True).exists())
+        self.assertIn('bancodio_outbox_pending_events 0', TestClient().get('/core/metrics/').content.decode())
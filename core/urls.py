@@ -1,21 +1,39 @@
 from django.urls import path
 
+from core import async_views
 from core.views import make_deposit, make_withdrawal, make_transfer, get_statement, create_account, get_accounts, \
-    get_account_details, create_client, get_client, activate_account, inactivate_account
+    get_account_details, create_client, get_client, activate_account, inactivate_account, post_batch, \
+    export_operations, get_balance_at, import_records, get_analytics, \
+    get_cache_stats, get_metrics
 
 urlpatterns = [
     path('deposit/', make_deposit, name='deposit'),
     path('withdrawal/', make_withdrawal, name='withdrawal'),
     path('transfer/', make_transfer, name='transfer'),
+    path('operations/batch/', post_batch, name='operations_batch'),
     path('statement/<str:account_number>/', get_statement, name='statement'),
+    path('operations/export/', export_operations, name='operations_export'),
+    path('analytics/', get_analytics, name='analytics'),
     path('account/create/', create_account, name='account_create'),
+    path('account/import/', import_records, {'kind': 'accounts'}, name='account_import'),
     path('account/get/', get_accounts, name='account_get_all'),
     path('account/get/<str:client_cpf>/', get_accounts, name='account_get_client'),
     path('account/details/<str:account_number>/', get_account_details, name='account_get_detail'),
+    path('account/balance/<str:account_number>/', get_balance_at, name='account_balance_at'),
     path('account/activate/<str:account_number>/', activate_account, name='activate_account'),
     path('account/inactivate/<str:account_number>/', inactivate_account, name='inactivate_account'),
 
     path('client/create/', create_client, name='client_create'),
+    path('client/import/', import_records, {'kind': 'clients'}, name='client_import'),
     path('client/get/<str:client_cpf>/', get_client, name='client_detail'),
 
+    path('cache/stats/', get_cache_stats, name='cache_stats'),
+    path('metrics/', get_metrics, name='metrics'),
+
+    path('async/deposit/', async_views.make_deposit, name='async_deposit'),
+    path('async/withdrawal/', async_views.make_withdrawal, name='async_withdrawal'),
+    path('async/transfer/', async_views.make_transfer, name='async_transfer'),
+    path('async/statement/<str:account_number>/', async_views.get_statement, name='async_statement'),
+    path('async/account/details/<str:account_number>/', async_views.get_account_details, name='async_account_get_detail'),
+
 ]
\ No newline at end of file
@@ -1,18 +1,40 @@
+import codecs
 import json
-from datetime import datetime
+import logging
+from datetime import datetime, date, timedelta
+from decimal import Decimal
 
-from django.db.models import Q
-from django.db.models.functions import TruncDate
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
-from core.functions import can_make_withdrawal, is_cpf_valid
+from core.cache import get_account_info, get_client_info, lookup_cache
+from core.conditional import account_conditional
+from core.exports import EXPORT_FORMATS, export_queryset, export_rows, parse_operation_type
+from core.functions import is_cpf_valid, validate_operation, encode_cursor, decode_cursor
+from core.idempotency import idempotent
+from core.limits import LimitExceeded, daily_usage, limit_error, resolve_limits, usage_owner
+from core.metrics import registry
 from core.models import Deposit, Account, Withdrawal, OperationsType, OperationsWay, Transfer, Operation, Client
+from core.onboarding import IMPORTERS, IMPORT_FORMATS, read_rows
+from core.outbox import record_outbox_lag
+from core.posting import InsufficientFunds, post_operations, to_amount
+from core.rollups import ROLLUP_FIELDS, analytics_rows
+from core.routers import record_replica_lag, replica_reads
+from core.statements import balance_at, day_start, day_end, statement_query, statement_page
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+ANALYTICS_DAYS = 30
+MAX_ANALYTICS_DAYS = 366
 
 '''
     OPERATIONS
 '''
 @csrf_exempt
+@idempotent
 def make_deposit(request):
     if request.method != 'POST':
         return JsonResponse({"error": "Method not allowed"}, status=405)
@@ -21,16 +43,12 @@ def make_deposit(request):
     amount = data.get('amount')
     to_account = Account.objects.filter(account_number=data.get('to_account')).first()
 
-    print(f"Received deposit request: Amount={amount}, To account={to_account}")
+    logger.info('Received deposit request', extra={'amount': amount, 'to_account': data.get('to_account')})
 
-    if amount is None or to_account is None:
-        return JsonResponse({'error': 'Invalid request data'}, status=400)
-
-    if not to_account.is_active:
-        return JsonResponse({'error': 'Account is inactive'}, status=400)
-
-    if amount <= 0:
-        return JsonResponse({'error': 'Amount must be greater than zero'}, status=400)
+    error = validate_operation(OperationsType.DEPOSIT, amount, None, to_account)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    amount = to_amount(amount)
 
     new_deposit = Deposit(
         type=OperationsType.DEPOSIT,
@@ -38,11 +56,15 @@ def make_deposit(request):
         amount=amount,
         to_account=to_account,
     )
-    new_deposit.save()
+    try:
+        new_deposit.save()
+    except LimitExceeded as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
     return JsonResponse({'success': 'Deposit successful', 'balance': to_account.balance}, status=201)
 
 @csrf_exempt
+@idempotent
 def make_withdrawal(request):
     if request.method != 'POST':
         return JsonResponse({"error": "Method not allowed"}, status=405)
@@ -51,37 +73,33 @@ def make_withdrawal(request):
     amount = data.get('amount')
     from_account = Account.objects.filter(account_number=data.get('from_account')).first()
 
-    print(f"Received withdrawal request: Amount={amount}, From account={from_account}")
-
-    if amount is None or from_account is None:
-        return JsonResponse({'error': 'Invalid request data'}, status=400)
-
-    if not from_account.is_active:
-        return JsonResponse({'error': 'Account is inactive'}, status=400)
-
-    if amount <= 0:
-        return JsonResponse({'error': 'Amount must be greater than zero'}, status=400)
+    logger.info('Received withdrawal request', extra={'amount': amount, 'from_account': data.get('from_account')})
 
-    if amount > 500:
-        return JsonResponse({'error': 'Withdrawal amount exceeds limit of 500'}, status=400)
+    error = validate_operation(OperationsType.WITHDRAWAL, amount, from_account, None)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    amount = to_amount(amount)
 
     if amount > from_account.balance:
         return JsonResponse({'error': 'Insufficient funds'}, status=400)
 
-    if not can_make_withdrawal(from_account):
-        return JsonResponse({'error': 'Withdrawal limit exceeded for today'}, status=400)
-
     new_withdrawal = Withdrawal(
         type=OperationsType.WITHDRAWAL,
         way=OperationsWay.OUT,
         amount=amount,
         from_account=from_account,
     )
-    new_withdrawal.save()
+    try:
+        new_withdrawal.save()
+    except InsufficientFunds:
+        return JsonResponse({'error': 'Insufficient funds'}, status=400)
+    except LimitExceeded as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
     return JsonResponse({'success': 'Withdrawal successful', 'balance': from_account.balance}, status=201)
 
 @csrf_exempt
+@idempotent
 def make_transfer(request):
     if request.method != 'POST':
         return JsonResponse({"error": "Method not allowed"}, status=405)
@@ -91,16 +109,14 @@ def make_transfer(request):
     from_account = Account.objects.filter(account_number=data.get('from_account')).first()
     to_account = Account.objects.filter(account_number=data.get('to_account')).first()
 
-    print(f"Received transfer request: Amount={amount}, From account={from_account}, To account={to_account}")
+    logger.info('Received transfer request', extra={
+        'amount': amount, 'from_account': data.get('from_account'), 'to_account': data.get('to_account'),
+    })
 
-    if amount is None or from_account is None or to_account is None:
-        return JsonResponse({'error': 'Invalid request data'}, status=400)
-
-    if not from_account.is_active or not to_account.is_active:
-        return JsonResponse({'error': 'One or both accounts are inactive'}, status=400)
-
-    if amount <= 0:
-        return JsonResponse({'error': 'Amount must be greater than zero'}, status=400)
+    error = validate_operation(OperationsType.TRANSFER, amount, from_account, to_account)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    amount = to_amount(amount)
 
     if amount > from_account.balance:
         return JsonResponse({'error': 'Insufficient funds'}, status=400)
@@ -112,10 +128,104 @@ def make_transfer(request):
         from_account=from_account,
         to_account=to_account,
     )
-    new_transfer.save()
+    try:
+        new_transfer.save()
+    except InsufficientFunds:
+        return JsonResponse({'error': 'Insufficient funds'}, status=400)
+    except LimitExceeded as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
     return JsonResponse({'success': 'Transfer successful', 'from_account_balance': from_account.balance}, status=201)
 
+BATCH_OPERATION_TYPES = {
+    'deposit': OperationsType.DEPOSIT,
+    'withdrawal': OperationsType.WITHDRAWAL,
+    'transfer': OperationsType.TRANSFER,
+}
+BATCH_ACCOUNT_KEYS = ('from_account', 'to_account')
+
+def batch_account_number(value) -> str | None:
+    # Account numbers may come as JSON strings or numbers; None for a missing or malformed one.
+    if isinstance(value, (str, int)) and not isinstance(value, bool):
+        return str(value)
+    return None
+
+@csrf_exempt
+def post_batch(request):
+    if request.method != 'POST':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    data = json.loads(request.body.decode('utf-8'))
+    items = data.get('operations')
+    atomic = data.get('atomic', True)
+
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        return JsonResponse({'error': 'Invalid request data'}, status=400)
+
+    account_numbers = {batch_account_number(item.get(key)) for item in items for key in BATCH_ACCOUNT_KEYS} - {None}
+    accounts = Account.objects.in_bulk(list(account_numbers), field_name='account_number')
+    balances = {account.pk: account.balance for account in accounts.values()}
+    usage = daily_usage(accounts.values(), timezone.localdate())
+    limits = resolve_limits(accounts.values())
+
+    results = []
+    operations = []
+    for index, item in enumerate(items):
+        operation_type = BATCH_OPERATION_TYPES.get(item.get('type'))
+        amount = item.get('amount')
+        from_account = accounts.get(batch_account_number(item.get('from_account')))
+        to_account = accounts.get(batch_account_number(item.get('to_account')))
+        malformed = any(item.get(key) is not None and batch_account_number(item[key]) is None for key in BATCH_ACCOUNT_KEYS)
+
+        if operation_type is None or malformed:
+            error = 'Invalid request data'
+        else:
+            error = validate_operation(operation_type, amount, from_account, to_account)
+
+        if error is None:
+            amount = to_amount(amount)
+            owner = usage_owner(operation_type, from_account, to_account)
+            used_count, used_amount = usage.get((owner.pk, operation_type), (0, Decimal('0')))
+            if operation_type != OperationsType.DEPOSIT and amount > balances[from_account.pk]:
+                error = 'Insufficient funds'
+            else:
+                error = limit_error(limits[(owner.pk, operation_type)], operation_type, amount, used_count, used_amount)
+
+        if error:
+            results.append({'index': index, 'status': 'rejected', 'error': error})
+            continue
+
+        if operation_type == OperationsType.DEPOSIT:
+            from_account = None
+        else:
+            balances[from_account.pk] -= amount
+        usage[(owner.pk, operation_type)] = (used_count + 1, used_amount + amount)
+        if operation_type == OperationsType.WITHDRAWAL:
+            to_account = None
+        else:
+            balances[to_account.pk] += amount
+
+        operations.append(Operation(type=operation_type, amount=amount, from_account=from_account, to_account=to_account))
+        results.append({'index': index, 'status': 'posted'})
+
+    rejected = len(items) - len(operations)
+    if atomic and rejected:
+        return JsonResponse({'error': 'Batch rejected', 'rejected': rejected, 'results': results}, status=400)
+
+    try:
+        post_operations(operations)
+    except (InsufficientFunds, LimitExceeded):
+        return JsonResponse({'error': 'Balances or limits changed while posting, retry the batch'}, status=409)
+
+    return JsonResponse({
+        'success': 'Batch posted successfully',
+        'posted': len(operations),
+        'rejected': rejected,
+        'results': results,
+    }, status=201)
+
+@replica_reads
+@account_conditional
 def get_statement(request, account_number):
     account = Account.objects.filter(account_number=account_number).first()
 
@@ -125,42 +235,70 @@ def get_statement(request, account_number):
     if not account.is_active:
         return JsonResponse({'error': 'Account is inactive'}, status=400)
 
-    statement_data = []
-
-    operations_filtered = Operation.objects.filter(Q(from_account=account) | Q(to_account=account))
-
-    date_list = operations_filtered.annotate(date_only=TruncDate('timestamp')).values_list('date_only', flat=True).distinct().order_by('date_only')
-
-    for date in date_list:
-        date_formatted = date.strftime('%d/%m/%Y')
-        daily_operations = operations_filtered.filter(timestamp__date=date)
-        daily_data = {
-            'date': date_formatted,
-            'operations': []
-        }
-
-        for operation in daily_operations:
-            operation_data = {
-                'time': operation.timestamp.strftime('%H:%M:%S'),
-                'type': operation.get_type_display(),
-                'way': operation.get_way_display(),
-                'amount': f'R${float(operation.amount):.2f}',
-                'balance': f'R${float(account.balance):.2f}',
-            }
-            if operation.from_account != account and operation.from_account is not None:
-                operation_data['from_account'] = operation.from_account.account_number
-            if operation.to_account != account and operation.to_account is not None:
-                operation_data['to_account'] = operation.to_account.account_number
-
-            daily_data['operations'].append(operation_data)
-        statement_data.append(daily_data)
-
-    return JsonResponse({'success': 'Statement retrieved successfully', 'statement': statement_data}, status=200)
+    try:
+        operations, limit = statement_query(account, request.GET, PAGE_SIZE, MAX_PAGE_SIZE)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': 'Statement retrieved successfully',
+        **statement_page(account, operations, limit),
+    }, status=200)
+
+def export_operations(request):
+    export_format = request.GET.get('format', 'ndjson')
+
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f'Format must be one of {", ".join(EXPORT_FORMATS)}'}, status=400)
+
+    try:
+        operations = export_queryset(
+            account_number=request.GET.get('account'),
+            agency_number=request.GET.get('agency'),
+            operation_type=parse_operation_type(request.GET['type']) if 'type' in request.GET else None,
+            start=day_start(date.fromisoformat(request.GET['from'])) if 'from' in request.GET else None,
+            end=day_end(date.fromisoformat(request.GET['to'])) if 'to' in request.GET else None,
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid query parameters'}, status=400)
+
+    render, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(render(export_rows(operations)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="operations.{export_format}"'
+    return response
+
+@replica_reads
+def get_analytics(request):
+    try:
+        end = date.fromisoformat(request.GET['to']) if 'to' in request.GET else timezone.localdate()
+        start = date.fromisoformat(request.GET['from']) if 'from' in request.GET else end - timedelta(days=ANALYTICS_DAYS - 1)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid query parameters'}, status=400)
+
+    if start > end or (end - start).days >= MAX_ANALYTICS_DAYS:
+        return JsonResponse({'error': f'The date range must have between 1 and {MAX_ANALYTICS_DAYS} days'}, status=400)
+
+    rows = list(analytics_rows(start, end, request.GET.get('account'), request.GET.get('agency')))
+    # Amounts are always two-decimal strings, even without rows; counts are integers.
+    totals = {field: sum(row[field] for row in rows) if field.endswith('_count')
+              else to_amount(sum((row[field] for row in rows), Decimal('0'))) for field in ROLLUP_FIELDS}
+
+    return JsonResponse({
+        'success': 'Analytics retrieved successfully',
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'data': rows,
+        'totals': totals,
+    }, status=200)
 
 '''
     ACCOUNTS
 '''
+@replica_reads
 def get_accounts(request, client_cpf=None):
+    client_cpf = client_cpf or request.GET.get('cpf')
+    accounts_filtered = Account.objects.all()
+
     if client_cpf:
         if not is_cpf_valid(client_cpf):
             return JsonResponse({'error': 'Invalid CPF'}, status=400)
@@ -170,32 +308,92 @@ def get_accounts(request, client_cpf=None):
         if not client:
             return JsonResponse({'error': 'Client not found'}, status=404)
 
-        accounts_filtered = Account.objects.filter(client=client)
-    else:
-        accounts_filtered = Account.objects.all()
+        accounts_filtered = accounts_filtered.filter(client=client)
+
+    try:
+        if 'agency' in request.GET:
+            accounts_filtered = accounts_filtered.filter(agency_number=request.GET['agency'])
+        if 'active' in request.GET:
+            accounts_filtered = accounts_filtered.filter(is_active=request.GET['active'].lower() in ('true', '1'))
+        if 'min_balance' in request.GET:
+            accounts_filtered = accounts_filtered.filter(balance__gte=Decimal(request.GET['min_balance']))
+        if 'max_balance' in request.GET:
+            accounts_filtered = accounts_filtered.filter(balance__lte=Decimal(request.GET['max_balance']))
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except (ValueError, ArithmeticError):
+        return JsonResponse({'error': 'Invalid query parameters'}, status=400)
+
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        return JsonResponse({'error': f'Limit must be between 1 and {MAX_PAGE_SIZE}'}, status=400)
+
+    page = accounts_filtered.order_by('pk')
+
+    if 'cursor' in request.GET:
+        key = decode_cursor(request.GET['cursor'])
+        try:
+            page = page.filter(pk__gt=int(key[0]))
+        except (TypeError, ValueError, IndexError):
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    rows = list(page.values_list('pk', 'agency_number', 'account_number')[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
 
     data = {
-        'accounts': [account.__str__() for account in accounts_filtered],
-        'count': accounts_filtered.count(),
+        'accounts': [f"{agency_number} - {account_number}" for _, agency_number, account_number in rows[:limit]],
+        'next_cursor': next_cursor,
     }
 
+    # Counting every matching account is a second full scan; only pay for it when asked.
+    if request.GET.get('count', '').lower() in ('true', '1'):
+        data['count'] = accounts_filtered.count()
+
     return JsonResponse({'success': 'Accounts retrieved successfully', 'data': data})
 
+@replica_reads
+@account_conditional
 def get_account_details(request, account_number):
+    account = get_account_info(account_number)
+
+    if account is None:
+        return JsonResponse({'error': 'Account not found'}, status=404)
+
+    # Only the metadata comes from the cache; the balance is always read from the database.
+    balance = Account.objects.filter(pk=account['pk']).values_list('balance', flat=True).first()
+
+    if balance is None:
+        return JsonResponse({'error': 'Account not found'}, status=404)
+
+    data = {
+        'agency_number': account['agency_number'],
+        'account_number': account['account_number'],
+        'balance': float(balance),
+        'client_cpf': account['client_cpf'],
+        'client_name': account['client_name'],
+    }
+
+    return JsonResponse({'success': 'Account details retrieved successfully', 'data': data})
+
+def get_balance_at(request, account_number):
     account = Account.objects.filter(account_number=account_number).first()
 
     if account is None:
         return JsonResponse({'error': 'Account not found'}, status=404)
 
+    try:
+        moment = datetime.fromisoformat(request.GET['at']) if 'at' in request.GET else timezone.now()
+    except ValueError:
+        return JsonResponse({'error': 'Invalid query parameters'}, status=400)
+
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+
     data = {
-        'agency_number': account.agency_number,
         'account_number': account.account_number,
-        'balance': float(account.balance),
-        'client_cpf': account.client.cpf,
-        'client_name': account.client.name,
+        'at': moment.isoformat(),
+        'balance': float(balance_at(account, moment)),
     }
 
-    return JsonResponse({'success': 'Account details retrieved successfully', 'data': data})
+    return JsonResponse({'success': 'Balance retrieved successfully', 'data': data})
 
 @csrf_exempt
 def create_account(request):
@@ -217,7 +415,7 @@ def create_account(request):
     if not client:
         return JsonResponse({'error': 'Client not found'}, status=404)
 
-    if account_number in [account.account_number for account in Account.objects.all()]:
+    if Account.objects.filter(account_number=account_number).exists():
         return JsonResponse({'error': 'Account with this number already exists'}, status=400)
 
     new_account = Account(
@@ -235,7 +433,8 @@ def inactivate_account(request, account_number):
         return JsonResponse({'error': 'Account not found'}, status=404)
 
     account.is_active = False
-    account.save()
+    # Only the flag: saving every field would write back a balance read before a concurrent posting.
+    account.save(update_fields=['is_active'])
 
     return JsonResponse({'success': 'Account deactivated successfully'}, status=200)
 
@@ -246,7 +445,8 @@ def activate_account(request, account_number):
         return JsonResponse({'error': 'Account not found'}, status=404)
 
     account.is_active = True
-    account.save()
+    # Only the flag: saving every field would write back a balance read before a concurrent posting.
+    account.save(update_fields=['is_active'])
 
     return JsonResponse({'success': 'Account activated successfully'}, status=200)
 
@@ -254,19 +454,20 @@ def activate_account(request, account_number):
 '''
     CLIENTS
 '''
+@replica_reads
 def get_client(request, client_cpf):
     if not is_cpf_valid(client_cpf):
         return JsonResponse({'error': 'Invalid CPF'}, status=400)
 
-    client = Client.objects.filter(cpf=client_cpf).first()
+    client = get_client_info(client_cpf)
 
     if not client:
         return JsonResponse({'error': 'Client not found'}, status=404)
 
     data = {
-        'name': client.name,
-        'cpf': client.formatted_cpf(),
-        'accounts': [account.__str__() for account in Account.objects.filter(client=client)],
+        'name': client['name'],
+        'cpf': Client(cpf=client['cpf']).formatted_cpf(),
+        'accounts': client['accounts'],
     }
 
     return JsonResponse({'success': 'Client details retrieved successfully', 'data': data})
@@ -292,11 +493,8 @@ def create_client(request):
     if not is_cpf_valid(cpf):
         return JsonResponse({'error': 'Invalid CPF'}, status=400)
 
-    clients = Client.objects.all()
-
-    if clients.count() > 0:
-        if cpf in [client.cpf for client in clients]:
-            return JsonResponse({'error': 'Client with this CPF already exists'}, status=400)
+    if Client.objects.filter(cpf=cpf).exists():
+        return JsonResponse({'error': 'Client with this CPF already exists'}, status=400)
 
     new_client = Client(
         name=name,
@@ -310,4 +508,30 @@ def create_client(request):
     )
     new_client.save()
 
-    return JsonResponse({'success': 'Client created successfully', 'client_cpf': new_client.cpf}, status=201)
\ No newline at end of file
+    return JsonResponse({'success': 'Client created successfully', 'client_cpf': new_client.cpf}, status=201)
+
+def get_cache_stats(request):
+    return JsonResponse({'success': 'Cache statistics retrieved successfully', 'data': lookup_cache.stats()})
+
+def get_metrics(request):
+    record_replica_lag()
+    record_outbox_lag()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+'''
+    ONBOARDING
+'''
+@csrf_exempt
+def import_records(request, kind):
+    if request.method != 'POST':
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+
+    import_format = request.GET.get('format') or ('csv' if request.content_type == 'text/csv' else 'ndjson')
+
+    if import_format not in IMPORT_FORMATS:
+        return JsonResponse({'error': f'Format must be one of {", ".join(IMPORT_FORMATS)}'}, status=400)
+
+    # Read the body as a stream, line by line, instead of loading it whole through request.body.
+    report = IMPORTERS[kind](read_rows(codecs.iterdecode(request, 'utf-8'), import_format))
+
+    return JsonResponse({'success': 'Import finished', **report}, status=200)
\ No newline at end of file
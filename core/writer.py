@@ -0,0 +1,183 @@
+import queue
+import threading
+from concurrent.futures import Future
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+class Posting:
+    """
+    A queued balance-changing write and the lanes of the accounts it touches. A posting on more than one
+    lane (a transfer between accounts of different lanes, a batch) runs once all of its lanes reach it.
+    """
+
+    def __init__(self, func, args, kwargs, lanes: tuple[int, ...]):
+        self.future = Future()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.lanes = lanes
+        self.arrived = threading.Barrier(len(lanes))
+        self.done = threading.Event()
+
+    @property
+    def shared(self) -> bool:
+        return len(self.lanes) > 1
+
+
+class Lane:
+    """
+    A writer thread with its own queue. It takes up to batch_size queued postings at a time and runs them
+    in one transaction, each in its own savepoint, so a rejected posting does not undo the others and the
+    whole batch costs one commit. A shared posting ends the batch: the lane commits what it has, waits for
+    the other lanes of the posting, and the first of them runs it while the others wait.
+    """
+
+    def __init__(self, index: int, batch_size: int):
+        self.index = index
+        self.batch_size = batch_size
+        self.batches = 0
+        self.operations = 0
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name=f'posting-lane-{index}', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        pending = None
+        while True:
+            posting, pending = pending or self.queue.get(), None
+            if posting.shared:
+                self._run_shared(posting)
+                continue
+
+            batch = [posting]
+            while len(batch) < self.batch_size:
+                try:
+                    posting = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if posting.shared:
+                    pending = posting
+                    break
+                batch.append(posting)
+            self._commit(batch)
+
+    def _run_shared(self, posting: Posting):
+        posting.arrived.wait()
+        if self.index == posting.lanes[0]:
+            self._commit([posting])
+            posting.done.set()
+        else:
+            posting.done.wait()
+
+    def _commit(self, batch: list[Posting]):
+        results = []
+        try:
+            with transaction.atomic():
+                for posting in batch:
+                    try:
+                        with transaction.atomic():
+                            results.append((posting.future, posting.func(*posting.args, **posting.kwargs), None))
+                    except Exception as e:
+                        results.append((posting.future, None, e))
+        except Exception as e:
+            # The commit itself failed: nothing in the batch was written.
+            connection.close()
+            for posting in batch:
+                posting.future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+class PostingScheduler:
+    """
+    Lanes of writer threads; the postings of an account always go to the same lane (its primary key modulo
+    the number of lanes), so they run in the order they were submitted, while postings of accounts on other
+    lanes run in parallel.
+    """
+
+    def __init__(self, lanes: int = 1, batch_size: int = 64):
+        self.lanes = [Lane(index, batch_size) for index in range(lanes)]
+        # Shared postings are put on all their lanes under this lock, so every lane sees them in the same
+        # order and lanes waiting for each other can never wait in a cycle.
+        self._shared_lock = threading.Lock()
+
+    @property
+    def batches(self) -> int:
+        return sum(lane.batches for lane in self.lanes)
+
+    @property
+    def operations(self) -> int:
+        return sum(lane.operations for lane in self.lanes)
+
+    def lane_of(self, account_id: int) -> int:
+        return account_id % len(self.lanes)
+
+    def submit(self, account_ids, func, *args, **kwargs) -> Future:
+        lanes = tuple(sorted({self.lane_of(account_id) for account_id in account_ids})) or (0,)
+        posting = Posting(func, args, kwargs, lanes)
+        if posting.shared:
+            with self._shared_lock:
+                for lane in lanes:
+                    self.lanes[lane].queue.put(posting)
+        else:
+            self.lanes[lanes[0]].queue.put(posting)
+        return posting.future
+
+    def is_lane_thread(self) -> bool:
+        return any(threading.current_thread() is lane.thread for lane in self.lanes)
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_writer() -> PostingScheduler | None:
+    """
+    The posting scheduler of this process for the POSTING_WRITER settings, started on first use, or None if
+    POSTING_WRITER is not enabled.
+    """
+    config = getattr(settings, 'POSTING_WRITER', {})
+    if not config.get('ENABLED'):
+        return None
+    key = (config.get('LANES', 1), config.get('BATCH_SIZE', 64))
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = PostingScheduler(*key)
+    return _schedulers[key]
+
+
+def run_in_writer(account_ids, func, *args, **kwargs):
+    """
+    Run a balance-changing write on the lanes of the accounts it touches and return its result, or raise
+    its exception.
+
+    The function runs inline when the scheduler is disabled, when called from a lane, and when the caller
+    is already inside a transaction: its locks would block the lanes while it waits.
+    """
+    writer = get_writer()
+    if writer is None or writer.is_lane_thread() or connection.in_atomic_block:
+        return func(*args, **kwargs)
+    return writer.submit(account_ids, func, *args, **kwargs).result()
+
+
+def in_writer(account_ids):
+    """
+    Decorator for functions that change balances: every call goes through run_in_writer, on the lanes of
+    account_ids(*args, **kwargs).
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return run_in_writer(account_ids(*args, **kwargs), func, *args, **kwargs)
+        return wrapper
+    return decorator